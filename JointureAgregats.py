@@ -0,0 +1,131 @@
+import os
+import pickle
+import numpy as np
+import pandas as pd
+
+from JointureMetriques import instrumenter
+from JointureWatermark import ETAT_DIR
+
+# Agrégats conservés entre deux exécutions (tables par jour et la dernière ligne de kdata prise en compte)
+AGREGATS_FILE = os.path.join(ETAT_DIR, "agregats.pkl")
+
+# Onglets de synthèse : plage destination -> clé de regroupement (en plus du jour)
+AGREGATS = {
+    "Jour_Kiosque!A:L": "deviceID",
+    "Jour_Carte!A:L": "card_UID",
+}
+
+# Mesures cumulées pour chaque (jour, clé)
+MESURES = ["Montant", "Volume", "dureeDis"]
+
+def colonne_date(kdata_df):
+    for col in ("date", "Date"):
+        if col in kdata_df.columns:
+            return col
+    return None
+
+def agreger_par_jour(kdata_df, cle):
+    """Agrège des lignes de kdata par (jour, `cle`) : nombre, somme, minimum et maximum de chaque mesure.
+
+    Retourne un DataFrame indexé par (Jour, cle), ou None si les colonnes nécessaires manquent.
+    """
+    date = colonne_date(kdata_df)
+    if date is None or cle not in kdata_df.columns:
+        return None
+    mesures = [col for col in MESURES if col in kdata_df.columns]
+    donnees = pd.DataFrame({
+        "Jour": pd.to_datetime(kdata_df[date], errors='coerce').dt.normalize(),
+        cle: kdata_df[cle].astype(str).str.strip(),
+    })
+    for col in mesures:
+        donnees[col] = pd.to_numeric(kdata_df[col], errors='coerce').astype("float64")
+    donnees = donnees[donnees["Jour"].notna() & (donnees[cle] != "") & kdata_df[cle].notna().to_numpy()]
+
+    groupes = donnees.groupby(["Jour", cle], sort=False)
+    partiel = pd.DataFrame({"Nombre": groupes.size()})
+    for col in mesures:
+        partiel[f"{col} total"] = groupes[col].sum(min_count=0)
+        partiel[f"{col} min"] = groupes[col].min()
+        partiel[f"{col} max"] = groupes[col].max()
+    return partiel
+
+def fusionner_agregats(etat, partiel):
+    """Ajoute les agrégats `partiel` (nouvelles lignes) à `etat` sans recalculer les groupes non touchés.
+
+    Seuls les (jour, clé) présents dans `partiel` sont recombinés : les totaux et
+    nombres s'additionnent, les minimums et maximums se comparent.
+    """
+    if etat is None or etat.empty:
+        return partiel.sort_index()
+    colonnes = etat.columns.union(partiel.columns, sort=False)
+    etat = etat.reindex(columns=colonnes)
+    partiel = partiel.reindex(columns=colonnes)
+
+    anciens = etat.reindex(partiel.index)
+    combines = pd.DataFrame(index=partiel.index)
+    for col in colonnes:
+        if col == "Nombre" or col.endswith(" total"):
+            combines[col] = anciens[col].fillna(0) + partiel[col].fillna(0)
+        elif col.endswith(" min"):
+            combines[col] = np.fmin(anciens[col], partiel[col])
+        else:
+            combines[col] = np.fmax(anciens[col], partiel[col])
+    combines["Nombre"] = combines["Nombre"].astype("int64")
+
+    nouveaux = ~partiel.index.isin(etat.index)
+    etat.loc[partiel.index[~nouveaux], colonnes] = combines[~nouveaux]
+    return pd.concat([etat, combines[nouveaux]]).sort_index()
+
+def charger_agregats(chemin=AGREGATS_FILE):
+    if not os.path.exists(chemin):
+        return {"derniere_ligne": 1, "tables": {}}
+    with open(chemin, "rb") as f:
+        return pickle.load(f)
+
+def sauver_agregats(etat, chemin=AGREGATS_FILE):
+    os.makedirs(os.path.dirname(chemin) or ".", exist_ok=True)
+    with open(chemin + ".tmp", "wb") as f:
+        pickle.dump(etat, f)
+    os.replace(chemin + ".tmp", chemin)
+
+def agregats_a_jour(derniere_ligne, chemin=AGREGATS_FILE):
+    """Indique si l'état enregistré des agrégats couvre kdata jusqu'à `derniere_ligne`.
+
+    Un état absent ou en retard (supprimé, ou exécution interrompue avant sa
+    sauvegarde) ne contient pas tout l'historique : l'ajout des seules nouvelles
+    lignes publierait des totaux partiels.
+    """
+    return os.path.exists(chemin) and charger_agregats(chemin)["derniere_ligne"] >= derniere_ligne
+
+def table_agregats(agregats):
+    """Mise en forme d'un onglet de synthèse : une ligne par (jour, clé), jours croissants.
+
+    Les nouveaux jours s'ajoutent en fin de feuille, ce qui limite l'écriture
+    différentielle aux derniers blocs.
+    """
+    table = agregats.reset_index()
+    table["Jour"] = table["Jour"].dt.strftime("%Y-%m-%d")
+    return table
+
+@instrumenter()
+def mettre_a_jour_agregats(kdata_df, derniere_ligne, reinitialiser=False):
+    """Met à jour les agrégats journaliers avec les lignes de kdata jusqu'à `derniere_ligne` (1-indexée, en-tête compris).
+
+    `kdata_df` ne contient que les lignes pas encore agrégées (ou tout kdata avec
+    `reinitialiser`). Si l'état enregistré couvre déjà `derniere_ligne` (exécution
+    interrompue puis relancée), les lignes ne sont pas comptées deux fois.
+    Retourne {plage destination: DataFrame} pour les onglets de synthèse.
+    """
+    etat = {"derniere_ligne": 1, "tables": {}} if reinitialiser else charger_agregats()
+    if derniere_ligne > etat["derniere_ligne"]:
+        for range_name, cle in AGREGATS.items():
+            partiel = agreger_par_jour(kdata_df, cle)
+            if partiel is None:
+                print(f"Agrégats '{range_name}' ignorés : colonne de date ou '{cle}' absente de kdata.")
+                continue
+            etat["tables"][range_name] = fusionner_agregats(etat["tables"].get(range_name), partiel)
+        etat["derniere_ligne"] = derniere_ligne
+        sauver_agregats(etat)
+    else:
+        print(f"Agrégats déjà à jour jusqu'à la ligne {etat['derniere_ligne']} de kdata.")
+    return {range_name: table_agregats(agregats) for range_name, agregats in etat["tables"].items()}
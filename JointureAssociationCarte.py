@@ -1,19 +1,19 @@
 import pandas as pd
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from google.oauth2.service_account import Credentials
+
+from JointureClient import get_sheets_service
+from JointureMetriques import instrumenter, instrumenter_execution
+from JointureScheduler import lire_plage
+from JointureSchema import typer_plage
+from JointureWriter import write_sheet_diff
 
 # Authentification Google Sheets
 def authenticate_google_sheets():
     """
-    Authentifie le script avec l'API Google Sheets en utilisant un fichier de clé de service.
+    Retourne le service Google Sheets partagé (identifiants chargés une seule fois,
+    voir JointureClient).
     """
-    creds = Credentials.from_service_account_file(
-        'chemin/vers/votre/clé/service.json', 
-        scopes=["https://www.googleapis.com/auth/spreadsheets"]
-    )
-    service = build('sheets', 'v4', credentials=creds)
-    return service
+    return get_sheets_service()
 
 # Extraction de l'ID du classeur depuis une URL
 def extract_sheet_id(spreadsheet_url):
@@ -23,13 +23,12 @@ def extract_sheet_id(spreadsheet_url):
     return spreadsheet_url.split("/d/")[1].split("/")[0]
 
 # Lecture des données d'une feuille Google Sheets
+@instrumenter("read_sheet")
 def read_sheet(service, spreadsheet_id, range_name):
     """
     Lit les données d'une feuille Google Sheets et les retourne sous forme de DataFrame.
     """
-    sheet = service.spreadsheets()
-    result = sheet.values().get(spreadsheetId=spreadsheet_id, range=range_name).execute()
-    values = result.get('values', [])
+    values = lire_plage(service, spreadsheet_id, range_name)
     
     if not values:
         return pd.DataFrame()  # Retourne un DataFrame vide si aucune donnée n'est trouvée
@@ -37,24 +36,15 @@ def read_sheet(service, spreadsheet_id, range_name):
     # La première ligne contient les en-têtes
     headers = values[0]
     data = values[1:]
-    return pd.DataFrame(data, columns=headers)
+    return typer_plage(pd.DataFrame(data, columns=headers), range_name)
 
 # Écriture des données dans une feuille Google Sheets
 def write_sheet(service, spreadsheet_id, range_name, dataframe):
     """
     Écrit les données d'un DataFrame dans une feuille Google Sheets.
+    Seuls les blocs de lignes modifiés depuis la dernière écriture sont envoyés.
     """
-    sheet = service.spreadsheets()
-    data = [dataframe.columns.tolist()] + dataframe.values.tolist()
-    body = {
-        'values': data
-    }
-    sheet.values().update(
-        spreadsheetId=spreadsheet_id,
-        range=range_name,
-        valueInputOption="RAW",
-        body=body
-    ).execute()
+    write_sheet_diff(service, spreadsheet_id, range_name, dataframe)
 
 # Copier les données de liste_cartes vers Cartes
 def copy_liste_cartes_to_cartes(service, spreadsheet_id_source, spreadsheet_id_destination):
@@ -74,6 +64,7 @@ def copy_liste_cartes_to_cartes(service, spreadsheet_id_source, spreadsheet_id_d
     print("Les données de 'liste_cartes' ont été copiées avec succès dans 'Cartes'.")
 
 # Fonction principale
+@instrumenter_execution("cartes")
 def main():
     try:
         # Authentification et création du service
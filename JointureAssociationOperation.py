@@ -1,28 +1,17 @@
-import os
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 import pandas as pd
 
-# Scopes nécessaires
-SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
+from JointureClient import charger_credentials, get_sheets_service
+from JointureMetriques import instrumenter, instrumenter_execution
+from JointureMoteur import construire_table
+from JointureScheduler import lire_plage
+from JointureSchema import typer_plage
+from JointureWriter import write_sheet_diff
 
 def authenticate_google_sheets(token_file="token.json", credentials_file="credentials.json"):
-    """Authentifie et retourne un service Google Sheets."""
-    creds = None
-    if os.path.exists(token_file):
-        creds = Credentials.from_authorized_user_file(token_file, SCOPES)
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file(credentials_file, SCOPES)
-            creds = flow.run_local_server(port=3000)
-        with open(token_file, "w") as token:
-            token.write(creds.to_json())
-    return build("sheets", "v4", credentials=creds)
+    """Authentifie et retourne le service Google Sheets partagé."""
+    charger_credentials(token_file, credentials_file)
+    return get_sheets_service()
 
 def extract_sheet_id(url):
     """Extrait l'ID du classeur depuis son URL."""
@@ -31,56 +20,30 @@ def extract_sheet_id(url):
     except IndexError:
         raise ValueError("URL invalide. Assurez-vous qu'il s'agit d'une URL Google Sheets valide.")
 
+@instrumenter("read_sheet")
 def read_sheet(service, spreadsheet_id, range_name):
     """Lit les données d'une feuille Google Sheets et retourne un DataFrame."""
-    result = service.spreadsheets().values().get(spreadsheetId=spreadsheet_id, range=range_name).execute()
-    values = result.get("values", [])
+    values = lire_plage(service, spreadsheet_id, range_name)
     if not values:
         print(f"Aucune donnée trouvée dans la plage : {range_name}")
         return pd.DataFrame()
-    return pd.DataFrame(values[1:], columns=values[0])
+    return typer_plage(pd.DataFrame(values[1:], columns=values[0]), range_name)
 
 def write_sheet(service, spreadsheet_id, range_name, data_frame):
-    """Écrit les données d'un DataFrame dans une feuille Google Sheets."""
-    body = {'values': [data_frame.columns.tolist()] + data_frame.values.tolist()}
-    service.spreadsheets().values().update(
-        spreadsheetId=spreadsheet_id,
-        range=range_name,
-        valueInputOption="RAW",
-        body=body
-    ).execute()
+    """Écrit les données d'un DataFrame dans une feuille Google Sheets (blocs modifiés uniquement)."""
+    write_sheet_diff(service, spreadsheet_id, range_name, data_frame)
     print(f"Données écrites dans la plage : {range_name}")
 
+@instrumenter()
 def create_operations_table(kdata_df, kiosque_df, cartes_df):
     """Crée la table 'Operations' en associant les données des trois tables."""
     if kdata_df.empty or kiosque_df.empty or cartes_df.empty:
         raise ValueError("Une ou plusieurs feuilles sont vides.")
-    
-    # Jointure avec 'liste kiosque' pour obtenir 'Localisation'
-    kdata_enriched = kdata_df.merge(kiosque_df[["deviceID", "Localisation"]], on="deviceID", how="left")
-
-    # Jointure avec 'liste cartes' pour obtenir 'Nom Utilisateur' et autres détails
-    operations = kdata_enriched.merge(
-        cartes_df[["card_UID", "Noms", "Adresse"]],
-        on="card_UID",
-        how="left"
-    )
-
-    # Réorganiser les colonnes dans l'ordre souhaité
-    operations = operations.rename(columns={
-        "Noms": "Nom Utilisateur",
-        "Localisation": "Localisation"
-    })
-    operations = operations[[
-        "date","deviceID", "Localisation", "Nom Utilisateur", 
-        "card_UID", "Montant", "dureeDis"
-    ]]
-
-    # Trier par date décroissante
-    operations = operations.sort_values(by="date", ascending=False)
-
-    return operations
+    # Recherches dans les index de 'liste kiosque' (Localisation) et de 'liste_cartes' (Nom Utilisateur,
+    # Adresse), puis tri par date décroissante : voir la définition 'operations' de JointureMoteur
+    return construire_table("operations", kdata_df, {"kiosque": kiosque_df, "cartes": cartes_df})
 
+@instrumenter_execution("operations")
 def main():
     try:
         # Authentification et création du service
@@ -1,17 +1,20 @@
+import os
+import pickle
+import numpy as np
 import pandas as pd
 from googleapiclient.errors import HttpError
-from googleapiclient.discovery import build
-from google.oauth2.service_account import Credentials
+
+from JointureClient import get_sheets_service
+from JointureMetriques import instrumenter, instrumenter_execution
+from JointureScheduler import lire_plage
+from JointureSchema import typer_plage
+from JointureWatermark import ETAT_DIR
+from JointureWriter import write_sheet_diff
 
 #### Mbola miandry kely fa manahirana
-# Fonction pour authentifier Google Sheets
+# Fonction pour authentifier Google Sheets (service partagé, voir JointureClient)
 def authenticate_google_sheets():
-    creds = Credentials.from_service_account_file(
-        'path/to/your/credentials.json',
-        scopes=["https://www.googleapis.com/auth/spreadsheets"]
-    )
-    service = build('sheets', 'v4', credentials=creds)
-    return service
+    return get_sheets_service()
 
 def extract_sheet_id(url):
     """Extrait l'ID du classeur depuis son URL."""
@@ -21,27 +24,35 @@ def extract_sheet_id(url):
         raise ValueError("URL invalide. Assurez-vous qu'il s'agit d'une URL Google Sheets valide.")
     
 # Fonction pour lire une feuille Google Sheets dans un DataFrame
+@instrumenter("read_sheet")
 def read_sheet(service, spreadsheet_id, range_name):
-    sheet = service.spreadsheets()
-    result = sheet.values().get(spreadsheetId=spreadsheet_id, range=range_name).execute()
-    values = result.get('values', [])
+    values = lire_plage(service, spreadsheet_id, range_name)
     if not values:
         return pd.DataFrame()  # Retourner un DataFrame vide si la feuille est vide
-    return pd.DataFrame(values[1:], columns=values[0])  # En-têtes de colonne dans la première ligne
+    return typer_plage(pd.DataFrame(values[1:], columns=values[0]), range_name)  # En-têtes de colonne dans la première ligne
 
 # Fonction pour écrire un DataFrame dans une feuille Google Sheets
+# (seuls les blocs de lignes modifiés depuis la dernière écriture sont envoyés)
 def write_sheet(service, spreadsheet_id, range_name, dataframe):
-    sheet = service.spreadsheets()
-    body = {
-        'values': [dataframe.columns.tolist()] + dataframe.values.tolist()
-    }
-    sheet.values().update(
-        spreadsheetId=spreadsheet_id,
-        range=range_name,
-        valueInputOption='RAW',
-        body=body
-    ).execute()
+    write_sheet_diff(service, spreadsheet_id, range_name, dataframe)
+
+# État courant des kiosques conservé entre deux exécutions (mode « état »)
+SYSTEME_ETAT_FILE = os.path.join(ETAT_DIR, "systeme_etat.pkl")
+
+# Colonnes du journal des changements d'état
+COLONNES_TRANSITIONS = ['Date', 'deviceID', 'Localisation', 'Composant', 'Ancien état', 'Nouvel état']
+
+# Composants surveillés par la télémétrie des kiosques
+COMPOSANTS = ['EtatSim800L', 'EtatRFID', 'EtatRTC', 'EtatLCD', 'EtatWire', 'EtatDebimetre']
 
+def _commentaire_motif(motif):
+    """Commentaire associé à un motif de bits (bit i = composant i à 'NON')."""
+    issues = [comp for i, comp in enumerate(COMPOSANTS) if motif & (1 << i)]
+    return ", ".join(issues) if issues else "Aucun problème détecté"
+
+COMMENTAIRES_PAR_MOTIF = np.array([_commentaire_motif(motif) for motif in range(1 << len(COMPOSANTS))], dtype=object)
+
+@instrumenter()
 def generate_systeme_table_from_kdata(kdata_df):
     """
     Génère le tableau 'Système' directement à partir des données de 'kdata'.
@@ -59,28 +70,118 @@ def generate_systeme_table_from_kdata(kdata_df):
     # Convertir les dates pour tri
     systeme_data['Date'] = pd.to_datetime(systeme_data['Date'], errors='coerce')
 
-    # Évaluer l'état global
-    def evaluate_status(row):
-        components = ['EtatSim800L', 'EtatRFID', 'EtatRTC', 'EtatLCD', 'EtatWire', 'EtatDebimetre']
-        if all(row[comp] == 'OK' for comp in components):
-            return 'Fonctionnel'
-        return 'Défaut'
-
-    systeme_data['État Global'] = systeme_data.apply(evaluate_status, axis=1)
-
-    # Ajouter des commentaires
-    def generate_comment(row):
-        components = ['EtatSim800L', 'EtatRFID', 'EtatRTC', 'EtatLCD', 'EtatWire', 'EtatDebimetre']
-        issues = [comp for comp in components if row[comp] == 'NON']
-        return ", ".join(issues) if issues else "Aucun problème détecté"
+    # Évaluer l'état global et les commentaires colonne par colonne (sans boucle Python par ligne)
+    systeme_data = evaluer_etats(systeme_data)
 
-    systeme_data['Commentaires'] = systeme_data.apply(generate_comment, axis=1)
+    # Trier par date (tri stable : à date égale, l'ordre de kdata est conservé)
+    systeme_data = systeme_data.sort_values(by='Date', ascending=False, kind='stable')
 
-    # Trier par date
-    systeme_data = systeme_data.sort_values(by='Date', ascending=False)
+    return systeme_data
 
+def evaluer_etats(systeme_data):
+    """Ajoute les colonnes 'État Global' et 'Commentaires' à partir des états des composants."""
+    etats = systeme_data[COMPOSANTS]
+    tous_ok = (etats == 'OK').to_numpy().all(axis=1)
+    systeme_data['État Global'] = np.where(tous_ok, 'Fonctionnel', 'Défaut').astype(object)
+
+    # Chaque combinaison de composants 'NON' correspond à un motif de bits (0 à 63),
+    # dont le commentaire est précalculé une fois pour toutes
+    masques_non = (etats == 'NON').to_numpy()
+    motifs = masques_non.astype(np.int64) @ (1 << np.arange(len(COMPOSANTS), dtype=np.int64))
+    systeme_data['Commentaires'] = COMMENTAIRES_PAR_MOTIF[motifs]
     return systeme_data
 
+def suivre_etats_systeme(kdata_df, etat_precedent=None):
+    """Calcule l'état courant de chaque kiosque et les changements d'état de ses composants.
+
+    Les lignes sont triées une seule fois par (deviceID, Date) ; chaque composant
+    est ensuite comparé à sa valeur précédente pour le même kiosque (décalage
+    d'une ligne). Les cellules autres que 'OK'/'NON' sont ignorées : elles ne
+    provoquent pas de changement et ne remplacent pas le dernier état connu.
+    `etat_precedent` (état courant d'une exécution précédente) sert de point de
+    départ, si bien que seules les nouvelles lignes de télémétrie sont nécessaires.
+    Retourne (etat_courant, transitions) : une ligne par deviceID avec le dernier
+    état connu de chaque composant, et une ligne par changement (Date croissante).
+    """
+    required_columns = ['deviceID', 'Date', 'Localisation'] + COMPOSANTS
+    for col in required_columns:
+        if col not in kdata_df.columns:
+            raise ValueError(f"La colonne {col} est manquante dans les données de 'kdata'.")
+
+    donnees = kdata_df[required_columns].copy()
+    donnees['Date'] = pd.to_datetime(donnees['Date'], errors='coerce')
+    donnees = donnees[donnees['Date'].notna() & donnees['deviceID'].notna()]
+    nouvelles = np.ones(len(donnees), dtype=bool)
+    if etat_precedent is not None and not etat_precedent.empty:
+        # Le dernier état connu précède les nouvelles lignes de même date (tri stable)
+        donnees = pd.concat([etat_precedent[required_columns].astype(object), donnees.astype(object)],
+                            ignore_index=True)
+        donnees['Date'] = pd.to_datetime(donnees['Date'])
+        nouvelles = np.r_[np.zeros(len(etat_precedent), dtype=bool), nouvelles]
+
+    # Un seul tri, sur des clés entières : code du kiosque puis date
+    codes, appareils_uniques = pd.factorize(donnees['deviceID'].astype(str))
+    ordre = np.lexsort((donnees['Date'].to_numpy().view(np.int64), codes))
+    codes = codes[ordre]
+    dates = donnees['Date'].to_numpy()[ordre]
+    localisations = donnees['Localisation'].to_numpy(dtype=object)[ordre]
+    appareils = np.asarray(appareils_uniques, dtype=object)
+    nouvelles = nouvelles[ordre]
+    derniers = np.flatnonzero(np.r_[codes[1:] != codes[:-1], True])
+
+    etat_courant = pd.DataFrame({'deviceID': appareils[codes[derniers]], 'Date': dates[derniers],
+                                 'Localisation': localisations[derniers]})
+    libelles = np.array(['', 'OK', 'NON'], dtype=object)
+    transitions = []
+    for comp in COMPOSANTS:
+        colonne = donnees[comp]
+        # 1 = 'OK', 2 = 'NON', 0 = autre valeur (ignorée)
+        valeurs = ((colonne == 'OK').to_numpy(dtype=np.int8) + 2 * (colonne == 'NON').to_numpy(dtype=np.int8))[ordre]
+        valides = np.flatnonzero(valeurs)
+        v, a = valeurs[valides], codes[valides]
+        meme_appareil = a[1:] == a[:-1]
+        # Changement : valeur différente de la précédente valeur valide du même kiosque
+        changements = np.flatnonzero(np.r_[False, (v[1:] != v[:-1]) & meme_appareil])
+        changements = changements[nouvelles[valides[changements]]]
+        positions = valides[changements]
+        transitions.append(pd.DataFrame({
+            'Date': dates[positions], 'deviceID': appareils[codes[positions]], 'Localisation': localisations[positions],
+            'Composant': comp, 'Ancien état': libelles[v[changements - 1]], 'Nouvel état': libelles[v[changements]],
+        }))
+        # Dernière valeur valide de chaque kiosque ('' s'il n'en a aucune)
+        dernieres_valeurs = np.zeros(len(appareils), dtype=np.int8)
+        fins = np.r_[~meme_appareil, True] if len(a) else np.zeros(0, dtype=bool)
+        dernieres_valeurs[a[fins]] = v[fins]
+        etat_courant[comp] = libelles[dernieres_valeurs[codes[derniers]]]
+
+    etat_courant = evaluer_etats(etat_courant).sort_values(by='Date', ascending=False, kind='stable')
+    transitions = pd.concat(transitions, ignore_index=True).sort_values(by='Date', kind='stable')
+    return etat_courant.reset_index(drop=True), transitions.reset_index(drop=True)
+
+@instrumenter()
+def mettre_a_jour_systeme(kdata_df, derniere_ligne, reinitialiser=False, chemin=SYSTEME_ETAT_FILE):
+    """Met à jour l'état courant des kiosques avec les lignes de kdata jusqu'à `derniere_ligne`.
+
+    L'état courant est conservé entre deux exécutions : seules les nouvelles lignes
+    sont triées et comparées. Une relance sur des lignes déjà prises en compte ne
+    produit aucune transition. Retourne (etat_courant, nouvelles transitions).
+    """
+    etat = None
+    if not reinitialiser and os.path.exists(chemin):
+        with open(chemin, "rb") as f:
+            etat = pickle.load(f)
+    if etat is not None and derniere_ligne <= etat["derniere_ligne"]:
+        print(f"État des kiosques déjà à jour jusqu'à la ligne {etat['derniere_ligne']} de kdata.")
+        return etat["etat_courant"], pd.DataFrame(columns=COLONNES_TRANSITIONS)
+
+    etat_courant, transitions = suivre_etats_systeme(kdata_df, None if etat is None else etat["etat_courant"])
+    os.makedirs(os.path.dirname(chemin) or ".", exist_ok=True)
+    with open(chemin + ".tmp", "wb") as f:
+        pickle.dump({"derniere_ligne": derniere_ligne, "etat_courant": etat_courant}, f)
+    os.replace(chemin + ".tmp", chemin)
+    return etat_courant, transitions
+
+@instrumenter_execution("systeme")
 def main():
     try:
         # Authentification et création du service
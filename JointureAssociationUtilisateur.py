@@ -1,62 +1,45 @@
 import pandas as pd
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from google.oauth2.service_account import Credentials
 
-# Authentification Google Sheets
+from JointureClient import get_sheets_service
+from JointureMetriques import instrumenter, instrumenter_execution
+from JointureMoteur import construire_table
+from JointureScheduler import lire_plage
+from JointureSchema import typer_plage
+from JointureWriter import write_sheet_diff
+
+# Authentification Google Sheets (service partagé, voir JointureClient)
 def authenticate_google_sheets():
-    creds = Credentials.from_service_account_file(
-        'chemin/vers/votre/clé/service.json', 
-        scopes=["https://www.googleapis.com/auth/spreadsheets"]
-    )
-    service = build('sheets', 'v4', credentials=creds)
-    return service
+    return get_sheets_service()
 
 # Extraction de l'ID du classeur depuis une URL
 def extract_sheet_id(spreadsheet_url):
     return spreadsheet_url.split("/d/")[1].split("/")[0]
 
 # Lecture des données d'une feuille Google Sheets
+@instrumenter("read_sheet")
 def read_sheet(service, spreadsheet_id, range_name):
-    sheet = service.spreadsheets()
-    result = sheet.values().get(spreadsheetId=spreadsheet_id, range=range_name).execute()
-    values = result.get('values', [])
+    values = lire_plage(service, spreadsheet_id, range_name)
     if not values:
         return pd.DataFrame()
     headers = values[0]
     data = values[1:]
-    return pd.DataFrame(data, columns=headers)
+    return typer_plage(pd.DataFrame(data, columns=headers), range_name)
 
 # Écriture des données dans une feuille Google Sheets
+# (seuls les blocs de lignes modifiés depuis la dernière écriture sont envoyés)
 def write_sheet(service, spreadsheet_id, range_name, dataframe):
-    sheet = service.spreadsheets()
-    data = [dataframe.columns.tolist()] + dataframe.values.tolist()
-    body = {'values': data}
-    sheet.values().update(
-        spreadsheetId=spreadsheet_id,
-        range=range_name,
-        valueInputOption="RAW",
-        body=body
-    ).execute()
+    write_sheet_diff(service, spreadsheet_id, range_name, dataframe)
 
 # Génération du tableau "Utilisateur"
+@instrumenter()
 def generate_utilisateur_table(kdata_df, liste_cartes_df, liste_kiosque_df):
-    # Joindre les données de kdata avec liste_cartes sur card_UID
-    utilisateur_data = kdata_df.merge(liste_cartes_df[['card_UID', 'noms']], on='card_UID', how='left')
-    
-    # Joindre les données avec liste_kiosque sur deviceID
-    utilisateur_data = utilisateur_data.merge(liste_kiosque_df[['deviceID', 'kiosque', 'adresse']], on='deviceID', how='left')
-    
-    # Sélectionner les colonnes nécessaires
-    utilisateur_data = utilisateur_data[['card_UID', 'date', 'noms', 'kiosque', 'deviceID', 'adresse', 'Montant', 'Volume']]
-    
-    # Trier par date
-    utilisateur_data['date'] = pd.to_datetime(utilisateur_data['date'], errors='coerce')
-    utilisateur_data = utilisateur_data.sort_values(by='date', ascending=False)
-    
-    return utilisateur_data
+    # Recherches dans les index de 'liste_cartes' (noms) et de 'liste kiosque' (kiosque, adresse),
+    # puis tri par date décroissante : voir la définition 'utilisateur' de JointureMoteur
+    return construire_table('utilisateur', kdata_df, {'cartes': liste_cartes_df, 'kiosque': liste_kiosque_df})
 
 # Fonction principale
+@instrumenter_execution("utilisateur")
 def main():
     try:
         # Authentification et création du service
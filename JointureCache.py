@@ -0,0 +1,140 @@
+import hashlib
+import os
+import time
+import pandas as pd
+from googleapiclient.errors import HttpError
+
+from JointureClient import get_drive_service
+from JointureWatermark import charger_etat, sauver_etat
+
+try:
+    import pyarrow  # noqa: F401  (moteur Parquet utilisé par pandas)
+    PARQUET_DISPONIBLE = True
+except ImportError:
+    PARQUET_DISPONIBLE = False
+
+# Dossier local des instantanés Parquet et de leur manifeste
+CACHE_DIR = ".jointure_cache"
+MANIFESTE_FILE = os.path.join(CACHE_DIR, "manifeste.json")
+
+# Taille maximale du cache sur disque avant éviction des instantanés les moins récemment utilisés
+TAILLE_MAX_OCTETS = 500 * 1024 * 1024
+
+def authenticate_drive():
+    """Retourne le service Drive partagé (mêmes identifiants que le service Sheets)."""
+    return get_drive_service()
+
+def get_revision(drive_service, spreadsheet_id):
+    """Retourne un identifiant de révision du classeur (version Drive et date de modification).
+
+    Un seul appel de métadonnées, bien moins coûteux que la lecture des valeurs.
+    Sans numéro de version, la date de modification seule sert d'identifiant ;
+    sans l'une ni l'autre, retourne None (révision inconnue).
+    """
+    if drive_service is None:
+        return None
+    try:
+        fichier = drive_service.files().get(fileId=spreadsheet_id, fields="version,modifiedTime").execute()
+    except HttpError as err:
+        print(f"Révision du classeur indisponible, le cache sera revalidé : {err}")
+        return None
+    version, modification = fichier.get("version"), fichier.get("modifiedTime")
+    if version is None:
+        return modification
+    return f"{version}@{modification}"
+
+def cle_cache(spreadsheet_id, range_name):
+    """Clé stable d'un instantané, utilisée comme nom de fichier."""
+    return hashlib.sha1(f"{spreadsheet_id}|{range_name}".encode("utf-8")).hexdigest()
+
+def charger_manifeste():
+    return charger_etat(MANIFESTE_FILE, defaut={})
+
+def lire_instantane(spreadsheet_id, range_name, revision=None, manifeste=None):
+    """Charge l'instantané local d'une plage.
+
+    Si `revision` est fournie, l'instantané n'est retourné que s'il correspond à
+    cette révision du classeur. Retourne None en cas d'absence ou de révision périmée.
+    """
+    if not PARQUET_DISPONIBLE:
+        return None
+    manifeste = charger_manifeste() if manifeste is None else manifeste
+    entree = manifeste.get(cle_cache(spreadsheet_id, range_name))
+    if entree is None or not os.path.exists(entree["fichier"]):
+        return None
+    if revision is not None and entree["revision"] != revision:
+        return None
+    entree["dernier_acces"] = time.time()
+    return pd.read_parquet(entree["fichier"])
+
+def ecrire_instantane(spreadsheet_id, range_name, data_frame, revision, manifeste=None):
+    """Enregistre une plage lue sous forme de fichier Parquet et met à jour le manifeste."""
+    if not PARQUET_DISPONIBLE:
+        return
+    manifeste = charger_manifeste() if manifeste is None else manifeste
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    cle = cle_cache(spreadsheet_id, range_name)
+    fichier = os.path.join(CACHE_DIR, f"{cle}.parquet")
+    temporaire = fichier + ".tmp"
+    data_frame.to_parquet(temporaire, index=False)
+    os.replace(temporaire, fichier)
+    manifeste[cle] = {
+        "spreadsheet_id": spreadsheet_id,
+        "range": range_name,
+        "revision": revision,
+        "fichier": fichier,
+        "taille": os.path.getsize(fichier),
+        "dernier_acces": time.time(),
+    }
+
+def evincer(manifeste, taille_max=TAILLE_MAX_OCTETS):
+    """Supprime les instantanés les moins récemment utilisés tant que le cache dépasse `taille_max`."""
+    total = sum(entree["taille"] for entree in manifeste.values())
+    for cle, entree in sorted(manifeste.items(), key=lambda item: item[1]["dernier_acces"]):
+        if total <= taille_max:
+            break
+        if os.path.exists(entree["fichier"]):
+            os.remove(entree["fichier"])
+        total -= entree["taille"]
+        del manifeste[cle]
+        print(f"Instantané évincé du cache : {entree['range']}")
+
+def read_sheets_cached(lecteur, spreadsheet_id, ranges, drive_service=None, offline=False):
+    """Lit plusieurs plages en passant par le cache local d'instantanés.
+
+    `lecteur(ranges)` est appelé avec la liste des plages absentes ou périmées et
+    doit retourner un DataFrame par plage (par exemple via read_sheets_batch).
+    En mode `offline`, aucune requête n'est faite : le dernier instantané de
+    chaque plage est utilisé, quelle que soit sa révision.
+    """
+    manifeste = charger_manifeste()
+    revision = None if offline else get_revision(drive_service, spreadsheet_id)
+
+    frames = {}
+    for range_name in ranges:
+        if offline or revision is not None:
+            frame = lire_instantane(spreadsheet_id, range_name, None if offline else revision, manifeste)
+            if frame is not None:
+                frames[range_name] = frame
+        if offline and range_name not in frames:
+            print(f"Aucun instantané local pour la plage : {range_name}")
+            frames[range_name] = pd.DataFrame()
+
+    manquantes = [range_name for range_name in ranges if range_name not in frames]
+    if manquantes:
+        for range_name, frame in zip(manquantes, lecteur(manquantes)):
+            frames[range_name] = frame
+            ecrire_instantane(spreadsheet_id, range_name, frame, revision, manifeste)
+    elif not offline:
+        print("Classeur source inchangé : lecture depuis le cache local.")
+
+    evincer(manifeste)
+    sauver_etat(MANIFESTE_FILE, manifeste)
+    return [frames[range_name] for range_name in ranges]
+
+def read_sheet_cached(service, spreadsheet_id, range_name, read_sheet, drive_service=None, offline=False):
+    """Équivalent de `read_sheet(service, spreadsheet_id, range_name)` avec le cache local."""
+    return read_sheets_cached(
+        lambda ranges: [read_sheet(service, spreadsheet_id, r) for r in ranges],
+        spreadsheet_id, [range_name], drive_service=drive_service, offline=offline
+    )[0]
@@ -0,0 +1,97 @@
+import json
+import os
+from google.auth.transport.requests import Request
+from google.oauth2 import service_account
+from google.oauth2.credentials import Credentials
+from google_auth_oauthlib.flow import InstalledAppFlow
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build_from_document
+
+# Scopes nécessaires à toutes les étapes de jointure (lecture de la révision Drive comprise)
+SCOPES = ['https://www.googleapis.com/auth/spreadsheets',
+          'https://www.googleapis.com/auth/drive.metadata.readonly']
+
+TOKEN_FILE = "token.json"
+CREDENTIALS_FILE = "credentials.json"
+
+# Objets partagés par toutes les étapes du processus courant
+_credentials = None
+_documents = {}
+_services = {}
+_ressources = {}
+
+def charger_credentials(token_file=TOKEN_FILE, credentials_file=CREDENTIALS_FILE):
+    """Charge les identifiants une seule fois par processus.
+
+    Ordre de recherche : jeton OAuth existant (token.json), puis fichier
+    credentials.json, qui peut être une clé de compte de service ou un secret
+    client OAuth (dans ce cas, le consentement est demandé dans le navigateur).
+    Les clients construits avec ces identifiants les rafraîchissent d'eux-mêmes.
+    """
+    global _credentials
+    if _credentials is not None:
+        return _credentials
+
+    creds = None
+    if os.path.exists(token_file):
+        creds = Credentials.from_authorized_user_file(token_file)
+        if not creds.valid and creds.expired and creds.refresh_token:
+            creds.refresh(Request())
+            with open(token_file, "w") as token:
+                token.write(creds.to_json())
+    if creds is None or not creds.valid:
+        with open(credentials_file, "r", encoding="utf-8") as f:
+            infos = json.load(f)
+        if infos.get("type") == "service_account":
+            creds = service_account.Credentials.from_service_account_info(infos, scopes=SCOPES)
+        else:
+            flow = InstalledAppFlow.from_client_secrets_file(credentials_file, SCOPES)
+            creds = flow.run_local_server(port=3000)
+            with open(token_file, "w") as token:
+                token.write(creds.to_json())
+    _credentials = creds
+    return creds
+
+def document_decouverte(api, version):
+    """Document de découverte embarqué dans googleapiclient, analysé une seule fois."""
+    cle = (api, version)
+    if cle not in _documents:
+        contenu = discovery_cache.get_static_doc(api, version)
+        if contenu is None:
+            raise ValueError(f"Aucun document de découverte statique pour {api} {version}.")
+        _documents[cle] = json.loads(contenu)
+    return _documents[cle]
+
+def construire_service(api, version, credentials=None, http=None, api_endpoint=None):
+    """Construit un nouveau client depuis le document de découverte en cache (sans accès réseau).
+
+    Passer `http` (client HTTP déjà autorisé) ou `credentials`, pas les deux.
+    """
+    options = {"api_endpoint": api_endpoint} if api_endpoint else None
+    if http is None and credentials is None:
+        credentials = charger_credentials()
+    return build_from_document(document_decouverte(api, version), credentials=credentials, http=http,
+                               client_options=options)
+
+def get_service(api="sheets", version="v4"):
+    """Client partagé par toutes les étapes du processus courant (créé au premier appel)."""
+    cle = (api, version)
+    if cle not in _services:
+        _services[cle] = construire_service(api, version)
+    return _services[cle]
+
+def get_sheets_service():
+    return get_service("sheets", "v4")
+
+def get_drive_service():
+    return get_service("drive", "v3")
+
+def get_values_resource():
+    """Ressource spreadsheets().values() partagée.
+
+    Chaque appel à .values() régénère toutes les méthodes de la ressource
+    (plusieurs centaines de ms au premier appel) : elle n'est construite qu'une fois.
+    """
+    if "values" not in _ressources:
+        _ressources["values"] = get_sheets_service().spreadsheets().values()
+    return _ressources["values"]
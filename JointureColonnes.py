@@ -0,0 +1,76 @@
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from JointureSchema import SCHEMAS, nom_feuille, typer_colonne
+
+# Orientation demandée à values().get / batchGet : une liste de valeurs par colonne
+# au lieu d'une liste par ligne. Une plage de kdata de 10 colonnes arrive ainsi en
+# 10 listes, quel que soit son nombre de lignes.
+DIMENSION_COLONNES = "COLUMNS"
+
+def entetes_colonnes(colonnes):
+    """En-têtes d'une plage lue par colonnes : première cellule de chaque colonne.
+
+    Comme pour une lecture par lignes, les en-têtes vides de fin de ligne sont omis.
+    """
+    entetes = [colonne[0] if colonne else "" for colonne in colonnes]
+    while entetes and entetes[-1] == "":
+        entetes.pop()
+    return entetes
+
+def nombre_lignes(colonnes):
+    """Nombre de lignes d'une plage lue par colonnes : la longueur de sa colonne la plus longue."""
+    return max(map(len, colonnes), default=0)
+
+def colonnes_vers_dataframe(colonnes, range_name, entetes=None):
+    """Construit un DataFrame typé à partir des valeurs d'une plage lue par colonnes (DIMENSION_COLONNES).
+
+    Sans `entetes`, la première cellule de chaque colonne est son en-tête. Google
+    Sheets omet les cellules vides de fin de colonne et les colonnes vides de fin
+    de plage : chaque colonne est complétée avec '' jusqu'au nombre de lignes de la
+    plage, convertie selon le schéma de la feuille (voir typer_plage) puis libérée
+    avant de passer à la suivante. Aucune liste de lignes n'est construite. Les
+    listes de `colonnes` sont modifiées sur place et `colonnes` est vidée.
+    Le résultat est identique à typer_plage(values_to_dataframe(lignes), range_name).
+    """
+    if entetes is None:
+        if not colonnes:
+            return pd.DataFrame()
+        entetes = entetes_colonnes(colonnes)
+        for colonne in colonnes:
+            del colonne[:1]
+    hauteur = nombre_lignes(colonnes)
+    if not hauteur:
+        colonnes.clear()
+        return pd.DataFrame([], columns=entetes)
+
+    schema = SCHEMAS.get(nom_feuille(range_name))
+    series = {}
+    for j, col in enumerate(entetes):
+        valeurs = colonnes[j] if j < len(colonnes) else []
+        valeurs.extend([""] * (hauteur - len(valeurs)))
+        serie = pd.Series(valeurs)
+        series[j] = typer_colonne(serie, col, schema, nom_feuille(range_name)) if schema else serie
+        if j < len(colonnes):
+            colonnes[j] = None
+    colonnes.clear()
+    data_frame = pd.DataFrame(series, index=pd.RangeIndex(hauteur))
+    data_frame.columns = entetes
+    return data_frame
+
+def concatener_frames(frames):
+    """Assemble des DataFrames typés lus séparément (ex. lots successifs de kdata) comme s'ils avaient été lus d'un coup.
+
+    pd.concat convertit en objets une colonne catégorielle dont les catégories
+    diffèrent d'un DataFrame à l'autre : elle reste ici catégorielle, avec l'union
+    triée des catégories (celles qu'aurait données une lecture unique).
+    """
+    frames = [frame for frame in frames if not frame.empty] or frames[:1]
+    if len(frames) == 1:
+        return frames[0]
+    data_frame = pd.concat(frames, ignore_index=True)
+    for j, col in enumerate(frames[0].columns):
+        morceaux = [frame.iloc[:, j] for frame in frames]
+        if all(isinstance(morceau.dtype, pd.CategoricalDtype) for morceau in morceaux):
+            data_frame.isetitem(j, pd.Series(union_categoricals(morceaux, sort_categories=True), index=data_frame.index))
+    return data_frame
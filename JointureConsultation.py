@@ -0,0 +1,407 @@
+import argparse
+import json
+import os
+import pickle
+import signal
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+import numpy as np
+import pandas as pd
+
+from JointureWatermark import ETAT_DIR
+
+# Instantané lu par l'API de consultation : table 'Utilisateur' répartie en segments (un
+# fichier par lot de transactions publié) et dernier état de chaque kiosque, décrits par un
+# manifeste remplacé d'un bloc à la fin de chaque exécution du pipeline
+CONSULTATION_DIR = os.path.join(ETAT_DIR, "consultation")
+MANIFESTE = "manifeste.pkl"
+
+# Petits segments en fin de liste (exécutions incrémentales) : fusionnés en un seul
+# lorsqu'ils atteignent ce nombre. Un segment d'au moins LIGNES_SEGMENT transactions
+# n'est jamais réécrit.
+SEGMENTS_MAX = 16
+LIGNES_SEGMENT = 50_000
+
+# Adresse d'écoute par défaut (locale uniquement : l'API n'a pas d'authentification)
+HOTE_DEFAUT = "127.0.0.1"
+PORT_DEFAUT = 8765
+
+# Délai entre deux vérifications de l'instantané par le serveur
+INTERVALLE_DEFAUT = 5  # secondes
+
+_CONFIGURATION = {"actif": False, "dossier": CONSULTATION_DIR}
+
+def configurer_consultation(actif=True, dossier=CONSULTATION_DIR):
+    """Active la publication de l'instantané de consultation à la fin de chaque exécution."""
+    _CONFIGURATION.update(actif=bool(actif), dossier=dossier)
+
+def consultation_active():
+    return _CONFIGURATION["actif"]
+
+def dernier_etat(systeme_df):
+    """Dernière ligne (par 'Date') de chaque kiosque d'une table 'Système', complète ou en mode « état ».
+
+    À date égale, la ligne la plus basse de la table l'emporte. Les lignes sans
+    deviceID sont ignorées.
+    """
+    if systeme_df is None or systeme_df.empty:
+        return pd.DataFrame()
+    systeme_df = systeme_df[systeme_df['deviceID'].notna()].reset_index(drop=True)
+    codes, _ = pd.factorize(systeme_df['deviceID'])
+    dates = pd.to_datetime(systeme_df['Date'], errors='coerce').to_numpy(dtype="datetime64[ns]").view(np.int64)
+    ordre = np.lexsort((dates, codes))
+    derniers = ordre[np.r_[codes[ordre][1:] != codes[ordre][:-1], True]] if len(ordre) else ordre
+    return systeme_df.iloc[np.sort(derniers)].reset_index(drop=True)
+
+def _ecrire_pickle(chemin, objet):
+    with open(chemin + ".tmp", "wb") as f:
+        pickle.dump(objet, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(chemin + ".tmp", chemin)
+
+def charger_manifeste(dossier=None):
+    """Manifeste du dernier instantané publié ({'segments': [(fichier, lignes)], 'kiosques', 'derniere_ligne', 'publie'}), ou None."""
+    chemin = os.path.join(dossier or _CONFIGURATION["dossier"], MANIFESTE)
+    if not os.path.exists(chemin):
+        return None
+    with open(chemin, "rb") as f:
+        return pickle.load(f)
+
+def charger_instantane(dossier=None):
+    """Dernier instantané publié ({'utilisateur', 'kiosques', 'derniere_ligne', 'publie'}), ou None.
+
+    La table 'Utilisateur' est réassemblée à partir des segments du manifeste.
+    """
+    dossier = dossier or _CONFIGURATION["dossier"]
+    manifeste = charger_manifeste(dossier)
+    if manifeste is None:
+        return None
+    morceaux = [pd.read_pickle(os.path.join(dossier, nom)) for nom, _ in manifeste["segments"]]
+    return {"utilisateur": pd.concat(morceaux, ignore_index=True) if morceaux else pd.DataFrame(),
+            "kiosques": manifeste["kiosques"], "derniere_ligne": manifeste["derniere_ligne"],
+            "publie": manifeste["publie"]}
+
+def ecrire_segment(utilisateur_df, dossier=None):
+    """Enregistre un lot de transactions 'Utilisateur' dans un nouveau segment. Retourne (fichier, lignes).
+
+    Le segment n'est visible de l'API qu'une fois référencé par le manifeste (voir _publier).
+    """
+    dossier = dossier or _CONFIGURATION["dossier"]
+    os.makedirs(dossier, exist_ok=True)
+    nom = f"utilisateur_{uuid.uuid4().hex}.pkl"
+    _ecrire_pickle(os.path.join(dossier, nom), utilisateur_df.reset_index(drop=True))
+    return nom, len(utilisateur_df)
+
+def _compacter(segments, dossier):
+    """Fusionne les petits segments de fin de liste (moins de LIGNES_SEGMENT lignes) s'ils sont au moins SEGMENTS_MAX."""
+    petits = 0
+    for _, lignes in reversed(segments):
+        if lignes >= LIGNES_SEGMENT:
+            break
+        petits += 1
+    if petits < SEGMENTS_MAX:
+        return segments
+    fusion = pd.concat([pd.read_pickle(os.path.join(dossier, nom)) for nom, _ in segments[-petits:]],
+                       ignore_index=True)
+    return segments[:-petits] + [ecrire_segment(fusion, dossier)]
+
+def _publier(dossier, segments, kiosques, derniere_ligne):
+    """Remplace le manifeste (fichier temporaire puis renommage), puis supprime les segments qu'il ne référence plus.
+
+    Un lecteur qui a chargé l'ancien manifeste peut trouver un segment déjà supprimé :
+    le serveur garde alors son index et retente au cycle suivant (voir ServeurConsultation.recharger).
+    """
+    os.makedirs(dossier, exist_ok=True)
+    segments = _compacter(segments, dossier)
+    _ecrire_pickle(os.path.join(dossier, MANIFESTE),
+                   {"segments": segments, "kiosques": kiosques, "derniere_ligne": derniere_ligne,
+                    "publie": time.strftime("%Y-%m-%d %H:%M:%S")})
+    references = {nom for nom, _ in segments}
+    for nom in os.listdir(dossier):
+        if nom.startswith("utilisateur_") and nom.endswith(".pkl") and nom not in references:
+            os.remove(os.path.join(dossier, nom))
+    print(f"Instantané de consultation publié : {sum(lignes for _, lignes in segments)} transaction(s) "
+          f"en {len(segments)} segment(s), {len(kiosques)} kiosque(s).")
+
+def publier_consultation(utilisateur_df, systeme_df, derniere_ligne, ajout=False):
+    """Publie l'instantané de consultation.
+
+    `utilisateur_df` et `systeme_df` sont les tables 'Utilisateur' et 'Système'
+    de l'exécution (None si elles n'ont pas été construites : les précédentes sont
+    conservées). Avec `ajout`, ce sont les tables des seules nouvelles lignes de
+    kdata : les transactions forment un nouveau segment, les segments existants ne
+    sont pas réécrits, et une relance sur des lignes déjà publiées est ignorée.
+    L'instantané précédent doit alors exister, comme pour ne remplacer qu'une des
+    deux tables. Sans effet si la publication n'est pas activée (voir configurer_consultation).
+    """
+    if not _CONFIGURATION["actif"]:
+        return
+    dossier = _CONFIGURATION["dossier"]
+    precedent = charger_manifeste(dossier)
+    if precedent is None and (ajout or utilisateur_df is None or systeme_df is None):
+        print("Instantané de consultation absent : il sera créé à la prochaine reconstruction complète.")
+        return
+    if ajout and derniere_ligne <= precedent["derniere_ligne"]:
+        print(f"Instantané de consultation déjà à jour jusqu'à la ligne {precedent['derniere_ligne']} de kdata.")
+        return
+    precedent = precedent or {"segments": [], "kiosques": pd.DataFrame()}
+
+    segments = precedent["segments"]
+    if utilisateur_df is not None:
+        nouveaux = [ecrire_segment(utilisateur_df, dossier)] if not utilisateur_df.empty else []
+        segments = segments + nouveaux if ajout else nouveaux
+    kiosques = precedent["kiosques"]
+    if systeme_df is not None:
+        if ajout and not kiosques.empty:
+            systeme_df = pd.concat([kiosques, systeme_df], ignore_index=True)
+        kiosques = dernier_etat(systeme_df)
+    _publier(dossier, segments, kiosques, derniere_ligne)
+
+def commencer_consultation():
+    """Prépare un instantané construit lot par lot (mode streaming), ou None si la publication n'est pas activée.
+
+    Chaque lot est écrit dans un segment dès sa réception (voir ajouter_consultation) :
+    la table 'Utilisateur' complète n'est jamais en mémoire.
+    """
+    if not _CONFIGURATION["actif"]:
+        return None
+    return {"segments": None, "kiosques": None}
+
+def ajouter_consultation(publication, utilisateur_df, systeme_df=None):
+    """Ajoute un lot de kdata à un instantané en construction : ses transactions et l'état de ses kiosques."""
+    if publication is None:
+        return
+    if utilisateur_df is not None:
+        publication["segments"] = publication["segments"] or []
+        if not utilisateur_df.empty:
+            publication["segments"].append(ecrire_segment(utilisateur_df))
+    if systeme_df is not None:
+        if publication["kiosques"] is not None and not publication["kiosques"].empty:
+            systeme_df = pd.concat([publication["kiosques"], systeme_df], ignore_index=True)
+        publication["kiosques"] = dernier_etat(systeme_df)
+
+def terminer_consultation(publication, derniere_ligne, systeme_df=None):
+    """Publie un instantané construit lot par lot. `systeme_df` (table 'Système' finale) remplace l'état accumulé.
+
+    Une table jamais reçue (aucun lot) garde sa version précédente, comme avec publier_consultation.
+    """
+    if publication is None:
+        return
+    dossier = _CONFIGURATION["dossier"]
+    precedent = charger_manifeste(dossier) or {"segments": [], "kiosques": pd.DataFrame()}
+    segments = precedent["segments"] if publication["segments"] is None else publication["segments"]
+    kiosques = precedent["kiosques"] if publication["kiosques"] is None else publication["kiosques"]
+    if systeme_df is not None:
+        kiosques = dernier_etat(systeme_df)
+    _publier(dossier, segments, kiosques, derniere_ligne)
+
+def _colonne_compacte(serie):
+    """Colonne stockée pour les réponses : dates en datetime64, nombres en float64, textes en codes + libellés."""
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return "date", serie.to_numpy(dtype="datetime64[ns]")
+    if pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+        return "nombre", serie.to_numpy(dtype="float64", na_value=np.nan)
+    codes, libelles = pd.factorize(serie)
+    return "texte", (codes.astype(np.int32), [str(libelle) for libelle in libelles])
+
+def _valeurs(genre, donnees, debut, fin):
+    """Valeurs JSON des lignes [debut, fin) d'une colonne compacte (None pour une cellule vide)."""
+    if genre == "date":
+        textes = np.datetime_as_string(donnees[debut:fin], unit="s").tolist()
+        return [None if texte == "NaT" else texte.replace("T", " ") for texte in textes]
+    if genre == "nombre":
+        return [None if valeur != valeur else valeur for valeur in donnees[debut:fin].tolist()]
+    codes, libelles = donnees
+    return [libelles[code] if code >= 0 else None for code in codes[debut:fin].tolist()]
+
+def _enregistrements(colonnes, debut, fin):
+    """Lignes [debut, fin) des `colonnes` compactes ({nom: (genre, données)}) en dictionnaires."""
+    noms = list(colonnes)
+    valeurs = [_valeurs(genre, donnees, debut, fin) for genre, donnees in colonnes.values()]
+    return [dict(zip(noms, ligne)) for ligne in zip(*valeurs)]
+
+class IndexConsultation:
+    """Index en mémoire d'un instantané de consultation.
+
+    Les transactions de 'Utilisateur' sont triées une fois par (card_UID, date) :
+    l'historique d'une carte est une tranche contiguë, repérée par un dictionnaire,
+    et une période s'y cherche par dichotomie sur les dates. Les colonnes sont
+    gardées sous forme compacte (tableaux numpy, libellés partagés) et ne sont
+    converties en JSON que pour les lignes demandées. L'état de chaque kiosque est
+    préparé à la construction.
+    """
+
+    def __init__(self, instantane):
+        self.derniere_ligne = instantane.get("derniere_ligne", 0)
+        self.publie = instantane.get("publie")
+        utilisateur = instantane["utilisateur"]
+        self.cartes = {}
+        self.dates = np.zeros(0, dtype=np.int64)
+        self.colonnes = {}
+        if not utilisateur.empty:
+            codes, uniques = pd.factorize(utilisateur['card_UID'])
+            dates = pd.to_datetime(utilisateur['date'], errors='coerce').to_numpy(dtype="datetime64[ns]").view(np.int64)
+            ordre = np.lexsort((dates, codes))
+            ordre = ordre[codes[ordre] >= 0]
+            bornes = np.searchsorted(codes[ordre], np.arange(len(uniques) + 1))
+            self.cartes = {str(uid): (int(bornes[i]), int(bornes[i + 1])) for i, uid in enumerate(uniques)}
+            self.dates = dates[ordre]
+            for col in utilisateur.columns:
+                genre, donnees = _colonne_compacte(utilisateur[col])
+                self.colonnes[col] = (genre, donnees[ordre] if genre != "texte" else (donnees[0][ordre], donnees[1]))
+        kiosques = instantane["kiosques"]
+        self.kiosques = {}
+        if not kiosques.empty:
+            compactes = {col: _colonne_compacte(kiosques[col]) for col in kiosques.columns}
+            for ligne in _enregistrements(compactes, 0, len(kiosques)):
+                self.kiosques[ligne['deviceID']] = ligne
+        self.transactions = len(self.dates)
+
+    def historique(self, card_uid, debut=None, fin=None):
+        """Transactions d'une carte entre `debut` et `fin` inclus (Timestamp ou None), les plus récentes en tête.
+
+        Retourne None si la carte est inconnue.
+        """
+        if card_uid not in self.cartes:
+            return None
+        premiere, derniere = self.cartes[card_uid]
+        dates = self.dates[premiere:derniere]
+        if debut is not None:
+            premiere += int(np.searchsorted(dates, debut.value, side="left"))
+        if fin is not None:
+            derniere -= len(dates) - int(np.searchsorted(dates, fin.value, side="right"))
+        lignes = _enregistrements(self.colonnes, premiere, max(premiere, derniere))
+        lignes.reverse()
+        return lignes
+
+    def etat_kiosque(self, device_id):
+        """Dernier état connu d'un kiosque, ou None s'il est inconnu."""
+        return self.kiosques.get(device_id)
+
+def lire_borne(texte, fin=False):
+    """Date d'un paramètre de requête ('2026-10-01' ou '2026-10-01 12:30:00'). Une date seule en `fin` couvre toute la journée."""
+    if texte is None:
+        return None
+    borne = pd.Timestamp(texte)
+    if fin and len(texte.strip()) <= 10:
+        borne += pd.Timedelta(days=1) - pd.Timedelta(1, unit="ns")
+    return borne
+
+class GestionnaireConsultation(BaseHTTPRequestHandler):
+    """Routes de l'API (GET, réponses JSON) :
+      - /cartes/{card_UID}?debut=AAAA-MM-JJ&fin=AAAA-MM-JJ : historique d'une carte
+      - /kiosques/{deviceID} : dernier état d'un kiosque
+      - /etat : instantané servi (dernière ligne de kdata, date de publication, tailles)
+    """
+
+    def do_GET(self):
+        # Une seule lecture de l'index par requête : un rechargement concurrent ne la coupe pas en deux
+        index = self.server.index
+        adresse = urlparse(self.path)
+        morceaux = [unquote(morceau) for morceau in adresse.path.strip("/").split("/")]
+        parametres = {cle: valeurs[-1] for cle, valeurs in parse_qs(adresse.query).items()}
+        if morceaux == ["etat"]:
+            if index is None:
+                return self.repondre(200, {"charge": False})
+            return self.repondre(200, {"charge": True, "derniere_ligne": index.derniere_ligne, "publie": index.publie,
+                                       "transactions": index.transactions, "cartes": len(index.cartes),
+                                       "kiosques": len(index.kiosques)})
+        if index is None:
+            return self.repondre(503, {"erreur": "Aucun instantané de consultation publié."})
+        if len(morceaux) == 2 and morceaux[0] == "cartes":
+            try:
+                debut, fin = lire_borne(parametres.get("debut")), lire_borne(parametres.get("fin"), fin=True)
+            except ValueError as e:
+                return self.repondre(400, {"erreur": f"Date invalide : {e}"})
+            transactions = index.historique(morceaux[1], debut, fin)
+            if transactions is None:
+                return self.repondre(404, {"erreur": f"Carte inconnue : {morceaux[1]}"})
+            return self.repondre(200, {"card_UID": morceaux[1], "nombre": len(transactions), "transactions": transactions})
+        if len(morceaux) == 2 and morceaux[0] == "kiosques":
+            etat = index.etat_kiosque(morceaux[1])
+            if etat is None:
+                return self.repondre(404, {"erreur": f"Kiosque inconnu : {morceaux[1]}"})
+            return self.repondre(200, etat)
+        return self.repondre(404, {"erreur": f"Chemin inconnu : {adresse.path}"})
+
+    def repondre(self, statut, contenu):
+        corps = json.dumps(contenu, ensure_ascii=False).encode("utf-8")
+        self.send_response(statut)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(corps)))
+        self.end_headers()
+        self.wfile.write(corps)
+
+    def log_message(self, *args):
+        pass
+
+class ServeurConsultation(ThreadingHTTPServer):
+    """Serveur HTTP de l'API de consultation, rechargé quand un nouvel instantané est publié.
+
+    Le nouvel index est entièrement construit à côté de l'ancien, puis remplace
+    celui-ci en une seule affectation : chaque requête voit l'un ou l'autre, jamais
+    un mélange des deux.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, adresse, dossier=CONSULTATION_DIR):
+        super().__init__(adresse, GestionnaireConsultation)
+        self.dossier = dossier
+        self.index = None
+        self.version = None
+
+    def recharger(self):
+        """Reconstruit l'index si l'instantané a changé depuis le dernier chargement. Retourne True s'il a été remplacé."""
+        try:
+            statut = os.stat(os.path.join(self.dossier, MANIFESTE))
+        except FileNotFoundError:
+            return False
+        version = (statut.st_mtime_ns, statut.st_size)
+        if version == self.version:
+            return False
+        try:
+            index = IndexConsultation(charger_instantane(self.dossier))
+        except (OSError, EOFError, pickle.UnpicklingError, KeyError) as e:
+            print(f"Instantané de consultation illisible, l'index précédent est conservé : {e}")
+            return False
+        self.index, self.version = index, version
+        print(f"Index de consultation chargé : {index.transactions} transaction(s), {len(index.cartes)} carte(s), "
+              f"{len(index.kiosques)} kiosque(s) (kdata jusqu'à la ligne {index.derniere_ligne}).")
+        return True
+
+    def surveiller(self, intervalle=INTERVALLE_DEFAUT, arret=None):
+        """Vérifie l'instantané toutes les `intervalle` secondes jusqu'à ce que `arret` soit levé."""
+        arret = arret or threading.Event()
+        while not arret.wait(intervalle):
+            self.recharger()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="API HTTP locale : historique d'une carte et état d'un kiosque.")
+    parser.add_argument("--hote", default=HOTE_DEFAUT, help="Adresse d'écoute")
+    parser.add_argument("--port", type=int, default=PORT_DEFAUT, help="Port d'écoute")
+    parser.add_argument("--dossier", default=CONSULTATION_DIR,
+                        help="Dossier de l'instantané publié par le pipeline (option --consultation)")
+    parser.add_argument("--intervalle", type=float, default=INTERVALLE_DEFAUT,
+                        help="Secondes entre deux vérifications de l'instantané")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    serveur = ServeurConsultation((args.hote, args.port), args.dossier)
+    if not serveur.recharger():
+        print(f"Aucun instantané dans {args.dossier} : lancez le pipeline avec --consultation.")
+    arret = threading.Event()
+    threading.Thread(target=serveur.surveiller, args=(args.intervalle, arret), daemon=True).start()
+    for signal_arret in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signal_arret, lambda *_: threading.Thread(target=serveur.shutdown).start())
+    print(f"API de consultation sur http://{args.hote}:{serveur.server_port}/ (Ctrl+C pour arrêter).")
+    serveur.serve_forever()
+    arret.set()
+    serveur.server_close()
+    print("Arrêt de l'API de consultation.")
+
+if __name__ == "__main__":
+    main()
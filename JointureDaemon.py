@@ -0,0 +1,188 @@
+import argparse
+import signal
+import threading
+import time
+from datetime import datetime
+from googleapiclient.errors import HttpError
+
+from JointureCache import authenticate_drive, get_revision
+from JointureClient import charger_credentials
+from JointureFetch import FabriqueClients
+from JointureMoteur import MOTEURS, configurer_moteur, moteur_actif
+from JointureParquet import ENTREPOT_DIR, SORTIES, configurer_puits
+from JointureParallele import configurer_parallele
+from JointureDoublons import configurer_dedoublonnage
+from JointureOnglets import configurer_onglets
+from JointureConsultation import configurer_consultation
+from JointureMetriques import METRIQUES_FILE, abandonner_execution, demarrer_execution, terminer_execution
+from JointureScheduler import configurer
+from JointureAssociationOperation import authenticate_google_sheets, extract_sheet_id
+from JointurePipeline import MODES_SYSTEME, lire_quotas, run_incremental
+
+# Délai entre deux vérifications de la révision du classeur source
+INTERVALLE_DEFAUT = 60  # secondes
+
+def lire_horaire(texte):
+    """Convertit 'HH:MM-HH:MM' en (début, fin) en minutes depuis minuit. La plage peut passer minuit."""
+    debut, _, fin = texte.partition('-')
+    minutes = []
+    for heure in (debut, fin):
+        h, _, m = heure.strip().partition(':')
+        minutes.append(int(h) * 60 + int(m or 0))
+    return tuple(minutes)
+
+def dans_horaire(horaire, maintenant=None):
+    """Indique si `maintenant` se trouve dans la plage horaire (None : toujours actif)."""
+    if horaire is None:
+        return True
+    maintenant = maintenant or datetime.now()
+    minute = maintenant.hour * 60 + maintenant.minute
+    debut, fin = horaire
+    if debut <= fin:
+        return debut <= minute < fin
+    return minute >= debut or minute < fin
+
+class Rafraichisseur:
+    """Processus résident qui garde clients et feuilles source en mémoire entre deux vérifications.
+
+    À chaque cycle, seule la révision Drive du classeur source est demandée. Si elle a
+    changé (ou si elle est inconnue), run_incremental ne lit que les en-têtes et les
+    nouvelles lignes de kdata avec les feuilles de dimension : les nouvelles lignes
+    sont insérées dans les tables, et une feuille de dimension modifiée ne fait
+    reconstruire que les tables qui en dépendent (voir DEPENDANCES), à partir de
+    kdata gardée en mémoire (`sources`) plutôt que relue. Les lignes de kdata
+    modifiées sur place ne sont prises en compte qu'à la reconstruction
+    périodique (voir executer).
+    """
+
+    def __init__(self, service, drive_service, spreadsheet_id_source, spreadsheet_id_destination,
+                 fabrique=None, mode_systeme="complet"):
+        self.service = service
+        self.drive_service = drive_service
+        self.source = spreadsheet_id_source
+        self.destination = spreadsheet_id_destination
+        self.fabrique = fabrique
+        self.mode_systeme = mode_systeme
+        self.revision = None
+        self.reconstruire = False
+        self.sources = {}  # kdata dédoublonnée et feuilles de dimension (voir memoriser_sources)
+
+    def invalider(self):
+        """Oublie la révision : le prochain cycle reconstruit toutes les tables."""
+        self.revision = None
+        self.reconstruire = True
+
+    def cycle(self):
+        """Un passage : vérifie la révision et met à jour les tables si le classeur a changé.
+
+        Retourne la liste des plages destination écrites (vide si rien n'a changé).
+        """
+        revision = get_revision(self.drive_service, self.source)
+        if revision is not None and revision == self.revision:
+            return []
+
+        sorties = run_incremental(self.service, self.source, self.destination, full_rebuild=self.reconstruire,
+                                  drive_service=self.drive_service, fabrique=self.fabrique,
+                                  mode_systeme=self.mode_systeme, memoire=self.sources)
+        # La révision n'est retenue qu'une fois les tables écrites :
+        # après une erreur, le cycle suivant retente la mise à jour
+        self.revision = revision
+        self.reconstruire = False
+        return list(sorties)
+
+    def executer(self, intervalle=INTERVALLE_DEFAUT, horaire=None, reconstruction=0, arret=None,
+                 metriques=METRIQUES_FILE):
+        """Boucle principale : un cycle toutes les `intervalle` secondes jusqu'à ce que `arret` soit levé.
+
+        Hors de la plage `horaire` (début, fin), aucun cycle n'est lancé. Avec
+        `reconstruction` > 0, toutes les tables sont reconstruites au moins toutes
+        les `reconstruction` secondes, même sans changement détecté.
+        """
+        arret = arret or threading.Event()
+        derniere_reconstruction = time.monotonic()
+        while not arret.is_set():
+            if dans_horaire(horaire):
+                if reconstruction and time.monotonic() - derniere_reconstruction >= reconstruction:
+                    print("Reconstruction périodique de toutes les tables.")
+                    self.invalider()
+                if self.reconstruire:
+                    derniere_reconstruction = time.monotonic()
+                demarrer_execution("daemon")
+                try:
+                    if self.cycle():
+                        terminer_execution(metriques=metriques)
+                    else:
+                        # Rien n'a changé : pas d'entrée de journal pour un simple appel de révision
+                        abandonner_execution()
+                except HttpError as err:
+                    print(f"Une erreur s'est produite : {err}")
+                    terminer_execution(False, metriques=metriques)
+                except Exception as e:
+                    print(f"Erreur inattendue : {e}")
+                    terminer_execution(False, metriques=metriques)
+            arret.wait(intervalle)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Garde les tables de jointure à jour en surveillant le classeur source.")
+    parser.add_argument("--source", default="https://docs.google.com/spreadsheets/d/1CX5ZU04Rb6vdVB91H5lrW2IebO3cWkkR8QCDaZST7w/edit",
+                        help="URL du classeur source")
+    parser.add_argument("--destination", default="", help="URL du classeur destination")
+    parser.add_argument("--intervalle", type=float, default=INTERVALLE_DEFAUT,
+                        help="Secondes entre deux vérifications de la révision du classeur source")
+    parser.add_argument("--horaire", default=None, metavar="HH:MM-HH:MM",
+                        help="Plage horaire de surveillance, ex. '06:00-22:00' (par défaut : en continu)")
+    parser.add_argument("--reconstruction", type=float, default=0, metavar="SECONDES",
+                        help="Reconstruit toutes les tables au moins toutes les N secondes (0 : jamais)")
+    parser.add_argument("--concurrent", type=int, default=0, metavar="N",
+                        help="Lit les plages source avec N lectures parallèles (un client HTTP par thread)")
+    parser.add_argument("--systeme", choices=MODES_SYSTEME, default="complet",
+                        help="Onglet 'Système' : tous les relevés (complet) ou dernier état par kiosque et transitions (etat)")
+    parser.add_argument("--quotas", default="", metavar="CLASSE=N,...",
+                        help="Requêtes par minute autorisées, ex. 'lecture_utilisateur=120,lecture_projet=600'")
+    parser.add_argument("--moteur", choices=MOTEURS, default=moteur_actif(),
+                        help="Moteur de calcul des jointures (par défaut : variable JOINTURE_MOTEUR, sinon pandas)")
+    parser.add_argument("--sortie", choices=SORTIES, default="sheets",
+                        help="Destination des tables dérivées de kdata : Sheets, entrepôt Parquet partitionné par jour, ou les deux")
+    parser.add_argument("--entrepot", default=ENTREPOT_DIR, metavar="DOSSIER",
+                        help="Dossier de l'entrepôt Parquet")
+    parser.add_argument("--fenetre-sheets", type=int, default=0, metavar="JOURS",
+                        help="Avec --sortie sheets+parquet, n'envoie à Sheets que les N derniers jours (0 : tout)")
+    parser.add_argument("--processus", type=int, default=1, metavar="N",
+                        help="Calcule les tables dérivées de kdata dans N processus, partitionnées par deviceID (0 : un par cœur)")
+    parser.add_argument("--garder-doublons", action="store_true",
+                        help="Conserve les transactions de kdata reçues plusieurs fois (même kiosque, carte, date et montant)")
+    parser.add_argument("--onglets-mensuels", action="store_true",
+                        help="Découpe les tables dérivées de kdata en un onglet par mois avec un onglet d'index")
+    parser.add_argument("--consultation", action="store_true",
+                        help="Publie après chaque cycle l'instantané servi par l'API locale (JointureConsultation.py)")
+    parser.add_argument("--metriques", default=METRIQUES_FILE,
+                        help="Fichier texte Prometheus des métriques du dernier cycle ('{nom}' : nom de l'exécution)")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    configurer(lire_quotas(args.quotas))
+    configurer_moteur(args.moteur)
+    configurer_puits(args.sortie, args.entrepot, args.fenetre_sheets)
+    configurer_onglets(args.onglets_mensuels)
+    configurer_dedoublonnage(not args.garder_doublons)
+    configurer_parallele(args.processus)
+    configurer_consultation(args.consultation)
+    horaire = lire_horaire(args.horaire) if args.horaire else None
+
+    # Clients créés une seule fois pour toute la durée de vie du processus
+    service = authenticate_google_sheets()
+    drive_service = authenticate_drive()
+    fabrique = FabriqueClients(charger_credentials(), max_workers=args.concurrent) if args.concurrent else None
+    rafraichisseur = Rafraichisseur(service, drive_service, extract_sheet_id(args.source),
+                                    extract_sheet_id(args.destination), fabrique=fabrique, mode_systeme=args.systeme)
+
+    arret = threading.Event()
+    for signal_arret in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signal_arret, lambda *_: arret.set())
+    print(f"Surveillance du classeur source toutes les {args.intervalle:g} s (Ctrl+C pour arrêter).")
+    rafraichisseur.executer(args.intervalle, horaire, args.reconstruction, arret, metriques=args.metriques)
+    print("Arrêt du processus de rafraîchissement.")
+
+if __name__ == "__main__":
+    main()
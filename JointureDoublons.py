@@ -0,0 +1,168 @@
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+from JointureMetriques import instrumenter
+from JointureWatermark import ETAT_DIR
+
+# Colonnes qui identifient une transaction de kdata. Un kiosque qui renvoie une
+# transaction après une coupure du réseau (SIM800L) renvoie ces mêmes valeurs.
+COLONNES_EMPREINTE = ["deviceID", "card_UID", "date", "Montant"]
+
+# Index persistant des empreintes déjà vues : un segment par exécution, trié par
+# empreinte et nommé d'après les lignes de kdata couvertes (ex. "0000000002_0000120001.npy")
+INDEX_DIR = os.path.join(ETAT_DIR, "empreintes_kdata")
+
+# Au-delà de ce nombre de segments, ils sont fusionnés en un seul
+SEGMENTS_MAX = 16
+
+# Clé (16 caractères) du second hachage, qui vérifie les correspondances du premier
+CLE_VERIFICATION = "jointure-verif01"
+
+_CONFIGURATION = {"actif": True}
+
+def configurer_dedoublonnage(actif=True):
+    """Active ou désactive le retrait des transactions de kdata reçues plusieurs fois."""
+    _CONFIGURATION["actif"] = bool(actif)
+
+def cles_transactions(data_frame):
+    """Colonnes COLONNES_EMPREINTE sous une forme indépendante du lot lu.
+
+    Le type déduit par typer_plage varie d'un lot à l'autre (montants entiers ou
+    décimaux selon la présence d'une cellule invalide, précision des dates) : les
+    montants sont ramenés en float64 et les dates en datetime64[ns]. Les identifiants
+    restent catégoriels (leur empreinte est celle de leur texte, calculée une fois par valeur).
+    """
+    return pd.DataFrame({
+        "deviceID": data_frame["deviceID"].astype("category").array,
+        "card_UID": data_frame["card_UID"].astype("category").array,
+        "date": pd.to_datetime(data_frame["date"], errors='coerce').to_numpy(dtype="datetime64[ns]"),
+        "Montant": pd.to_numeric(data_frame["Montant"], errors='coerce').to_numpy(dtype="float64"),
+    })
+
+def cles_completes(cles):
+    """Masque des lignes dont aucune composante de la clé (voir cles_transactions) n'est vide.
+
+    Une date ou un montant illisible, un identifiant vide : deux telles lignes ne
+    sont pas forcément la même transaction, elles ne sont donc jamais retirées.
+    """
+    completes = cles.notna().all(axis=1).to_numpy(copy=True)
+    for col in ("deviceID", "card_UID"):
+        categories = cles[col].cat.categories
+        vides = np.flatnonzero(categories.astype(str).str.strip() == "")
+        completes &= ~np.isin(cles[col].cat.codes.to_numpy(), vides)
+    return completes
+
+def empreintes(colonnes):
+    """Deux empreintes 64 bits indépendantes de chaque ligne de `colonnes` (voir cles_transactions).
+
+    La première sert à la recherche dans l'index, la seconde à vérifier chaque
+    correspondance : deux transactions différentes ne sont confondues que si les
+    128 bits coïncident.
+    """
+    principale = pd.util.hash_pandas_object(colonnes, index=False).to_numpy()
+    verification = pd.util.hash_pandas_object(colonnes[COLONNES_EMPREINTE[::-1]], index=False,
+                                              hash_key=CLE_VERIFICATION).to_numpy()
+    return principale, verification
+
+def _segments(dossier=INDEX_DIR):
+    """Segments de l'index : liste de (première ligne, dernière ligne, chemin), dans l'ordre de kdata."""
+    if not os.path.isdir(dossier):
+        return []
+    segments = []
+    for nom in os.listdir(dossier):
+        debut, _, fin = nom.removesuffix(".npy").partition('_')
+        if nom.endswith(".npy") and debut.isdigit() and fin.isdigit():
+            segments.append((int(debut), int(fin), os.path.join(dossier, nom)))
+    return sorted(segments)
+
+def _ecrire_segment(dossier, premiere_ligne, derniere_ligne, principale, verification):
+    """Enregistre un segment trié par empreinte principale (fichier temporaire puis renommage)."""
+    os.makedirs(dossier, exist_ok=True)
+    ordre = np.argsort(principale, kind="stable")
+    chemin = os.path.join(dossier, f"{premiere_ligne:010d}_{derniere_ligne:010d}.npy")
+    with open(chemin + ".tmp", "wb") as fichier:
+        np.save(fichier, np.stack([principale[ordre], verification[ordre]]))
+    os.replace(chemin + ".tmp", chemin)
+    return chemin
+
+def _deja_vues(segment, principale, verification):
+    """Masque des lignes dont les deux empreintes figurent dans `segment`.
+
+    `segment` a deux lignes contiguës : empreintes principales triées, puis empreintes
+    de vérification alignées. La recherche ne lit que les pages utiles du fichier projeté.
+    """
+    cles, verifications = segment[0], segment[1]
+    debuts = np.searchsorted(cles, principale, side="left")
+    fins = np.searchsorted(cles, principale, side="right")
+    vues = np.zeros(len(principale), dtype=bool)
+    uniques = np.flatnonzero(fins - debuts == 1)
+    vues[uniques] = verifications[debuts[uniques]] == verification[uniques]
+    # Empreinte principale partagée par plusieurs entrées (collision) : vérification une à une
+    for i in np.flatnonzero(fins - debuts > 1):
+        vues[i] = bool((verifications[debuts[i]:fins[i]] == verification[i]).any())
+    return vues
+
+def compacter(dossier=INDEX_DIR, segments_max=SEGMENTS_MAX):
+    """Fusionne les segments de l'index en un seul lorsqu'ils sont plus de `segments_max`."""
+    segments = _segments(dossier)
+    if len(segments) <= segments_max:
+        return
+    paires = np.concatenate([np.load(chemin) for _, _, chemin in segments], axis=1)
+    fusionne = _ecrire_segment(dossier, segments[0][0], segments[-1][1], paires[0], paires[1])
+    for _, _, chemin in segments:
+        if chemin != fusionne:
+            os.remove(chemin)
+
+@instrumenter("dedoublonner_kdata")
+def dedoublonner(kdata_df, premiere_ligne=2, reinitialiser=False, persister=True, dossier=INDEX_DIR):
+    """Retire de `kdata_df` les transactions déjà reçues, dans ce lot ou lors d'une exécution précédente.
+
+    `kdata_df` contient les lignes de kdata à partir de `premiere_ligne` (1-indexée,
+    en-tête compris). Les doublons du lot sont repérés sur les valeurs exactes de
+    COLONNES_EMPREINTE ; une ligne dont l'une de ces valeurs est vide ou illisible
+    n'est jamais retirée ni ajoutée à l'index (voir cles_completes). Les lignes déjà vues sont cherchées dans l'index persistant
+    (une recherche dichotomique par segment, chargé en mémoire projetée), si bien
+    que le coût dépend du nombre de nouvelles lignes et non de l'historique.
+    Les segments qui commencent à `premiere_ligne` ou après (exécution interrompue
+    puis relancée) sont oubliés avant la recherche, pour ne pas prendre une ligne
+    pour son propre doublon. Avec `reinitialiser`, l'index repart de zéro ; sans
+    `persister`, il n'est ni lu ni modifié. Retourne les lignes conservées.
+    """
+    if not _CONFIGURATION["actif"] or kdata_df.empty:
+        return kdata_df
+    manquantes = [col for col in COLONNES_EMPREINTE if col not in kdata_df.columns]
+    if manquantes:
+        print(f"Dédoublonnage de kdata ignoré : colonne(s) {', '.join(manquantes)} absente(s).")
+        return kdata_df
+
+    cles = cles_transactions(kdata_df)
+    completes = cles_completes(cles)
+    doublons = cles.duplicated(keep="first").to_numpy(copy=True) & completes
+    if persister:
+        if reinitialiser:
+            shutil.rmtree(dossier, ignore_errors=True)
+        for debut, _, chemin in _segments(dossier):
+            if debut >= premiere_ligne:
+                os.remove(chemin)
+        principale, verification = empreintes(cles)
+        for _, _, chemin in _segments(dossier):
+            restantes = np.flatnonzero(~doublons & completes)
+            doublons[restantes] |= _deja_vues(np.load(chemin, mmap_mode="r"), principale[restantes],
+                                              verification[restantes])
+        gardees = ~doublons & completes
+        _ecrire_segment(dossier, premiere_ligne, premiere_ligne + len(kdata_df) - 1,
+                        principale[gardees], verification[gardees])
+        compacter(dossier)
+
+    retirees = int(doublons.sum())
+    incompletes = len(kdata_df) - int(completes.sum())
+    if incompletes:
+        print(f"{incompletes} ligne(s) de kdata conservée(s) sans dédoublonnage : "
+              f"{', '.join(COLONNES_EMPREINTE)} incomplet(s).")
+    print(f"{retirees} doublon(s) retiré(s) de kdata sur {len(kdata_df)} ligne(s) "
+          f"(mêmes {', '.join(COLONNES_EMPREINTE)}).")
+    if not retirees:
+        return kdata_df
+    return kdata_df[~doublons].reset_index(drop=True)
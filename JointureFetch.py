@@ -0,0 +1,96 @@
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
+
+from JointureClient import construire_service
+from JointureScheduler import executer
+from JointureSchema import RENDU_VALEURS
+
+# Nombre maximal de lectures simultanées
+MAX_WORKERS = 4
+
+# Délai d'attente d'une requête HTTP (secondes)
+TIMEOUT = 120
+
+class FabriqueClients:
+    """Fournit à chaque thread son propre service Sheets.
+
+    Le transport httplib2 utilisé par `build("sheets", "v4")` n'est pas sûr entre
+    threads : chaque thread reçoit donc son propre client HTTP autorisé. Les
+    threads du pool sont conservés d'un appel à l'autre, si bien que chaque
+    client n'est créé qu'une fois et garde ses connexions ouvertes (keep-alive).
+    """
+
+    def __init__(self, credentials, api_endpoint=None, max_workers=MAX_WORKERS, timeout=TIMEOUT):
+        self.credentials = credentials
+        self.api_endpoint = api_endpoint
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._local = threading.local()
+        self._pool = None
+
+    def service(self):
+        """Service Sheets propre au thread courant."""
+        service = getattr(self._local, "service", None)
+        if service is None:
+            http = AuthorizedHttp(self.credentials, http=httplib2.Http(timeout=self.timeout))
+            service = construire_service("sheets", "v4", http=http, api_endpoint=self.api_endpoint)
+            self._local.service = service
+        return service
+
+    def valeurs(self):
+        """Ressource spreadsheets().values() du thread courant.
+
+        La construction d'une ressource génère toutes ses méthodes et leur
+        documentation (plusieurs dizaines de ms) : elle est faite une seule fois.
+        """
+        valeurs = getattr(self._local, "valeurs", None)
+        if valeurs is None:
+            valeurs = self.service().spreadsheets().values()
+            self._local.valeurs = valeurs
+        return valeurs
+
+    def pool(self):
+        """Pool de threads persistant sur lequel les lectures sont exécutées."""
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="sheets")
+        return self._pool
+
+    def fermer(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+def get_values(fabrique, spreadsheet_id, range_name, major_dimension="ROWS"):
+    """Lit une plage avec le client du thread courant et retourne les valeurs brutes (par lignes ou par colonnes)."""
+    result = executer(fabrique.valeurs().get(spreadsheetId=spreadsheet_id, range=range_name,
+                                             majorDimension=major_dimension, **RENDU_VALEURS))
+    return result.get("values", [])
+
+def get_values_concurrent(fabrique, spreadsheet_id, ranges, major_dimension="ROWS"):
+    """Lit plusieurs plages indépendantes en parallèle ; les résultats suivent l'ordre de `ranges`."""
+    return list(fabrique.pool().map(
+        lambda range_name: get_values(fabrique, spreadsheet_id, range_name, major_dimension), ranges))
+
+def get_pages_concurrent(fabrique, spreadsheet_id, plages, en_avance=MAX_WORKERS, major_dimension="ROWS"):
+    """Lit une suite de plages (fenêtres de lignes) en gardant au plus `en_avance` lectures en cours.
+
+    Les résultats sont produits dans l'ordre. La lecture s'arrête dès qu'une
+    fenêtre revient vide ; au plus `en_avance` pages sont en mémoire à la fois.
+    """
+    plages = iter(plages)
+    pool = fabrique.pool()
+    en_cours = [pool.submit(get_values, fabrique, spreadsheet_id, range_name, major_dimension)
+                for range_name in itertools.islice(plages, max(en_avance, 1))]
+    while en_cours:
+        lignes = en_cours.pop(0).result()
+        if not lignes:
+            for future in en_cours:
+                future.cancel()
+            return
+        range_name = next(plages, None)
+        if range_name is not None:
+            en_cours.append(pool.submit(get_values, fabrique, spreadsheet_id, range_name, major_dimension))
+        yield lignes
@@ -0,0 +1,102 @@
+import hashlib
+import os
+import pickle
+import numpy as np
+import pandas as pd
+
+from JointureWatermark import ETAT_DIR
+
+# Index déjà chargés pendant l'exécution courante, par (feuille, clé, colonnes)
+_INDEX_EN_MEMOIRE = {}
+
+def signature_dimension(dimension_df, cle, colonnes):
+    """Empreinte du contenu utile d'une feuille de dimension (clé et colonnes recherchées)."""
+    contenu = pd.util.hash_pandas_object(dimension_df[[cle] + colonnes], index=False).to_numpy()
+    return hashlib.blake2b(contenu.tobytes(), digest_size=16).hexdigest()
+
+def construire_index(dimension_df, cle, colonnes, nom="dimension"):
+    """Compile une feuille de dimension en index unique sur `cle`.
+
+    Les clés sont comparées telles quelles, comme par la jointure (merge) qu'il
+    remplace : ni espaces retirés ni clés vides écartées. Une clé présente
+    plusieurs fois multiplierait les lignes d'une jointure : seule la première
+    occurrence est conservée et chaque doublon non vide est signalé.
+    Retourne (index, conflits) où `conflits` liste les clés dupliquées.
+    """
+    dimension = dimension_df[[cle] + colonnes].copy()
+    dimension[cle] = dimension[cle].astype(object)
+
+    doublons = dimension[cle].duplicated(keep=False) & dimension[cle].notna() & (dimension[cle] != "")
+    conflits = sorted(dimension.loc[doublons, cle].unique().tolist())
+    for valeur in conflits:
+        occurrences = int((dimension[cle] == valeur).sum())
+        print(f"Conflit dans '{nom}' : {cle} '{valeur}' apparaît {occurrences} fois (première occurrence conservée).")
+
+    index = dimension.drop_duplicates(subset=cle, keep="first").set_index(cle)
+    return index, conflits
+
+def _chemin_index(nom, cle, colonnes):
+    """Fichier de l'index d'une dimension pour une clé et un jeu de colonnes.
+
+    Les tables qui indexent la même feuille sur des colonnes différentes
+    (ex. 'Operations' et 'Utilisateur' sur 'liste_cartes') ont chacune leur fichier.
+    """
+    nom_fichier = "".join(c if c.isalnum() else "_" for c in f"{nom}_{cle}")
+    suffixe = hashlib.blake2b("\x1f".join(colonnes).encode("utf-8"), digest_size=4).hexdigest()
+    return os.path.join(ETAT_DIR, f"index_{nom_fichier}_{suffixe}.pkl")
+
+def charger_index(dimension_df, cle, colonnes, nom="dimension"):
+    """Retourne l'index unique d'une dimension, reconstruit seulement si la feuille a changé.
+
+    L'index est conservé en mémoire et sur disque avec la signature du contenu
+    dont il est issu ; tant que cette signature est inchangée, il est réutilisé.
+    """
+    signature = signature_dimension(dimension_df, cle, colonnes)
+    memoire = _INDEX_EN_MEMOIRE.get((nom, cle, tuple(colonnes)))
+    if memoire is not None and memoire[0] == signature:
+        return memoire[1]
+
+    chemin = _chemin_index(nom, cle, colonnes)
+    if os.path.exists(chemin):
+        with open(chemin, "rb") as f:
+            signature_disque, colonnes_disque, index = pickle.load(f)
+        if signature_disque == signature and colonnes_disque == list(colonnes):
+            _INDEX_EN_MEMOIRE[(nom, cle, tuple(colonnes))] = (signature, index)
+            return index
+
+    index, _ = construire_index(dimension_df, cle, colonnes, nom)
+    os.makedirs(ETAT_DIR, exist_ok=True)
+    # Fichier temporaire propre au processus : les processus du mode parallèle peuvent reconstruire le même index
+    temporaire = f"{chemin}.{os.getpid()}.tmp"
+    with open(temporaire, "wb") as f:
+        pickle.dump((signature, list(colonnes), index), f)
+    os.replace(temporaire, chemin)
+    _INDEX_EN_MEMOIRE[(nom, cle, tuple(colonnes))] = (signature, index)
+    return index
+
+def positions(index, cles):
+    """Position de chaque clé de `cles` dans l'index (-1 si absente).
+
+    Pour une colonne catégorielle, la recherche n'est faite qu'une fois par
+    catégorie puis propagée à toutes les lignes par les codes. Comme pour une
+    jointure, une clé manquante retrouve la clé manquante de l'index, s'il en a une.
+    """
+    if isinstance(cles.dtype, pd.CategoricalDtype):
+        par_categorie = index.index.get_indexer(cles.cat.categories.astype(object))
+        manquante = index.index.get_indexer([np.nan])[0]
+        codes = cles.cat.codes.to_numpy()
+        return np.where(codes >= 0, par_categorie[codes], manquante)
+    return index.index.get_indexer(cles.astype(object))
+
+def enrichir(data_frame, index, cle, colonnes=None):
+    """Ajoute à `data_frame` les colonnes de l'index correspondant à sa colonne `cle`.
+
+    Équivalent d'une jointure gauche sur une dimension à clé unique : l'ordre et
+    le nombre de lignes de `data_frame` sont conservés, les clés inconnues donnent NaN.
+    """
+    colonnes = list(index.columns) if colonnes is None else colonnes
+    trouvees = positions(index, data_frame[cle])
+    resultat = data_frame.copy()
+    for col in colonnes:
+        resultat[col] = index[col].array.take(trouvees, allow_fill=True)
+    return resultat
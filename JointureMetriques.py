@@ -0,0 +1,242 @@
+import cProfile
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+import pandas as pd
+
+import JointureScheduler
+from JointureWatermark import ETAT_DIR
+
+# Journal des exécutions (une ligne JSON par exécution)
+JOURNAL_FILE = os.path.join(ETAT_DIR, "executions.jsonl")
+
+# Fichier texte au format Prometheus de chaque nom d'exécution (à placer dans le dossier
+# textfile de node_exporter) : un fichier par script, qui n'efface pas les métriques des autres
+METRIQUES_FILE = os.path.join(ETAT_DIR, "jointure_{nom}.prom")
+
+# Compteurs du planificateur rapportés par étape
+COMPTEURS = ["appels", "tentatives", "octets_envoyes", "octets_recus"]
+
+# Exécution en cours (None : les étapes ne sont pas mesurées)
+_EXECUTION = None
+
+def compter_lignes(objet):
+    """Nombre de lignes d'un DataFrame, d'une liste/tuple ou d'un dictionnaire de DataFrames (None sinon)."""
+    if isinstance(objet, pd.DataFrame):
+        return len(objet)
+    if isinstance(objet, dict):
+        objet = list(objet.values())
+    if isinstance(objet, (list, tuple)):
+        tailles = [compter_lignes(element) for element in objet]
+        tailles = [taille for taille in tailles if taille is not None]
+        return sum(tailles) if tailles else None
+    return None
+
+class Execution:
+    """Mesures d'une exécution : durée, lignes, octets, appels à l'API et nouvelles tentatives par étape.
+
+    `profil` vaut None (pas de profilage), le nom d'une étape, ou "auto" : chaque
+    étape de premier niveau est alors profilée et seul le profil de la plus lente est conservé.
+    """
+
+    def __init__(self, nom, profil=None):
+        self.nom = nom
+        self.profil = profil
+        self.debut = time.time()
+        self.etapes = []
+        self.profil_retenu = None  # (durée, étape, cProfile.Profile)
+        self._local = threading.local()
+
+    def etape(self, nom):
+        return _Etape(self, nom)
+
+    def _profiler(self, nom):
+        return self.profil in ("auto", nom) and getattr(self._local, "profondeur", 0) == 0
+
+class _Etape:
+    def __init__(self, execution, nom):
+        self.execution = execution
+        self.mesure = {"etape": nom, "lignes_entree": None, "lignes_sortie": None}
+
+    def __enter__(self):
+        execution = self.execution
+        self.profileur = cProfile.Profile() if execution._profiler(self.mesure["etape"]) else None
+        self.mesure["profondeur"] = getattr(execution._local, "profondeur", 0)
+        execution._local.profondeur = self.mesure["profondeur"] + 1
+        self.mesure["debut"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.compteurs = JointureScheduler.compteurs()
+        if self.profileur is not None:
+            self.profileur.enable()
+        self.chrono = time.perf_counter()
+        return self.mesure
+
+    def __exit__(self, type_erreur, erreur, trace):
+        duree = time.perf_counter() - self.chrono
+        if self.profileur is not None:
+            self.profileur.disable()
+        execution = self.execution
+        execution._local.profondeur = self.mesure["profondeur"]
+        apres = JointureScheduler.compteurs()
+        self.mesure["duree"] = round(duree, 6)
+        for compteur in COMPTEURS:
+            self.mesure[compteur] = apres[compteur] - self.compteurs[compteur]
+        self.mesure["erreur"] = None if erreur is None else f"{type_erreur.__name__}: {erreur}"
+        execution.etapes.append(self.mesure)
+        if self.profileur is not None and (execution.profil_retenu is None or duree > execution.profil_retenu[0]):
+            execution.profil_retenu = (duree, self.mesure["etape"], self.profileur)
+        return False
+
+def etape(nom):
+    """Mesure un bloc de code comme une étape de l'exécution en cours (sans effet hors exécution)."""
+    if _EXECUTION is None:
+        return contextlib.nullcontext({})
+    return _EXECUTION.etape(nom)
+
+def instrumenter(nom=None):
+    """Décorateur : mesure chaque appel de la fonction comme une étape de l'exécution en cours.
+
+    Les lignes en entrée sont celles des DataFrames passés en argument, les lignes
+    en sortie celles du résultat. Sans exécution en cours, la fonction est appelée telle quelle.
+    """
+    def decorateur(fonction):
+        etiquette = nom or fonction.__name__
+
+        @functools.wraps(fonction)
+        def enveloppe(*args, **kwargs):
+            execution = _EXECUTION
+            if execution is None:
+                return fonction(*args, **kwargs)
+            with execution.etape(etiquette) as mesure:
+                mesure["lignes_entree"] = compter_lignes(list(args) + list(kwargs.values()))
+                resultat = fonction(*args, **kwargs)
+                mesure["lignes_sortie"] = compter_lignes(resultat)
+            return resultat
+        return enveloppe
+    return decorateur
+
+def demarrer_execution(nom, profil=None):
+    """Commence à mesurer les étapes d'une exécution (une seule à la fois par processus)."""
+    global _EXECUTION
+    _EXECUTION = Execution(nom, profil)
+    return _EXECUTION
+
+def abandonner_execution():
+    """Oublie l'exécution en cours sans l'inscrire au journal ni aux métriques."""
+    global _EXECUTION
+    _EXECUTION = None
+
+def totaux_par_etape(etapes):
+    """Cumule les mesures des étapes de même nom."""
+    totaux = {}
+    for mesure in etapes:
+        total = totaux.setdefault(mesure["etape"], {"nombre": 0, "duree": 0.0, "lignes_entree": 0,
+                                                    "lignes_sortie": 0, "erreurs": 0,
+                                                    **{compteur: 0 for compteur in COMPTEURS}})
+        total["nombre"] += 1
+        total["duree"] += mesure["duree"]
+        total["erreurs"] += mesure["erreur"] is not None
+        for cle in ["lignes_entree", "lignes_sortie"] + COMPTEURS:
+            total[cle] += mesure[cle] or 0
+    return totaux
+
+def _etiquette(valeur):
+    return str(valeur).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def format_prometheus(execution, succes, duree):
+    """Métriques de la dernière exécution au format texte de Prometheus."""
+    nom = execution.nom
+    lignes = []
+
+    def metrique(nom_metrique, aide, valeurs):
+        lignes.append(f"# HELP {nom_metrique} {aide}")
+        lignes.append(f"# TYPE {nom_metrique} gauge")
+        for etiquettes, valeur in valeurs:
+            texte = ",".join(f'{cle}="{_etiquette(v)}"' for cle, v in [("execution", nom)] + etiquettes)
+            lignes.append(f"{nom_metrique}{{{texte}}} {valeur}")
+
+    metrique("jointure_execution_succes", "1 si la dernière exécution s'est terminée sans erreur.",
+             [([], int(succes))])
+    metrique("jointure_execution_duree_secondes", "Durée totale de la dernière exécution.", [([], round(duree, 6))])
+    metrique("jointure_execution_horodatage_secondes", "Fin de la dernière exécution (epoch).",
+             [([], round(execution.debut + duree, 3))])
+
+    totaux = totaux_par_etape(execution.etapes)
+    for cle, nom_metrique, aide in [
+        ("duree", "jointure_etape_duree_secondes", "Durée cumulée de l'étape."),
+        ("nombre", "jointure_etape_appels_fonction", "Nombre d'exécutions de l'étape."),
+        ("lignes_entree", "jointure_etape_lignes_entree", "Lignes reçues par l'étape."),
+        ("lignes_sortie", "jointure_etape_lignes_sortie", "Lignes produites par l'étape."),
+        ("octets_envoyes", "jointure_etape_octets_envoyes", "Octets envoyés à l'API pendant l'étape."),
+        ("octets_recus", "jointure_etape_octets_recus", "Octets reçus de l'API pendant l'étape."),
+        ("appels", "jointure_etape_appels_api", "Requêtes envoyées à l'API pendant l'étape."),
+        ("tentatives", "jointure_etape_tentatives", "Nouvelles tentatives après une erreur 429/5xx."),
+        ("erreurs", "jointure_etape_erreurs", "Appels de l'étape terminés en erreur."),
+    ]:
+        metrique(nom_metrique, aide, [([("etape", etape)], round(total[cle], 6)) for etape, total in totaux.items()])
+    return "\n".join(lignes) + "\n"
+
+def fichier_metriques(nom, modele=METRIQUES_FILE):
+    """Fichier Prometheus d'un nom d'exécution. Exemple : fichier_metriques("pipeline") -> ".jointure_etat/jointure_pipeline.prom"."""
+    return modele.format(nom="".join(c if c.isalnum() else "_" for c in nom))
+
+def terminer_execution(succes=None, journal=JOURNAL_FILE, metriques=METRIQUES_FILE):
+    """Termine l'exécution en cours : journal JSON, fichier Prometheus et, si demandé, profil de l'étape la plus lente.
+
+    Si `succes` n'est pas fourni, l'exécution est réussie lorsqu'aucune étape n'a échoué.
+    `metriques` peut contenir '{nom}', remplacé par le nom de l'exécution (voir fichier_metriques).
+    """
+    global _EXECUTION
+    execution, _EXECUTION = _EXECUTION, None
+    if execution is None:
+        return None
+    duree = time.time() - execution.debut
+    if succes is None:
+        succes = all(mesure["erreur"] is None for mesure in execution.etapes)
+
+    fichier_profil = None
+    if execution.profil_retenu is not None:
+        _, etape, profileur = execution.profil_retenu
+        fichier_profil = os.path.join(ETAT_DIR, f"profil_{etape}.prof")
+        os.makedirs(ETAT_DIR, exist_ok=True)
+        profileur.dump_stats(fichier_profil)
+
+    entree = {
+        "execution": execution.nom,
+        "debut": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(execution.debut)),
+        "duree": round(duree, 6),
+        "succes": succes,
+        "etapes": execution.etapes,
+        "profil": fichier_profil,
+    }
+    os.makedirs(os.path.dirname(journal) or ".", exist_ok=True)
+    with open(journal, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entree, ensure_ascii=False) + "\n")
+
+    # Écriture atomique : node_exporter ne doit jamais lire un fichier à moitié écrit
+    metriques = fichier_metriques(execution.nom, metriques)
+    os.makedirs(os.path.dirname(metriques) or ".", exist_ok=True)
+    with open(metriques + ".tmp", "w", encoding="utf-8") as f:
+        f.write(format_prometheus(execution, succes, duree))
+    os.replace(metriques + ".tmp", metriques)
+
+    resume = ", ".join(f"{etape} {total['duree']:.2f} s" for etape, total in totaux_par_etape(execution.etapes).items())
+    print(f"Exécution '{execution.nom}' terminée en {duree:.2f} s ({resume or 'aucune étape mesurée'}).")
+    if fichier_profil:
+        print(f"Profil de l'étape '{execution.profil_retenu[1]}' enregistré dans {fichier_profil}")
+    return entree
+
+def instrumenter_execution(nom):
+    """Décorateur pour la fonction main() d'un script : mesure toute l'exécution et en exporte les métriques."""
+    def decorateur(fonction):
+        @functools.wraps(fonction)
+        def enveloppe(*args, **kwargs):
+            demarrer_execution(nom, profil=os.environ.get("JOINTURE_PROFIL") or None)
+            try:
+                return fonction(*args, **kwargs)
+            finally:
+                terminer_execution()
+        return enveloppe
+    return decorateur
@@ -0,0 +1,310 @@
+import contextlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+from JointureIndex import charger_index, enrichir
+
+try:
+    import polars as pl
+    POLARS_DISPONIBLE = True
+except ImportError:
+    POLARS_DISPONIBLE = False
+
+try:
+    import duckdb
+    DUCKDB_DISPONIBLE = True
+except ImportError:
+    DUCKDB_DISPONIBLE = False
+
+# Moteurs de calcul des jointures. Tous exécutent les définitions de table ci-dessous :
+# "pandas" est la référence, "polars" et "duckdb" calculent le plan sur plusieurs cœurs.
+MOTEURS = ["pandas", "polars", "duckdb"]
+
+# Moteur choisi par configuration (variable d'environnement ou configurer_moteur)
+_MOTEUR = os.environ.get("JOINTURE_MOTEUR", "pandas")
+
+# Définition de chaque table dérivée de kdata :
+#  - jointures : (dimension, clé dans kdata, clé dans la dimension, colonnes ajoutées, unique)
+#    unique=True : recherche dans l'index de la dimension (voir JointureIndex.enrichir),
+#    unique=False : jointure gauche classique (DataFrame.merge), une ligne par correspondance
+#  - renommer, colonnes : renommage puis sélection des colonnes de sortie
+#  - tri : colonne de tri décroissant (convertie en date si `convertir_tri`)
+#  - constantes : colonnes ajoutées après le tri avec une valeur fixe
+#    (Type de Kiosque et Statut : valeurs par défaut tant que la feuille source ne les fournit pas)
+DEFINITIONS = {
+    "operations": {
+        "jointures": [("kiosque", "deviceID", "deviceID", ["Localisation"], True),
+                      ("cartes", "card_UID", "card_UID", ["Noms", "Adresse"], True)],
+        "renommer": {"Noms": "Nom Utilisateur"},
+        "colonnes": ["date", "deviceID", "Localisation", "Nom Utilisateur", "card_UID", "Montant", "dureeDis"],
+        "tri": "date",
+        "convertir_tri": False,
+        "constantes": {},
+    },
+    "utilisateur": {
+        "jointures": [("cartes", "card_UID", "card_UID", ["noms"], True),
+                      ("kiosque", "deviceID", "deviceID", ["kiosque", "adresse"], True)],
+        "renommer": {},
+        "colonnes": ["card_UID", "date", "noms", "kiosque", "deviceID", "adresse", "Montant", "Volume"],
+        "tri": "date",
+        "convertir_tri": True,
+        "constantes": {},
+    },
+    "kiosque": {
+        "jointures": [("kiosque", "deviceID", "Numéro", ["Localisation", "Fonctionnalité"], False)],
+        "renommer": {},
+        "colonnes": ["Date", "deviceID", "Localisation", "Fonctionnalité", "Duree de Fonctionnement",
+                     "Batterie Voltage"],
+        "tri": "Date",
+        "convertir_tri": True,
+        "constantes": {"Type de Kiosque": "Vente", "Statut": "Fonctionnel"},
+    },
+}
+
+# Feuille source de chaque dimension, qui nomme son index persistant (voir JointureIndex.charger_index)
+FEUILLES_DIMENSION = {"kiosque": "liste kiosque", "cartes": "liste_cartes"}
+
+def moteurs_disponibles():
+    return [nom for nom, present in zip(MOTEURS, [True, POLARS_DISPONIBLE, DUCKDB_DISPONIBLE]) if present]
+
+def configurer_moteur(nom):
+    """Choisit le moteur utilisé par create_operations_table, generate_utilisateur_table et generate_kiosque_table."""
+    global _MOTEUR
+    if nom not in MOTEURS:
+        raise ValueError(f"Moteur inconnu : {nom} (attendu : {', '.join(MOTEURS)})")
+    if nom not in moteurs_disponibles():
+        raise ValueError(f"Le moteur '{nom}' n'est pas installé (pip install {nom}).")
+    _MOTEUR = nom
+
+def moteur_actif():
+    return _MOTEUR
+
+@contextlib.contextmanager
+def utiliser_moteur(nom):
+    """Change temporairement de moteur (comparaison avec la référence pandas)."""
+    precedent = _MOTEUR
+    configurer_moteur(nom)
+    try:
+        yield
+    finally:
+        configurer_moteur(precedent)
+
+def _manquantes(disponibles, colonnes):
+    manquantes = [col for col in colonnes if col not in disponibles]
+    if manquantes:
+        raise KeyError(f"{manquantes} not in index")
+
+def _vue_kdata(definition, kdata_df):
+    """Colonnes de kdata utilisées par `definition` : clés de jointure et colonnes de sortie propres à kdata.
+
+    Une colonne de kdata homonyme d'une colonne apportée par une jointure (ex.
+    'Localisation', présente dans kdata et dans 'liste kiosque') est écartée : la
+    table reçoit celle de la dimension. Les colonnes absentes lèvent plus loin la
+    même KeyError qu'une sélection pandas.
+    """
+    ajoutees = {col for _, _, _, colonnes, _ in definition["jointures"] for col in colonnes}
+    origines = {nouveau: ancien for ancien, nouveau in definition["renommer"].items()}
+    utiles = {cle for _, cle, _, _, _ in definition["jointures"]} | {definition["tri"]}
+    utiles |= {origines.get(col, col) for col in definition["colonnes"]} - ajoutees
+    return kdata_df[[col for col in kdata_df.columns if col in utiles]]
+
+def _provenances(definition, kdata_df):
+    """Origine de chaque colonne après les jointures : None pour kdata, sinon l'indice de la jointure.
+
+    Reproduit les collisions de noms de pandas : une recherche indexée remplace la
+    colonne de kdata, une jointure classique suffixe les deux colonnes (_x, _y).
+    """
+    provenances = {col: (None, col) for col in kdata_df.columns}
+    for numero, (_, _, cle_dimension, colonnes, unique) in enumerate(definition["jointures"]):
+        if unique:
+            provenances.update({col: (numero, col) for col in colonnes})
+            continue
+        ajoutees = [cle_dimension] + [col for col in colonnes if col != cle_dimension]
+        for col in ajoutees:
+            if col in provenances:
+                provenances[f"{col}_x"] = provenances.pop(col)
+                provenances[f"{col}_y"] = (numero, col)
+            else:
+                provenances[col] = (numero, col)
+    return {definition["renommer"].get(col, col): origine for col, origine in provenances.items()}
+
+def _types_sortie(definition, kdata_df, dimensions):
+    """Types des colonnes de sortie du chemin pandas, obtenus en rejouant les jointures sur des DataFrames vides.
+
+    DataFrame.merge convertit par exemple une clé catégorielle en texte si les
+    catégories des deux côtés diffèrent ; les colonnes manquantes lèvent la même KeyError.
+    """
+    squelette = kdata_df.iloc[:0]
+    for dimension, cle, cle_dimension, colonnes, unique in definition["jointures"]:
+        vide = dimensions[dimension].iloc[:0]
+        if unique:
+            squelette = squelette.assign(**{col: vide[col] for col in colonnes})
+        else:
+            squelette = squelette.merge(vide[[cle_dimension] + colonnes], left_on=cle, right_on=cle_dimension,
+                                        how="left")
+    return squelette.rename(columns=definition["renommer"])[definition["colonnes"]].dtypes
+
+def _encoder_cles(cles):
+    """Codes entiers des clés de kdata et table {code: valeur texte} (code -1 : clé vide).
+
+    Le moteur joint les codes plutôt que les textes : seules les valeurs distinctes
+    (quelques centaines de kiosques ou milliers de cartes) passent par la comparaison de textes.
+    """
+    if isinstance(cles.dtype, pd.CategoricalDtype):
+        codes, valeurs = cles.cat.codes.to_numpy(), cles.cat.categories
+    else:
+        codes, valeurs = pd.factorize(cles)
+    valeurs = pd.Series(valeurs).astype(str).tolist() + [None]
+    categories = pd.DataFrame({"__code": np.arange(-1, len(valeurs) - 1), "__valeur": [valeurs[-1]] + valeurs[:-1]})
+    return codes.astype(np.int64), categories
+
+def _plan_polars(faits, categories, dimensions, definition):
+    lf = pl.from_pandas(faits).lazy()
+    for numero, (_, _, cle_dimension, _, unique) in enumerate(definition["jointures"]):
+        position = f"__pos{numero}"
+        valeurs = pl.from_pandas(categories[numero]).lazy()
+        dim = (pl.from_pandas(dimensions[numero]).lazy()
+                 .select(pl.col(cle_dimension).cast(pl.String).alias("__cle"), pl.col("__pos").alias(position)))
+        if unique:
+            dim = (dim.with_columns(pl.col("__cle").str.strip_chars())
+                      .filter(pl.col("__cle").is_not_null() & (pl.col("__cle") != ""))
+                      .unique(subset="__cle", keep="first", maintain_order=True))
+            valeurs = valeurs.with_columns(pl.col("__valeur").str.strip_chars())
+            correspondances = valeurs.join(dim, left_on="__valeur", right_on="__cle", how="inner")
+        else:
+            correspondances = valeurs.join(dim, left_on="__valeur", right_on="__cle", how="inner", nulls_equal=True)
+        correspondances = correspondances.select("__code", position).sort("__code", position)
+        lf = lf.join(correspondances, left_on=f"__code{numero}", right_on="__code", how="left",
+                     maintain_order="left_right")
+    positions = [f"__pos{numero}" for numero in range(len(definition["jointures"]))]
+    plan = (lf.with_row_index("__rang")
+              .sort(["__tri", "__rang"], descending=[True, False], nulls_last=True)
+              .select("__ligne", "__rang", *[pl.col(p).fill_null(-1) for p in positions])
+              .collect())
+    return [plan[col].to_numpy() for col in plan.columns]
+
+def _plan_duckdb(faits, categories, dimensions, definition):
+    positions, tables, jointures = [], [], []
+    for numero, (_, _, cle_dimension, _, unique) in enumerate(definition["jointures"]):
+        position = f"__pos{numero}"
+        positions.append(position)
+        if unique:
+            tables.append(f"""c{numero} AS (
+                SELECT v.__code, min(d.__pos) AS {position}
+                FROM cat{numero} AS v JOIN dim{numero} AS d
+                  ON trim(v.__valeur) = trim(CAST(d."{cle_dimension}" AS VARCHAR))
+                WHERE trim(v.__valeur) <> ''
+                GROUP BY v.__code)""")
+        else:
+            tables.append(f"""c{numero} AS (
+                SELECT v.__code, d.__pos AS {position}
+                FROM cat{numero} AS v JOIN dim{numero} AS d
+                  ON v.__valeur IS NOT DISTINCT FROM CAST(d."{cle_dimension}" AS VARCHAR))""")
+        jointures.append(f"LEFT JOIN c{numero} ON f.__code{numero} = c{numero}.__code")
+    # Rang d'une ligne dans le résultat de la jointure, comme l'ordre produit par DataFrame.merge
+    rang = f"row_number() OVER (ORDER BY {', '.join(['f.__ligne'] + positions)}) - 1"
+    requete = f"""
+        {'WITH ' + ', '.join(tables) if tables else ''}
+        SELECT f.__ligne, {rang} AS __rang{''.join(f', coalesce({p}, -1) AS {p}' for p in positions)}
+        FROM faits AS f {' '.join(jointures)}
+        ORDER BY f.__tri DESC NULLS LAST, __rang"""
+    connexion = duckdb.connect()
+    try:
+        connexion.register("faits", faits)
+        for numero, (valeurs, dimension) in enumerate(zip(categories, dimensions)):
+            connexion.register(f"cat{numero}", valeurs)
+            connexion.register(f"dim{numero}", dimension)
+        plan = connexion.execute(requete).fetchnumpy()
+    finally:
+        connexion.close()
+    return [np.asarray(plan[col]) for col in ["__ligne", "__rang"] + positions]
+
+def _construire_pandas(definition, kdata_df, dimensions):
+    """Chemin de référence : recherches indexées (JointureIndex) et DataFrame.merge, puis tri stable."""
+    table = kdata_df
+    for dimension, cle, cle_dimension, colonnes, unique in definition["jointures"]:
+        if unique:
+            index = charger_index(dimensions[dimension], cle_dimension, colonnes, nom=FEUILLES_DIMENSION[dimension])
+            table = enrichir(table, index, cle)
+        else:
+            table = table.merge(dimensions[dimension][[cle_dimension] + colonnes], left_on=cle,
+                                right_on=cle_dimension, how="left")
+    table = table.rename(columns=definition["renommer"])[definition["colonnes"]]
+    if definition["convertir_tri"]:
+        table[definition["tri"]] = pd.to_datetime(table[definition["tri"]], errors='coerce')
+    table = table.sort_values(by=definition["tri"], ascending=False, kind="stable")
+    for col, valeur in definition["constantes"].items():
+        table[col] = valeur
+    return table
+
+def _rassembler(taches):
+    """Exécute les recopies de colonnes {colonne: fonction} en parallèle, une par thread.
+
+    take() de numpy et d'Arrow libère le GIL pour les types natifs (nombres, dates,
+    textes Arrow) : les colonnes sont recopiées sur plusieurs cœurs.
+    """
+    if len(taches) <= 1 or (os.cpu_count() or 1) <= 1:
+        return {col: tache() for col, tache in taches.items()}
+    with ThreadPoolExecutor(max_workers=min(len(taches), os.cpu_count()), thread_name_prefix="moteur") as pool:
+        futures = {col: pool.submit(tache) for col, tache in taches.items()}
+        return {col: future.result() for col, future in futures.items()}
+
+def construire_table(nom, kdata_df, dimensions, moteur=None):
+    """Construit la table `nom` (voir DEFINITIONS) avec le moteur configuré.
+
+    Avec "polars" ou "duckdb", le moteur ne calcule que le plan de la table : pour
+    chaque ligne de sortie, la ligne de kdata et la ligne de chaque dimension
+    correspondante, dans l'ordre du tri. Les colonnes sont ensuite recopiées depuis
+    les DataFrames d'origine (en parallèle, voir _rassembler), ce qui conserve
+    exactement les types, les catégories et l'index du chemin pandas.
+    """
+    moteur = moteur or _MOTEUR
+    definition = DEFINITIONS[nom]
+    kdata_df = _vue_kdata(definition, kdata_df)
+    if moteur == "pandas":
+        return _construire_pandas(definition, kdata_df, dimensions)
+    jointures = definition["jointures"]
+    _manquantes(kdata_df.columns, [cle for _, cle, _, _, _ in jointures] + [definition["tri"]])
+    for dimension, _, cle_dimension, colonnes, _ in jointures:
+        _manquantes(dimensions[dimension].columns, [cle_dimension] + colonnes)
+    types = _types_sortie(definition, kdata_df, dimensions)
+    provenances = _provenances(definition, kdata_df)
+
+    tri = kdata_df[definition["tri"]]
+    if definition["convertir_tri"]:
+        tri = pd.to_datetime(tri, errors='coerce')
+    faits = pd.DataFrame({"__ligne": np.arange(len(kdata_df)), "__tri": tri.to_numpy()})
+    categories = []
+    for numero, (_, cle, _, _, _) in enumerate(jointures):
+        faits[f"__code{numero}"], valeurs = _encoder_cles(kdata_df[cle])
+        categories.append(valeurs)
+    tables_dimension = [pd.DataFrame({cle_dimension: dimensions[dimension][cle_dimension].to_numpy(),
+                                      "__pos": np.arange(len(dimensions[dimension]))})
+                        for dimension, _, cle_dimension, _, _ in jointures]
+
+    planifier = _plan_polars if moteur == "polars" else _plan_duckdb
+    lignes, rangs, *positions = planifier(faits, categories, tables_dimension, definition)
+    lignes = lignes.astype(np.intp)
+    positions = [position.astype(np.intp) for position in positions]
+
+    def recopier(col):
+        numero, origine = provenances[col]
+        if numero is None:
+            if origine == definition["tri"]:
+                return tri.array.take(lignes)
+            valeurs = kdata_df[origine].array.take(lignes)
+        else:
+            valeurs = dimensions[jointures[numero][0]][origine].array.take(positions[numero], allow_fill=True)
+        return valeurs if valeurs.dtype == types[col] else valeurs.astype(types[col])
+
+    sortie = _rassembler({col: (lambda col=col: recopier(col)) for col in definition["colonnes"]})
+    if all(unique for _, _, _, _, unique in jointures):
+        index = kdata_df.index.take(lignes)
+    else:
+        index = pd.Index(rangs.astype(np.int64))
+    table = pd.DataFrame(sortie, index=index)
+    for col, valeur in definition["constantes"].items():
+        table[col] = valeur
+    return table
@@ -0,0 +1,157 @@
+import itertools
+import os
+import time
+import numpy as np
+import pandas as pd
+
+from JointureScheduler import executer
+from JointureWatermark import ETAT_DIR, charger_etat, sauver_etat
+from JointureWriter import append_sheet_diff, insert_sheet_sorted, write_sheets_diff
+
+# Onglets mensuels déjà écrits (mois, onglet, nombre de lignes), par classeur et par table
+ONGLETS_FILE = os.path.join(ETAT_DIR, "onglets.json")
+
+# Onglet d'index des onglets mensuels du classeur destination
+PLAGE_INDEX = "Index_Onglets!A:F"
+
+# Suffixe de l'onglet des lignes sans date
+SANS_DATE = "sans_date"
+
+# Découpage activé par configurer_onglets
+_CONFIGURATION = {"actif": False}
+
+# Titres des onglets existants, par classeur (lus une fois par processus)
+_ONGLETS = {}
+
+def configurer_onglets(actif=True):
+    """Active le découpage des tables dérivées de kdata en onglets mensuels (ex. 'Operations_2026_10')."""
+    _CONFIGURATION["actif"] = bool(actif)
+
+def onglets_actifs():
+    return _CONFIGURATION["actif"]
+
+def plage_mensuelle(range_name, mois):
+    """Plage de l'onglet d'un mois. Exemple : plage_mensuelle("Operations!A:I", "2026_10") -> "Operations_2026_10!A:I"."""
+    feuille, _, colonnes = range_name.partition('!')
+    feuille = feuille.strip("'")
+    return f"{feuille}_{mois}!{colonnes}"
+
+def decouper_par_mois(data_frame, colonne_date):
+    """Découpe une table en {mois 'AAAA_MM': lignes du mois}, en conservant l'ordre des lignes.
+
+    Les lignes sans date valide sont regroupées sous SANS_DATE.
+    """
+    if data_frame.empty:
+        return {}
+    mois = pd.to_datetime(data_frame[colonne_date], errors='coerce').dt.strftime("%Y_%m").fillna(SANS_DATE).to_numpy()
+    codes, uniques = pd.factorize(mois)
+    ordre = np.argsort(codes, kind="stable")
+    bornes = np.searchsorted(codes[ordre], np.arange(len(uniques) + 1))
+    return {valeur: data_frame.iloc[ordre[bornes[i]:bornes[i + 1]]] for i, valeur in enumerate(uniques)}
+
+def onglets_existants(service, spreadsheet_id):
+    """Titres des onglets du classeur (un seul appel spreadsheets().get par processus et par classeur)."""
+    if spreadsheet_id not in _ONGLETS:
+        resultat = executer(service.spreadsheets().get(spreadsheetId=spreadsheet_id, fields="sheets.properties.title"))
+        _ONGLETS[spreadsheet_id] = {feuille["properties"]["title"] for feuille in resultat.get("sheets", [])}
+    return _ONGLETS[spreadsheet_id]
+
+def creer_onglets(service, spreadsheet_id, plages):
+    """Crée en un seul appel batchUpdate (addSheet) les onglets des `plages` qui n'existent pas encore."""
+    existants = onglets_existants(service, spreadsheet_id)
+    titres = []
+    for range_name in plages:
+        titre = range_name.split('!')[0].strip("'")
+        if titre not in existants and titre not in titres:
+            titres.append(titre)
+    if not titres:
+        return []
+    executer(service.spreadsheets().batchUpdate(spreadsheetId=spreadsheet_id, body={
+        "requests": [{"addSheet": {"properties": {"title": titre}}} for titre in titres]}), "ecriture")
+    existants.update(titres)
+    print(f"Onglet(s) créé(s) : {', '.join(titres)}")
+    return titres
+
+def table_index(etat_classeur):
+    """Contenu de l'onglet d'index : une ligne par onglet mensuel, mois les plus récents en tête."""
+    lignes = [[range_name.split('!')[0], infos["onglet"], mois, infos["lignes"], infos["mis_a_jour"]]
+              for range_name, par_mois in etat_classeur.items() for mois, infos in par_mois.items()]
+    index = pd.DataFrame(lignes, columns=["Table", "Onglet", "Mois", "Lignes", "Mis à jour"])
+    index["Total table"] = index.groupby("Table")["Lignes"].transform("sum")
+    return index.sort_values(by=["Table", "Mois"], ascending=[True, False], kind="stable")
+
+def ecrire_mensuels(service, spreadsheet_id, sorties, colonnes_date, ajout=False, decroissantes=()):
+    """Écrit les tables de `colonnes_date` ({plage: colonne de date}) dans des onglets mensuels.
+
+    Sans `ajout`, chaque table est complète : seul l'onglet du mois le plus récent
+    est réécrit, ainsi que les mois absents de l'index ou dont le nombre de lignes
+    a changé (données tardives). Avec `ajout`, les lignes sont nouvelles et
+    rejoignent l'onglet de leur mois (écrit avec ses en-têtes s'il s'agit d'un
+    nouveau mois) : à leur place pour les tables de `decroissantes`, triées par
+    date décroissante (voir insert_sheet_sorted), en fin d'onglet pour les autres.
+    Les onglets manquants sont créés puis l'onglet d'index (PLAGE_INDEX) est mis à jour.
+    Retourne les sorties qui ne sont pas découpées.
+    """
+    etat = charger_etat(ONGLETS_FILE, defaut={})
+    etat_classeur = etat.setdefault(spreadsheet_id, {})
+    horodatage = time.strftime("%Y-%m-%d %H:%M:%S")
+    a_ecrire, a_ajouter, restantes = {}, [], {}
+
+    for range_name, data_frame in sorties.items():
+        if range_name not in colonnes_date:
+            restantes[range_name] = data_frame
+            continue
+        par_mois = decouper_par_mois(data_frame, colonnes_date[range_name])
+        connus = etat_classeur.setdefault(range_name, {})
+        recent = max((mois for mois in par_mois if mois != SANS_DATE), default=None)
+        for mois, lignes in par_mois.items():
+            plage = plage_mensuelle(range_name, mois)
+            infos = connus.get(mois)
+            if ajout and infos is not None:
+                a_ajouter.append((plage, lignes, colonnes_date[range_name] if range_name in decroissantes else None))
+                total = infos["lignes"] + len(lignes)
+            elif mois == recent or infos is None or infos["lignes"] != len(lignes):
+                a_ecrire[plage] = lignes
+                total = len(lignes)
+            else:
+                continue
+            connus[mois] = {"onglet": plage.split('!')[0], "lignes": total, "mis_a_jour": horodatage}
+
+    creer_onglets(service, spreadsheet_id, list(a_ecrire) + [plage for plage, _, _ in a_ajouter])
+    if a_ecrire:
+        write_sheets_diff(service, spreadsheet_id, a_ecrire)
+    for plage, lignes, colonne_date in a_ajouter:
+        if colonne_date is not None:
+            insert_sheet_sorted(service, spreadsheet_id, plage, lignes, colonne_date)
+        else:
+            append_sheet_diff(service, spreadsheet_id, plage, lignes)
+    if a_ecrire or a_ajouter:
+        _publier_index(service, spreadsheet_id, etat)
+    return restantes
+
+def _publier_index(service, spreadsheet_id, etat):
+    """Réécrit l'onglet d'index du classeur et enregistre l'état local des onglets mensuels."""
+    creer_onglets(service, spreadsheet_id, [PLAGE_INDEX])
+    write_sheets_diff(service, spreadsheet_id, {PLAGE_INDEX: table_index(etat[spreadsheet_id])})
+    sauver_etat(ONGLETS_FILE, etat)
+
+def enregistrer_mois(service, spreadsheet_id, range_name, lignes_par_mois):
+    """Remplace les onglets mensuels connus d'une table reconstruite par ailleurs (ex. en flux) et met l'index à jour."""
+    etat = charger_etat(ONGLETS_FILE, defaut={})
+    horodatage = time.strftime("%Y-%m-%d %H:%M:%S")
+    etat.setdefault(spreadsheet_id, {})[range_name] = {
+        mois: {"onglet": plage_mensuelle(range_name, mois).split('!')[0], "lignes": lignes, "mis_a_jour": horodatage}
+        for mois, lignes in lignes_par_mois.items()}
+    _publier_index(service, spreadsheet_id, etat)
+
+def ecrire_sorties(service, spreadsheet_id, sorties, colonnes_date):
+    """Écrit toutes les sorties : onglets mensuels pour les tables datées si le découpage est actif, write_sheets_diff sinon."""
+    if onglets_actifs():
+        sorties = ecrire_mensuels(service, spreadsheet_id, sorties, colonnes_date)
+    return write_sheets_diff(service, spreadsheet_id, sorties) if sorties else 0
+
+def lots_par_mois(lots, colonne_date):
+    """Regroupe un flux de lots triés par date décroissante en (mois, lots du mois), mois après mois."""
+    morceaux = ((mois, lignes) for lot in lots for mois, lignes in decouper_par_mois(lot, colonne_date).items())
+    for mois, groupe in itertools.groupby(morceaux, key=lambda morceau: morceau[0]):
+        yield mois, (lignes for _, lignes in groupe)
@@ -0,0 +1,235 @@
+import atexit
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    ARROW_DISPONIBLE = True
+except ImportError:
+    ARROW_DISPONIBLE = False
+
+from JointureMetriques import instrumenter
+from JointureMoteur import configurer_moteur, moteur_actif
+
+# Colonne technique ajoutée à chaque partition : position de la ligne dans kdata
+COLONNE_POSITION = "__position__"
+
+# Partitions de kdata par processus (plusieurs, pour répartir les kiosques très actifs)
+PARTITIONS_PAR_PROCESSUS = 2
+
+_CONFIGURATION = {"processus": 1}
+
+# Pool de processus conservé entre deux constructions (daemon, mode streaming)
+_POOL = {"executeur": None, "processus": 0}
+
+# Dans chaque processus de calcul : dimensions diffusées pour la construction en cours
+_DIMENSIONS = {"cle": None, "frames": {}}
+
+def configurer_parallele(processus=1):
+    """Nombre de processus qui calculent les tables dérivées de kdata (1 : calcul en série, 0 : un par cœur)."""
+    processus = (os.cpu_count() or 1) if processus == 0 else int(processus)
+    if processus > 1 and not ARROW_DISPONIBLE:
+        raise ValueError("Le mode parallèle nécessite pyarrow (pip install pyarrow).")
+    if processus > 1 and moteur_actif() != "pandas":
+        raise ValueError(f"Le mode parallèle s'applique au moteur pandas ; '{moteur_actif()}' utilise déjà plusieurs cœurs.")
+    _CONFIGURATION["processus"] = max(processus, 1)
+
+def processus_paralleles():
+    return _CONFIGURATION["processus"]
+
+def _executeur():
+    """Pool de processus, créé au premier besoin puis réutilisé tant que le nombre de processus ne change pas."""
+    processus = _CONFIGURATION["processus"]
+    if _POOL["executeur"] is None or _POOL["processus"] != processus:
+        arreter_pool()
+        _POOL["executeur"] = ProcessPoolExecutor(max_workers=processus, initializer=configurer_moteur,
+                                                 initargs=("pandas",))
+        _POOL["processus"] = processus
+    return _POOL["executeur"]
+
+def arreter_pool():
+    if _POOL["executeur"] is not None:
+        _POOL["executeur"].shutdown()
+        _POOL["executeur"] = None
+
+atexit.register(arreter_pool)
+
+def _vers_arrow(table):
+    """Sérialise une table Arrow au format IPC (flux) et retourne le tampon."""
+    tampon = pa.BufferOutputStream()
+    with pa.ipc.new_stream(tampon, table.schema) as ecrivain:
+        ecrivain.write_table(table)
+    return tampon.getvalue()
+
+def _depuis_arrow(tampon, types):
+    """Relit un tampon Arrow IPC en DataFrame et restaure les types pandas d'origine."""
+    data_frame = pa.ipc.open_stream(tampon).read_all().to_pandas()
+    differents = {col: type_ for col, type_ in types.items() if data_frame[col].dtype != type_}
+    return data_frame.astype(differents) if differents else data_frame
+
+def _partager(table):
+    """Copie une table Arrow (format IPC) dans un bloc de mémoire partagée. Retourne (bloc, taille)."""
+    donnees = _vers_arrow(table)
+    bloc = shared_memory.SharedMemory(create=True, size=max(donnees.size, 1))
+    try:
+        bloc.buf[:donnees.size] = memoryview(donnees).cast("B")
+    except BaseException:
+        bloc.close()
+        bloc.unlink()
+        raise
+    return bloc, donnees.size
+
+def _lire_partage(nom, taille, types):
+    """Relit un DataFrame depuis un bloc de mémoire partagée.
+
+    Le contenu est copié d'un bloc hors du segment avant d'être décodé : aucune
+    colonne ne référence la mémoire partagée, que l'appelant libère ensuite.
+    """
+    bloc = shared_memory.SharedMemory(name=nom)
+    try:
+        donnees = bytes(bloc.buf[:taille])
+    finally:
+        bloc.close()
+    return _depuis_arrow(pa.py_buffer(donnees), types)
+
+def _dimensions(cle, dimensions):
+    """Feuilles de dimension diffusées, relues une seule fois par processus et par construction."""
+    if _DIMENSIONS["cle"] != cle:
+        _DIMENSIONS["frames"] = {nom: _lire_partage(*emplacement) for nom, emplacement in dimensions.items()}
+        _DIMENSIONS["cle"] = cle
+    return _DIMENSIONS["frames"]
+
+def _calculer_partition(partition, cle_dimensions, dimensions, taches):
+    """Exécutée dans un processus de calcul : applique chaque tâche à une partition de kdata.
+
+    L'index de la partition est la position des lignes dans kdata : une fonction
+    qui conserve l'index la transmet telle quelle ; pour une fonction qui le
+    réinitialise (DataFrame.merge), l'index de sortie est la position dans la
+    partition, valable tant que la jointure ne multiplie pas les lignes.
+    Retourne {nom: (tampon Arrow, types)}, une exception (levée aussi en série),
+    ou None si la tâche doit être recalculée en série.
+    """
+    kdata = _lire_partage(*partition)
+    positions = kdata.pop(COLONNE_POSITION).to_numpy()
+    kdata.index = positions
+    frames = _dimensions(cle_dimensions, dimensions)
+    resultats = {}
+    for nom, (fonction, noms_dimensions, conserve_index) in taches.items():
+        try:
+            sortie = fonction(kdata, *[frames[dimension] for dimension in noms_dimensions])
+        except (KeyError, ValueError) as e:
+            resultats[nom] = e
+            continue
+        if len(sortie) != len(kdata):
+            # Clé de dimension en double : la jointure a multiplié des lignes
+            resultats[nom] = None
+            continue
+        origine = sortie.index.to_numpy() if conserve_index else positions[sortie.index.to_numpy()]
+        table = pa.Table.from_pandas(sortie, preserve_index=False)
+        table = table.append_column(COLONNE_POSITION, pa.array(origine, type=pa.int64()))
+        resultats[nom] = (_vers_arrow(table), sortie.dtypes.to_dict())
+    return resultats
+
+def partitions_kdata(kdata_df, nombre):
+    """Répartit les lignes de kdata en `nombre` partitions par hachage de deviceID.
+
+    Toutes les lignes d'un kiosque sont dans la même partition. Retourne la liste
+    des positions (croissantes) de chaque partition non vide.
+    """
+    codes = pd.util.hash_pandas_object(kdata_df["deviceID"], index=False).to_numpy() % np.uint64(nombre)
+    ordre = np.argsort(codes, kind="stable")
+    bornes = np.searchsorted(codes[ordre], np.arange(nombre + 1, dtype=np.uint64))
+    return [ordre[bornes[i]:bornes[i + 1]] for i in range(nombre) if bornes[i + 1] > bornes[i]]
+
+def ordre_fusion(dates, positions):
+    """Ordre qui fusionne des partitions concaténées, chacune triée par date décroissante puis par position.
+
+    `dates` : colonne de tri des partitions mises bout à bout (NaT en dernier dans
+    chacune), `positions` : position de chaque ligne dans kdata. Le résultat est
+    celui d'un tri stable par date décroissante de la table dans l'ordre de kdata.
+    Dates à la seconde près : date et position forment une seule clé entière, dont
+    le tri stable (timsort) ne fait que fusionner les séquences déjà triées, en
+    O(n log k) pour k partitions. Sinon, tri lexicographique des deux colonnes.
+    Retourne None si `dates` n'est pas une colonne de dates.
+    """
+    if not pd.api.types.is_datetime64_dtype(dates.dtype):
+        return None
+    valeurs = dates.to_numpy(dtype="datetime64[ns]").view(np.int64)
+    manquantes = np.isnat(dates.to_numpy())
+    presentes = valeurs[~manquantes]
+    secondes, reste = np.divmod(presentes, 10 ** 9)
+    if len(presentes) and not reste.any():
+        bits = max(int(positions.max()).bit_length(), 1)
+        haut, bas = int(secondes.max()), int(secondes.min())
+        if (haut - bas + 1).bit_length() + bits <= 63:
+            rangs = np.full(len(valeurs), haut - bas + 1, dtype=np.int64)
+            rangs[~manquantes] = haut - secondes
+            return np.argsort((rangs << bits) | positions, kind="stable")
+    return np.lexsort((positions, -valeurs, manquantes))
+
+@instrumenter("construire_en_parallele")
+def construire_en_parallele(taches, kdata_df, dimensions):
+    """Calcule des tables dérivées de kdata dans plusieurs processus, partition par partition.
+
+    `taches` : {nom: (fonction, noms des dimensions, index de kdata conservé,
+    colonne de tri)}. Chaque fonction doit traiter les
+    lignes de kdata indépendamment les unes des autres (jointures gauches,
+    évaluations ligne à ligne) puis trier par date décroissante avec un tri stable.
+    kdata est partitionnée par deviceID ; chaque partition et les `dimensions`
+    ({nom: DataFrame}, diffusées une fois à chaque processus) sont transmises au
+    format Arrow dans des blocs de mémoire partagée, et les résultats reviennent
+    en tampons Arrow, déjà triés. Les partitions sont fusionnées (voir ordre_fusion) :
+    le résultat est identique au calcul en série.
+    Retourne {nom: DataFrame, exception ou None (à calculer en série)}.
+    """
+    nombre = processus_paralleles() * PARTITIONS_PAR_PROCESSUS
+    blocs = []
+    try:
+        emplacements = {}
+        for nom, data_frame in dimensions.items():
+            bloc, taille = _partager(pa.Table.from_pandas(data_frame, preserve_index=False))
+            blocs.append(bloc)
+            emplacements[nom] = (bloc.name, taille, data_frame.dtypes.to_dict())
+        cle_dimensions = blocs[0].name if blocs else None
+        types_kdata = kdata_df.dtypes.to_dict()
+        a_calculer = {nom: tache[:3] for nom, tache in taches.items()}
+
+        travaux = []
+        for positions in partitions_kdata(kdata_df, nombre):
+            table = pa.Table.from_pandas(kdata_df.iloc[positions], preserve_index=False)
+            table = table.append_column(COLONNE_POSITION, pa.array(positions, type=pa.int64()))
+            bloc, taille = _partager(table)
+            blocs.append(bloc)
+            travaux.append(_executeur().submit(_calculer_partition, (bloc.name, taille, types_kdata),
+                                               cle_dimensions, emplacements, a_calculer))
+        par_partition = [travail.result() for travail in travaux]
+    finally:
+        for bloc in blocs:
+            bloc.close()
+            bloc.unlink()
+
+    resultats = {}
+    for nom, (_, _, conserve_index, colonne_tri) in taches.items():
+        morceaux = [resultat[nom] for resultat in par_partition]
+        erreurs = [morceau for morceau in morceaux if morceau is None or isinstance(morceau, Exception)]
+        if erreurs:
+            resultats[nom] = erreurs[0]
+            continue
+        table = pd.concat([_depuis_arrow(pa.py_buffer(tampon), {**types, COLONNE_POSITION: np.int64})
+                           for tampon, types in morceaux], ignore_index=True)
+        positions = table.pop(COLONNE_POSITION).to_numpy()
+        ordre = ordre_fusion(table[colonne_tri], positions)
+        if ordre is None:
+            # Colonne de tri sans type date : retour à l'ordre de kdata, puis même tri qu'en série
+            dans_ordre = np.argsort(positions, kind="stable")
+            triee = table[colonne_tri].iloc[dans_ordre].reset_index(drop=True).sort_values(ascending=False,
+                                                                                           kind="stable")
+            ordre = dans_ordre[triee.index.to_numpy()]
+        table = table.iloc[ordre]
+        positions = positions[ordre]
+        table.index = kdata_df.index.take(positions) if conserve_index else pd.Index(positions)
+        resultats[nom] = table
+    return resultats
@@ -0,0 +1,205 @@
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_DISPONIBLE = True
+except ImportError:
+    PARQUET_DISPONIBLE = False
+
+# Dossier racine de l'entrepôt Parquet : un sous-dossier par table, une partition par jour
+ENTREPOT_DIR = "entrepot_parquet"
+
+# Destinations des tables dérivées de kdata :
+#  - "sheets" : Google Sheets uniquement (comportement historique)
+#  - "parquet" : entrepôt Parquet uniquement, ces tables ne sont plus écrites dans Sheets
+#  - "sheets+parquet" : historique complet dans l'entrepôt, Sheets reçoit tout ou une fenêtre récente
+SORTIES = ["sheets", "parquet", "sheets+parquet"]
+
+# Métadonnée Parquet : dernière ligne de kdata (1-indexée, en-tête compris) déjà incluse dans la partition
+CLE_DERNIERE_LIGNE = b"jointure.derniere_ligne"
+
+# Colonne technique de chaque partition : première ligne de kdata du lot qui a apporté la ligne.
+# Un lot relancé après une interruption repart de la même ligne (le watermark n'a pas avancé).
+COLONNE_LOT = "__premiere_ligne__"
+
+PARTITION_INCONNUE = "jour=inconnu"
+
+_CONFIGURATION = {"sortie": "sheets", "racine": ENTREPOT_DIR, "fenetre": 0}
+
+def configurer_puits(sortie="sheets", racine=ENTREPOT_DIR, fenetre=0):
+    """Choisit la destination des tables dérivées de kdata et la fenêtre (en jours) envoyée à Sheets (0 : tout)."""
+    if sortie not in SORTIES:
+        raise ValueError(f"Sortie inconnue : {sortie} (attendu : {', '.join(SORTIES)})")
+    if sortie != "sheets" and not PARQUET_DISPONIBLE:
+        raise ValueError("La sortie Parquet nécessite pyarrow (pip install pyarrow).")
+    if fenetre and sortie != "sheets+parquet":
+        raise ValueError("Une fenêtre Sheets n'a de sens qu'avec la sortie 'sheets+parquet'.")
+    _CONFIGURATION.update(sortie=sortie, racine=racine, fenetre=int(fenetre))
+
+def dossier_table(range_name, racine=None):
+    """Dossier d'une table dans l'entrepôt. Exemple : "Operations!A:I" -> "entrepot_parquet/Operations"."""
+    nom = range_name.split('!')[0].strip("'")
+    return os.path.join(racine or _CONFIGURATION["racine"], "".join(c if c.isalnum() or c in "-_" else "_" for c in nom))
+
+def _chemin_partition(dossier, partition):
+    return os.path.join(dossier, partition, "donnees.parquet")
+
+def derniere_ligne_partition(chemin):
+    """Dernière ligne de kdata incluse dans une partition (0 si inconnue)."""
+    metadonnees = pq.read_schema(chemin).metadata or {}
+    return int(metadonnees.get(CLE_DERNIERE_LIGNE, b"0"))
+
+def _ecrire_partition(chemin, data_frame, derniere_ligne):
+    """Remplace une partition de façon atomique (fichier temporaire puis renommage).
+
+    Les colonnes catégorielles sont stockées avec le type de leurs valeurs, pour
+    que toutes les partitions d'une table partagent le même schéma.
+    """
+    os.makedirs(os.path.dirname(chemin), exist_ok=True)
+    data_frame = data_frame.copy()
+    for col in data_frame.select_dtypes(include="category").columns:
+        data_frame[col] = data_frame[col].astype(data_frame[col].cat.categories.dtype)
+    table = pa.Table.from_pandas(data_frame, preserve_index=False)
+    metadonnees = dict(table.schema.metadata or {})
+    metadonnees[CLE_DERNIERE_LIGNE] = str(int(derniere_ligne)).encode()
+    temporaire = chemin + ".tmp"
+    pq.write_table(table.replace_schema_metadata(metadonnees), temporaire)
+    os.replace(temporaire, chemin)
+
+def ecrire_partitions(dossier, data_frame, colonne_date, derniere_ligne, premiere_ligne=2):
+    """Ajoute aux partitions journalières de `dossier` les lignes de `data_frame`, tirées des lignes
+    `premiere_ligne` à `derniere_ligne` de kdata.
+
+    Chaque partition touchée est relue, complétée, triée par date décroissante
+    (tri stable : à date égale, les lignes plus anciennes de kdata restent devant)
+    puis remplacée atomiquement. Une partition qui inclut déjà `derniere_ligne`
+    n'est pas modifiée. Les lignes d'une tentative interrompue du même lot
+    (même `premiere_ligne`, voir COLONNE_LOT), éventuellement plus courte si de
+    nouvelles lignes sont arrivées depuis, sont remplacées par celles du lot :
+    aucune ligne n'est ajoutée deux fois. Retourne le nombre de partitions écrites.
+    """
+    if data_frame.empty:
+        return 0
+    jours = pd.to_datetime(data_frame[colonne_date], errors='coerce').dt.normalize()
+    codes, uniques = pd.factorize(jours, use_na_sentinel=True)
+    ordre = np.argsort(codes, kind="stable")
+    bornes = np.searchsorted(codes[ordre], np.arange(-1, len(uniques) + 1))
+
+    ecrites = 0
+    for code in range(-1, len(uniques)):
+        lignes = ordre[bornes[code + 1]:bornes[code + 2]]
+        if not len(lignes):
+            continue
+        partition = PARTITION_INCONNUE if code < 0 else f"jour={uniques[code]:%Y-%m-%d}"
+        chemin = _chemin_partition(dossier, partition)
+        nouvelles = data_frame.iloc[lignes].assign(**{COLONNE_LOT: premiere_ligne})
+        if os.path.exists(chemin):
+            if derniere_ligne_partition(chemin) >= derniere_ligne:
+                continue
+            existantes = pq.read_table(chemin).to_pandas()
+            if COLONNE_LOT in existantes.columns:
+                existantes = existantes[existantes[COLONNE_LOT] != premiere_ligne]
+            nouvelles = pd.concat([existantes, nouvelles], ignore_index=True)
+        nouvelles = nouvelles.sort_values(by=colonne_date, ascending=False, kind="stable")
+        _ecrire_partition(chemin, nouvelles, derniere_ligne)
+        ecrites += 1
+    return ecrites
+
+def commencer_reconstruction(range_name):
+    """Prépare un dossier vide où reconstruire une table ; elle remplacera l'ancienne à la publication."""
+    dossier = dossier_table(range_name) + ".reconstruction"
+    shutil.rmtree(dossier, ignore_errors=True)
+    os.makedirs(dossier)
+    return dossier
+
+def publier_reconstruction(range_name):
+    """Remplace une table par sa reconstruction (deux renommages, l'ancienne table n'est supprimée qu'après)."""
+    dossier = dossier_table(range_name)
+    ancien = dossier + ".ancien"
+    shutil.rmtree(ancien, ignore_errors=True)
+    if os.path.exists(dossier):
+        os.replace(dossier, ancien)
+    os.replace(dossier + ".reconstruction", dossier)
+    shutil.rmtree(ancien, ignore_errors=True)
+
+def lire_table(range_name, depuis=None, racine=None):
+    """Relit une table de l'entrepôt, triée par date décroissante.
+
+    Avec `depuis` (date), seules les partitions de ce jour et des jours suivants
+    sont lues ; les lignes sans date ne sont alors pas incluses.
+    """
+    dossier = dossier_table(range_name, racine)
+    if not os.path.isdir(dossier):
+        return pd.DataFrame()
+    partitions = sorted((p for p in os.listdir(dossier) if p.startswith("jour=") and p != PARTITION_INCONNUE),
+                        reverse=True)
+    if depuis is not None:
+        limite = f"jour={pd.Timestamp(depuis):%Y-%m-%d}"
+        partitions = [p for p in partitions if p >= limite]
+    elif os.path.isdir(os.path.join(dossier, PARTITION_INCONNUE)):
+        partitions.append(PARTITION_INCONNUE)
+    tables = [pq.read_table(_chemin_partition(dossier, p)) for p in partitions
+              if os.path.exists(_chemin_partition(dossier, p))]
+    if not tables:
+        return pd.DataFrame()
+    table = pa.concat_tables(tables, promote_options="permissive").to_pandas()
+    return table.drop(columns=[COLONNE_LOT], errors="ignore")
+
+def lire_fenetre(range_name, jours=None, racine=None):
+    """Lignes des `jours` derniers jours présents dans la table (relativement à sa date la plus récente).
+
+    Par défaut, la fenêtre configurée pour Sheets (voir configurer_puits).
+    """
+    jours = jours or _CONFIGURATION["fenetre"]
+    dossier = dossier_table(range_name, racine)
+    partitions = sorted(p for p in os.listdir(dossier) if p.startswith("jour=") and p != PARTITION_INCONNUE) \
+        if os.path.isdir(dossier) else []
+    if not partitions:
+        return pd.DataFrame()
+    plus_recent = pd.Timestamp(partitions[-1][len("jour="):])
+    return lire_table(range_name, depuis=plus_recent - pd.Timedelta(days=jours - 1), racine=racine)
+
+def deposer(sorties, colonnes_date, derniere_ligne, reinitialiser=False, premiere_ligne=2):
+    """Écrit dans l'entrepôt les tables de `colonnes_date` ({plage: colonne de date}) présentes dans `sorties`.
+
+    Ces tables sont tirées des lignes `premiere_ligne` à `derniere_ligne` de kdata
+    (voir ecrire_partitions). Avec
+    `reinitialiser`, chaque table est reconstruite à part puis publiée d'un bloc.
+    Retourne les sorties destinées à Google Sheets : inchangées en sortie "sheets",
+    sans les tables partitionnées en sortie "parquet", et avec seulement la fenêtre
+    récente relue depuis l'entrepôt si une fenêtre est configurée.
+    """
+    sortie = _CONFIGURATION["sortie"]
+    if sortie == "sheets":
+        return sorties
+    pour_sheets = dict(sorties)
+    for range_name, colonne in colonnes_date.items():
+        if range_name not in sorties:
+            continue
+        if reinitialiser:
+            dossier = commencer_reconstruction(range_name)
+            ecrire_partitions(dossier, sorties[range_name], colonne, derniere_ligne, premiere_ligne)
+            publier_reconstruction(range_name)
+        else:
+            ecrire_partitions(dossier_table(range_name), sorties[range_name], colonne, derniere_ligne, premiere_ligne)
+        if sortie == "parquet":
+            del pour_sheets[range_name]
+        elif fenetre_active():
+            pour_sheets[range_name] = lire_fenetre(range_name)
+    return pour_sheets
+
+def fenetre_active():
+    """Vrai si les tables partitionnées ne reçoivent dans Sheets qu'une fenêtre récente (réécrite à chaque exécution)."""
+    return _CONFIGURATION["sortie"] == "sheets+parquet" and _CONFIGURATION["fenetre"] > 0
+
+def sortie_parquet():
+    """Vrai si les tables partitionnées sont écrites dans l'entrepôt Parquet."""
+    return _CONFIGURATION["sortie"] != "sheets"
+
+def sortie_sheets():
+    """Vrai si les tables partitionnées sont (aussi) écrites dans Google Sheets."""
+    return _CONFIGURATION["sortie"] != "parquet"
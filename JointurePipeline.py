@@ -0,0 +1,523 @@
+import argparse
+import os
+import pandas as pd
+from googleapiclient.errors import HttpError
+
+from JointureColonnes import (DIMENSION_COLONNES, colonnes_vers_dataframe, concatener_frames, entetes_colonnes,
+                              nombre_lignes)
+from JointureSchema import RENDU_VALEURS
+from JointureFetch import FabriqueClients, get_values_concurrent
+from JointureMoteur import MOTEURS, configurer_moteur, moteur_actif
+from JointureMetriques import METRIQUES_FILE, demarrer_execution, instrumenter, terminer_execution
+from JointureScheduler import QUOTAS, configurer, executer
+from JointureAgregats import AGREGATS, agregats_a_jour, mettre_a_jour_agregats
+from JointureParquet import ENTREPOT_DIR, SORTIES, configurer_puits, deposer, fenetre_active
+from JointureParallele import configurer_parallele, construire_en_parallele, processus_paralleles
+from JointureDoublons import configurer_dedoublonnage, dedoublonner
+from JointureOnglets import configurer_onglets, ecrire_mensuels, ecrire_sorties, onglets_actifs
+from JointureConsultation import configurer_consultation, publier_consultation
+from JointureCache import authenticate_drive, read_sheets_cached
+from JointureWriter import append_sheet_diff, insert_sheet_sorted
+from JointureWatermark import (charger_watermark, sauver_watermark, date_max, empreinte_feuille, plage_increment,
+                                plage_entetes, plage_historique)
+
+from JointureClient import charger_credentials
+from JointureAssociationOperation import authenticate_google_sheets, extract_sheet_id, create_operations_table
+from JointureAssociationSysteme import (SYSTEME_ETAT_FILE, generate_systeme_table_from_kdata, mettre_a_jour_systeme,
+                                        suivre_etats_systeme)
+from JointureAssociationUtilisateur import generate_utilisateur_table
+from JointureAssociationKiosque import generate_kiosque_table
+
+# Plages source, chacune téléchargée une seule fois en entier. Chaque table n'utilise
+# ensuite que les colonnes dont elle a besoin, repérées par leur en-tête (voir
+# JointureMoteur.DEFINITIONS) : kdata va jusqu'à EtatDebimetre (colonne P), et
+# 'liste kiosque' jusqu'à Fonctionnalité (colonne F).
+PLAGES_SOURCE = {
+    "kdata": "kdata!A:P",
+    "liste kiosque": "liste kiosque!A:F",
+    "liste_cartes": "liste_cartes!A:G",
+}
+
+# Plages écrites dans le classeur destination
+PLAGE_OPERATIONS = "Operations!A:I"
+PLAGE_KIOSQUE = "Kiosque!A:F"
+PLAGE_SYSTEME = "Système!A:K"
+PLAGE_UTILISATEUR = "Utilisateur!A:H"
+PLAGE_CARTES = "Cartes!A:G"
+PLAGE_TRANSITIONS = "Système_Transitions!A:F"
+
+# Contenu de l'onglet 'Système' :
+#  - "complet" : une ligne par relevé de télémétrie (comportement historique)
+#  - "etat" : une ligne par kiosque (dernier état connu) et journal des changements dans PLAGE_TRANSITIONS
+MODES_SYSTEME = ["complet", "etat"]
+
+# Colonne de date (tri décroissant, partition de l'entrepôt Parquet) des tables dérivées ligne à ligne de kdata
+COLONNES_DATE = {
+    PLAGE_OPERATIONS: "date",
+    PLAGE_UTILISATEUR: "date",
+    PLAGE_KIOSQUE: "Date",
+    PLAGE_SYSTEME: "Date",
+}
+
+# Graphe de dépendances : plage destination -> feuilles source dont elle est dérivée.
+# Une table n'a besoin d'être reconstruite que si l'une de ses sources a changé.
+DEPENDANCES = {
+    PLAGE_OPERATIONS: ["kdata", "liste kiosque", "liste_cartes"],
+    PLAGE_UTILISATEUR: ["kdata", "liste kiosque", "liste_cartes"],
+    PLAGE_KIOSQUE: ["kdata", "liste kiosque"],
+    PLAGE_SYSTEME: ["kdata"],
+    PLAGE_CARTES: ["liste_cartes"],
+    PLAGE_TRANSITIONS: ["kdata"],
+    **{range_name: ["kdata"] for range_name in AGREGATS},
+}
+
+def plages_dependantes(feuilles_modifiees, dependances=DEPENDANCES):
+    """Plages destination dont au moins une feuille source a changé."""
+    return [range_name for range_name, sources in dependances.items() if set(sources) & set(feuilles_modifiees)]
+
+# Tables calculables partition par partition de kdata en mode parallèle (voir JointureParallele) :
+# (fonction, dimensions, index de kdata conservé). Chaque fonction trie par date
+# décroissante avec un tri stable : les partitions triées sont ensuite fusionnées (voir ordre_fusion)
+TACHES_PARALLELES = {
+    PLAGE_OPERATIONS: (create_operations_table, ["liste kiosque", "liste_cartes"], True),
+    PLAGE_UTILISATEUR: (generate_utilisateur_table, ["liste_cartes", "liste kiosque"], True),
+    PLAGE_KIOSQUE: (generate_kiosque_table, ["liste kiosque"], False),
+    PLAGE_SYSTEME: (generate_systeme_table_from_kdata, [], True),
+}
+
+def completer_lignes(lignes, largeur):
+    """Complète avec '' les lignes dont Google Sheets a omis les cellules vides finales."""
+    return [ligne + [""] * (largeur - len(ligne)) if len(ligne) < largeur else ligne[:largeur] for ligne in lignes]
+
+def values_to_dataframe(values):
+    """Construit un DataFrame à partir d'une liste de lignes dont la première contient les en-têtes."""
+    if not values:
+        return pd.DataFrame()
+    return pd.DataFrame(completer_lignes(values[1:], len(values[0])), columns=values[0])
+
+def batch_get_values(service, spreadsheet_id, ranges, major_dimension="ROWS"):
+    """Lit plusieurs plages en un seul appel values().batchGet et retourne les valeurs brutes de chaque plage.
+
+    Avec major_dimension=DIMENSION_COLONNES, chaque plage arrive en une liste de valeurs par colonne.
+    """
+    result = executer(service.spreadsheets().values().batchGet(spreadsheetId=spreadsheet_id, ranges=list(ranges),
+                                                               majorDimension=major_dimension, **RENDU_VALEURS))
+    value_ranges = result.get("valueRanges", [])
+    return [value_range.get("values", []) for value_range in value_ranges]
+
+def colonnes_vers_frames(ranges, lectures):
+    """Convertit les plages lues par colonnes en DataFrames typés, une plage après l'autre.
+
+    Chaque réponse est retirée de `lectures` avant d'être convertie : ses valeurs
+    brutes sont libérées dès que le DataFrame de la plage est construit.
+    """
+    frames = []
+    lectures.reverse()
+    for range_name in ranges:
+        colonnes = lectures.pop()
+        if not colonnes:
+            print(f"Aucune donnée trouvée dans la plage : {range_name}")
+        frames.append(colonnes_vers_dataframe(colonnes, range_name))
+    return frames
+
+@instrumenter("read_sheet")
+def read_sheets_batch(service, spreadsheet_id, ranges):
+    """Lit plusieurs plages en un seul appel values().batchGet et retourne un DataFrame typé par plage."""
+    return colonnes_vers_frames(ranges, batch_get_values(service, spreadsheet_id, ranges, DIMENSION_COLONNES))
+
+@instrumenter("read_sheet")
+def read_sheets_concurrent(fabrique, spreadsheet_id, ranges):
+    """Lit plusieurs plages en parallèle (un client HTTP par thread) et retourne un DataFrame typé par plage."""
+    return colonnes_vers_frames(ranges, get_values_concurrent(fabrique, spreadsheet_id, ranges, DIMENSION_COLONNES))
+
+def build_all_tables(kdata_df, kiosque_df, cartes_df, systeme_complet=True, plages=None):
+    """Construit toutes les tables de jointure à partir des trois feuilles source déjà lues.
+
+    Retourne un dictionnaire {plage destination: DataFrame}. Comme avec les scripts
+    séparés, une table dont les données source sont vides ou incomplètes est ignorée
+    sans empêcher la construction des autres. Sans `systeme_complet`, la table
+    'Système' n'est pas construite ici (voir tables_systeme_etat). Si `plages` est
+    fourni, seules ces plages destination sont construites. En mode parallèle
+    (configurer_parallele), le résultat est identique au calcul en série.
+    """
+    feuilles = {"kdata": kdata_df, "liste kiosque": kiosque_df, "liste_cartes": cartes_df}
+
+    etapes = [
+        (PLAGE_OPERATIONS, lambda: create_operations_table(kdata_df, kiosque_df, cartes_df)),
+        (PLAGE_UTILISATEUR, lambda: generate_utilisateur_table(kdata_df, cartes_df, kiosque_df)),
+        (PLAGE_KIOSQUE, lambda: generate_kiosque_table(kdata_df, kiosque_df)),
+        (PLAGE_SYSTEME, lambda: generate_systeme_table_from_kdata(kdata_df)),
+        (PLAGE_CARTES, lambda: cartes_df),
+    ]
+    if not systeme_complet:
+        etapes = [etape for etape in etapes if etape[0] != PLAGE_SYSTEME]
+    if plages is not None:
+        etapes = [etape for etape in etapes if etape[0] in plages]
+
+    a_construire = []
+    for range_name, construire in etapes:
+        if any(feuilles[feuille].empty for feuille in DEPENDANCES[range_name]):
+            print(f"Une ou plusieurs feuilles sont vides. Table '{range_name}' ignorée.")
+        else:
+            a_construire.append((range_name, construire))
+    # En mode parallèle, les tables de TACHES_PARALLELES sont calculées d'abord, partition par partition
+    paralleles = construire_tables_paralleles([range_name for range_name, _ in a_construire], kdata_df, kiosque_df,
+                                              cartes_df)
+
+    sorties = {}
+    for range_name, construire in a_construire:
+        try:
+            resultat = paralleles.get(range_name)
+            if isinstance(resultat, Exception):
+                raise resultat
+            sorties[range_name] = construire() if resultat is None else resultat
+        except (KeyError, ValueError) as e:
+            print(f"Impossible de générer la table '{range_name}' : {e}")
+    return sorties
+
+def construire_tables_paralleles(plages, kdata_df, kiosque_df, cartes_df):
+    """Calcule en plusieurs processus les tables de `plages` qui le permettent (voir TACHES_PARALLELES).
+
+    Sans effet en mode série (un seul processus) ou avec un autre moteur que pandas.
+    Retourne {plage: DataFrame, exception à signaler ou None (à calculer en série)}.
+    """
+    plages = [range_name for range_name in plages if range_name in TACHES_PARALLELES]
+    if processus_paralleles() <= 1 or moteur_actif() != "pandas" or not plages or "deviceID" not in kdata_df.columns:
+        return {}
+    dimensions = {"liste kiosque": kiosque_df, "liste_cartes": cartes_df}
+    taches = {}
+    for range_name in plages:
+        fonction, noms_dimensions, conserve_index = TACHES_PARALLELES[range_name]
+        taches[range_name] = (fonction, noms_dimensions, conserve_index, COLONNES_DATE[range_name])
+    try:
+        return construire_en_parallele(taches, kdata_df, dimensions)
+    except (TypeError, ValueError) as e:
+        # Données non convertibles au format Arrow (ex. en-têtes en double) : calcul en série
+        print(f"Calcul parallèle impossible ({e}) : tables construites en série.")
+        return {}
+
+def tables_partitionnees(mode_systeme="complet"):
+    """Tables conservées dans l'entrepôt Parquet : {plage: colonne de date}.
+
+    En mode_systeme "etat", 'Système' n'a qu'une ligne par kiosque et reste dans
+    Sheets ; c'est le journal des transitions qui est partitionné.
+    """
+    if mode_systeme == "complet":
+        return dict(COLONNES_DATE)
+    colonnes = {range_name: colonne for range_name, colonne in COLONNES_DATE.items() if range_name != PLAGE_SYSTEME}
+    colonnes[PLAGE_TRANSITIONS] = "Date"
+    return colonnes
+
+def tables_systeme_etat(kdata_df, derniere_ligne, reinitialiser=False):
+    """Tables du mode « état » : dernier état de chaque kiosque et changements d'état des nouvelles lignes."""
+    try:
+        etat_courant, transitions = mettre_a_jour_systeme(kdata_df, derniere_ligne, reinitialiser)
+    except (KeyError, ValueError) as e:
+        print(f"Impossible de générer la table '{PLAGE_SYSTEME}' : {e}")
+        return {}
+    return {PLAGE_SYSTEME: etat_courant, PLAGE_TRANSITIONS: transitions}
+
+def empreintes_dimensions(kiosque_df, cartes_df):
+    """Empreintes des feuilles de dimension, conservées dans le watermark pour détecter leurs modifications."""
+    return {"liste kiosque": empreinte_feuille(kiosque_df), "liste_cartes": empreinte_feuille(cartes_df)}
+
+def memoriser_sources(memoire, derniere_ligne, kdata_df, kiosque_df, cartes_df):
+    """Garde dans `memoire` (voir run_incremental) les feuilles source traitées jusqu'à la ligne `derniere_ligne` de kdata.
+
+    kdata, déjà dédoublonnée, y est conservée en lots successifs, assemblés
+    seulement quand une reconstruction en a besoin (voir kdata_historique).
+    """
+    if memoire is None:
+        return
+    memoire.clear()
+    memoire.update({"derniere_ligne": derniere_ligne, "kdata": [kdata_df], "liste kiosque": kiosque_df,
+                    "liste_cartes": cartes_df})
+
+def kdata_historique(service, spreadsheet_id, watermark, entetes, memoire=None):
+    """kdata dédoublonnée jusqu'au watermark : celle gardée en `memoire` si elle est à jour, sinon relue."""
+    if memoire and memoire.get("derniere_ligne") == watermark["derniere_ligne"]:
+        lots = memoire["kdata"]
+        lots[:] = [concatener_frames(lots)]
+        return lots[0]
+    plage_kdata = PLAGES_SOURCE["kdata"]
+    colonnes, = batch_get_values(service, spreadsheet_id, [plage_historique(plage_kdata, watermark["derniere_ligne"])],
+                                 DIMENSION_COLONNES)
+    # L'index des transactions couvre déjà ces lignes : seuls les doublons internes sont retirés
+    return dedoublonner(colonnes_vers_dataframe(colonnes, plage_kdata, entetes), persister=False)
+
+def run_pipeline(service, spreadsheet_id_source, spreadsheet_id_destination, drive_service=None, offline=False,
+                 fabrique=None, mode_systeme="complet", memoire=None):
+    """Lit les feuilles source une seule fois, construit toutes les tables et n'écrit que ce qui a changé.
+
+    Les feuilles source passent par le cache local d'instantanés : si la révision
+    Drive du classeur n'a pas changé, aucune valeur n'est retéléchargée. En mode
+    `offline`, les tables sont construites depuis le dernier instantané sans être écrites.
+    Avec une `fabrique` de clients, les plages sont lues en parallèle plutôt qu'en un batchGet.
+    Enregistre ensuite le watermark de kdata pour les exécutions incrémentales suivantes.
+    `mode_systeme` choisit le contenu de l'onglet 'Système' (voir MODES_SYSTEME).
+    Les feuilles lues sont gardées dans `memoire` si elle est fournie (voir run_incremental).
+    """
+    if fabrique is not None:
+        lecteur = lambda ranges: read_sheets_concurrent(fabrique, spreadsheet_id_source, ranges)
+    else:
+        lecteur = lambda ranges: read_sheets_batch(service, spreadsheet_id_source, ranges)
+    kdata_df, kiosque_df, cartes_df = read_sheets_cached(
+        lecteur,
+        spreadsheet_id_source,
+        [PLAGES_SOURCE["kdata"], PLAGES_SOURCE["liste kiosque"], PLAGES_SOURCE["liste_cartes"]],
+        drive_service=drive_service, offline=offline
+    )
+    # Ligne 1 = en-têtes, donc la dernière ligne lue est len(kdata_df) + 1 (doublons compris)
+    derniere_ligne = len(kdata_df) + 1
+    # Reconstruction complète : l'index des transactions déjà vues repart de zéro (inchangé hors ligne)
+    kdata_df = dedoublonner(kdata_df, reinitialiser=True, persister=not offline)
+    sorties = build_all_tables(kdata_df, kiosque_df, cartes_df, systeme_complet=mode_systeme == "complet")
+    if offline:
+        if mode_systeme == "etat" and not kdata_df.empty:
+            try:
+                sorties[PLAGE_SYSTEME], sorties[PLAGE_TRANSITIONS] = suivre_etats_systeme(kdata_df)
+            except (KeyError, ValueError) as e:
+                print(f"Impossible de générer la table '{PLAGE_SYSTEME}' : {e}")
+        for range_name, data_frame in sorties.items():
+            print(f"{range_name} : {len(data_frame)} ligne(s) (mode hors ligne, non écrites)")
+        return sorties
+    a_ecrire = sorties
+    if not kdata_df.empty:
+        # Reconstruction complète : les agrégats journaliers repartent de zéro
+        sorties.update(mettre_a_jour_agregats(kdata_df, derniere_ligne, reinitialiser=True))
+        if mode_systeme == "etat":
+            sorties.update(tables_systeme_etat(kdata_df, derniere_ligne, reinitialiser=True))
+        # Historique complet dans l'entrepôt Parquet (selon la sortie configurée, voir configurer_puits)
+        a_ecrire = deposer(sorties, tables_partitionnees(mode_systeme), derniere_ligne, reinitialiser=True)
+    # Tables datées découpées en onglets mensuels si configuré (voir configurer_onglets)
+    ecrire_sorties(service, spreadsheet_id_destination, a_ecrire, tables_partitionnees(mode_systeme))
+    if not kdata_df.empty:
+        # Instantané lu par l'API locale de consultation (si activé, voir configurer_consultation)
+        publier_consultation(sorties.get(PLAGE_UTILISATEUR), sorties.get(PLAGE_SYSTEME), derniere_ligne)
+        sauver_watermark(derniere_ligne, date_max(kdata_df), kdata_df.columns,
+                         empreintes_dimensions(kiosque_df, cartes_df))
+        memoriser_sources(memoire, derniere_ligne, kdata_df, kiosque_df, cartes_df)
+    return sorties
+
+def run_incremental(service, spreadsheet_id_source, spreadsheet_id_destination, full_rebuild=False, drive_service=None,
+                    fabrique=None, mode_systeme="complet", memoire=None):
+    """Ne traite que les lignes de kdata ajoutées depuis la dernière exécution.
+
+    Les nouvelles lignes sont lues à partir du watermark (ex. 'kdata!A121:J'),
+    jointes aux feuilles de dimension, puis insérées à leur place dans les tables
+    dérivées de kdata, triées par date décroissante, au lieu de les réécrire
+    (voir insert_sheet_sorted). Les transactions déjà reçues sont retirées au
+    passage (voir JointureDoublons). La copie 'Cartes' est réécrite et les
+    agrégats journaliers sont mis à jour avec les seules nouvelles lignes.
+    En mode_systeme "etat", l'état courant des kiosques est réécrit et les
+    nouveaux changements d'état sont ajoutés au journal des transitions.
+    Si une feuille de dimension a changé, seules les tables qui en dépendent
+    (voir DEPENDANCES) sont recalculées sur tout l'historique de kdata ; les
+    autres reçoivent les nouvelles lignes comme d'habitude. Cet historique est
+    pris dans `memoire` (dictionnaire conservé par l'appelant d'une exécution à
+    l'autre, voir JointureDaemon) s'il y est à jour, sinon relu.
+    Sans watermark, si l'état des agrégats est absent ou en retard, si les
+    en-têtes de kdata ont changé ou avec `full_rebuild`, toutes les tables sont reconstruites.
+    """
+    watermark = charger_watermark()
+    if mode_systeme == "etat" and not os.path.exists(SYSTEME_ETAT_FILE):
+        # L'état des kiosques doit d'abord être calculé sur tout l'historique
+        full_rebuild = True
+    if watermark is not None and not agregats_a_jour(watermark["derniere_ligne"]):
+        # Agrégats absents ou en retard sur le watermark : ils doivent être recalculés sur tout l'historique
+        print("Agrégats journaliers absents ou incomplets.")
+        full_rebuild = True
+    if full_rebuild or watermark is None:
+        print("Reconstruction complète des tables.")
+        return run_pipeline(service, spreadsheet_id_source, spreadsheet_id_destination, drive_service, fabrique=fabrique,
+                            mode_systeme=mode_systeme, memoire=memoire)
+
+    plage_kdata = PLAGES_SOURCE["kdata"]
+    entetes, nouvelles_colonnes, kiosque_colonnes, cartes_colonnes = batch_get_values(
+        service, spreadsheet_id_source,
+        [plage_entetes(plage_kdata), plage_increment(plage_kdata, watermark["derniere_ligne"]),
+         PLAGES_SOURCE["liste kiosque"], PLAGES_SOURCE["liste_cartes"]],
+        DIMENSION_COLONNES
+    )
+    entetes = entetes_colonnes(entetes)
+    if entetes != watermark["entetes"]:
+        print("Les en-têtes de 'kdata' ont changé depuis la dernière exécution. Reconstruction complète.")
+        return run_pipeline(service, spreadsheet_id_source, spreadsheet_id_destination, drive_service, fabrique=fabrique,
+                            mode_systeme=mode_systeme, memoire=memoire)
+
+    kiosque_df = colonnes_vers_dataframe(kiosque_colonnes, PLAGES_SOURCE["liste kiosque"])
+    cartes_df = colonnes_vers_dataframe(cartes_colonnes, PLAGES_SOURCE["liste_cartes"])
+    dimensions = empreintes_dimensions(kiosque_df, cartes_df)
+    modifiees = [feuille for feuille, empreinte in dimensions.items()
+                 if empreinte != (watermark.get("dimensions") or {}).get(feuille)]
+    nouvelles_lignes = nombre_lignes(nouvelles_colonnes)
+    if not nouvelles_lignes and not modifiees:
+        print(f"Aucune nouvelle ligne dans 'kdata' depuis la ligne {watermark['derniere_ligne']}.")
+        return {}
+
+    reconstruites = plages_dependantes(modifiees)
+    historique = None
+    if modifiees:
+        print(f"Feuille(s) de dimension modifiée(s) : {', '.join(modifiees)}. "
+              f"Tables reconstruites : {', '.join(reconstruites)}.")
+        historique = kdata_historique(service, spreadsheet_id_source, watermark, entetes, memoire)
+
+    kdata_df = colonnes_vers_dataframe(nouvelles_colonnes, plage_kdata, entetes)
+    derniere_ligne = watermark["derniere_ligne"] + nouvelles_lignes
+    # Transactions renvoyées par les kiosques : seules les nouvelles lignes sont comparées à l'index
+    kdata_df = dedoublonner(kdata_df, watermark["derniere_ligne"] + 1)
+    partitionnees = tables_partitionnees(mode_systeme)
+    sorties = {}
+
+    if historique is not None:
+        # Tables qui dépendent d'une feuille modifiée : recalculées sur tout l'historique, nouvelles lignes comprises
+        historique = concatener_frames([historique, kdata_df])
+        sorties = build_all_tables(historique, kiosque_df, cartes_df, systeme_complet=mode_systeme == "complet",
+                                   plages=reconstruites)
+        a_ecrire = deposer(sorties, partitionnees, derniere_ligne, reinitialiser=True)
+        ecrire_sorties(service, spreadsheet_id_destination, a_ecrire, partitionnees)
+
+    if nouvelles_lignes:
+        autres = [range_name for range_name in DEPENDANCES if range_name not in reconstruites]
+        nouvelles = build_all_tables(kdata_df, kiosque_df, cartes_df, systeme_complet=mode_systeme == "complet",
+                                     plages=autres)
+        if mode_systeme == "etat":
+            nouvelles.update(tables_systeme_etat(kdata_df, derniere_ligne))
+        a_ajouter = deposer(nouvelles, partitionnees, derniere_ligne, premiere_ligne=watermark["derniere_ligne"] + 1)
+        # Petites tables et fenêtres récentes réécrites entièrement ; les autres reçoivent les nouvelles lignes
+        # à leur place (tables triées par date décroissante) ou en fin de feuille (journal des transitions)
+        a_reecrire = [PLAGE_CARTES] + ([PLAGE_SYSTEME] if mode_systeme == "etat" else []) \
+            + (list(partitionnees) if fenetre_active() else [])
+        reecrites = {range_name: a_ajouter.pop(range_name) for range_name in a_reecrire if range_name in a_ajouter}
+        if onglets_actifs():
+            # Chaque nouvelle ligne rejoint l'onglet de son mois
+            a_ajouter = ecrire_mensuels(service, spreadsheet_id_destination, a_ajouter, partitionnees, ajout=True,
+                                        decroissantes=COLONNES_DATE)
+        for range_name, data_frame in a_ajouter.items():
+            if range_name in COLONNES_DATE:
+                insert_sheet_sorted(service, spreadsheet_id_destination, range_name, data_frame,
+                                    COLONNES_DATE[range_name])
+            else:
+                append_sheet_diff(service, spreadsheet_id_destination, range_name, data_frame)
+
+        # Agrégats journaliers : seuls les (jour, clé) des nouvelles lignes sont recalculés
+        agregats = mettre_a_jour_agregats(kdata_df, derniere_ligne)
+        reecrites.update(agregats)
+        ecrire_sorties(service, spreadsheet_id_destination, reecrites, partitionnees)
+        nouvelles.update(agregats)
+
+        publier_consultation(None if PLAGE_UTILISATEUR in reconstruites else nouvelles.get(PLAGE_UTILISATEUR),
+                             nouvelles.get(PLAGE_SYSTEME), derniere_ligne, ajout=True)
+        sorties.update(nouvelles)
+    if PLAGE_UTILISATEUR in reconstruites:
+        # Transactions rejointes aux dimensions modifiées : l'instantané les remplace, l'état des kiosques est gardé
+        publier_consultation(sorties.get(PLAGE_UTILISATEUR), None, derniere_ligne)
+
+    sauver_watermark(derniere_ligne, date_max(kdata_df, watermark.get("derniere_date")), entetes, dimensions)
+    if historique is not None:
+        memoriser_sources(memoire, derniere_ligne, historique, kiosque_df, cartes_df)
+    elif memoire and memoire.get("derniere_ligne") == watermark["derniere_ligne"]:
+        memoire["kdata"].append(kdata_df)
+        memoire.update({"derniere_ligne": derniere_ligne, "liste kiosque": kiosque_df, "liste_cartes": cartes_df})
+    return sorties
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Construit toutes les tables de jointure en une seule passe.")
+    parser.add_argument("--source", default="https://docs.google.com/spreadsheets/d/1CX5ZU04Rb6vdVB91H5lrW2IebO3cWkkR8QCDaZST7w/edit",
+                        help="URL du classeur source")
+    parser.add_argument("--destination", default="", help="URL du classeur destination")
+    parser.add_argument("--full-rebuild", action="store_true",
+                        help="Ignore le watermark et reconstruit toutes les tables (rattrapage)")
+    parser.add_argument("--offline", action="store_true",
+                        help="Construit les tables depuis le dernier instantané local, sans accès réseau")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Reconstruit les tables par fenêtres de kdata, à mémoire bornée")
+    parser.add_argument("--taille-page", type=int, default=50_000,
+                        help="Nombre de lignes de kdata par fenêtre en mode --streaming")
+    parser.add_argument("--concurrent", type=int, default=0, metavar="N",
+                        help="Lit les plages source avec N lectures parallèles (un client HTTP par thread)")
+    parser.add_argument("--systeme", choices=MODES_SYSTEME, default="complet",
+                        help="Onglet 'Système' : tous les relevés (complet) ou dernier état par kiosque et transitions (etat)")
+    parser.add_argument("--quotas", default="", metavar="CLASSE=N,...",
+                        help="Requêtes par minute autorisées, ex. 'lecture_utilisateur=120,lecture_projet=600'")
+    parser.add_argument("--moteur", choices=MOTEURS, default=moteur_actif(),
+                        help="Moteur de calcul des jointures (par défaut : variable JOINTURE_MOTEUR, sinon pandas)")
+    parser.add_argument("--sortie", choices=SORTIES, default="sheets",
+                        help="Destination des tables dérivées de kdata : Sheets, entrepôt Parquet partitionné par jour, ou les deux")
+    parser.add_argument("--entrepot", default=ENTREPOT_DIR, metavar="DOSSIER",
+                        help="Dossier de l'entrepôt Parquet")
+    parser.add_argument("--fenetre-sheets", type=int, default=0, metavar="JOURS",
+                        help="Avec --sortie sheets+parquet, n'envoie à Sheets que les N derniers jours (0 : tout)")
+    parser.add_argument("--processus", type=int, default=1, metavar="N",
+                        help="Calcule les tables dérivées de kdata dans N processus, partitionnées par deviceID (0 : un par cœur)")
+    parser.add_argument("--garder-doublons", action="store_true",
+                        help="Conserve les transactions de kdata reçues plusieurs fois (même kiosque, carte, date et montant)")
+    parser.add_argument("--onglets-mensuels", action="store_true",
+                        help="Découpe les tables dérivées de kdata en un onglet par mois (ex. 'Operations_2026_10') avec un onglet d'index")
+    parser.add_argument("--consultation", action="store_true",
+                        help="Publie en fin d'exécution l'instantané servi par l'API locale (JointureConsultation.py)")
+    parser.add_argument("--metriques", default=METRIQUES_FILE,
+                        help="Fichier texte Prometheus des métriques de l'exécution, '{nom}' étant remplacé par son nom "
+                             "(dossier textfile de node_exporter)")
+    parser.add_argument("--profil", nargs="?", const="auto", default=None, metavar="ETAPE",
+                        help="Enregistre un profil cProfile de l'étape indiquée (par défaut : la plus lente)")
+    return parser.parse_args()
+
+def lire_quotas(texte):
+    """Convertit 'lecture_utilisateur=120,ecriture_projet=600' en quotas complets (valeurs par défaut sinon)."""
+    quotas = dict(QUOTAS)
+    for element in filter(None, (morceau.strip() for morceau in texte.split(','))):
+        nom, _, valeur = element.partition('=')
+        if nom.strip() not in quotas:
+            raise ValueError(f"Classe de quota inconnue : {nom.strip()} (attendu : {', '.join(quotas)})")
+        quotas[nom.strip()] = int(valeur)
+    return quotas
+
+def main():
+    args = parse_args()
+    demarrer_execution("pipeline", profil=args.profil)
+    succes = False
+    try:
+        configurer_moteur(args.moteur)
+        configurer_puits(args.sortie, args.entrepot, args.fenetre_sheets)
+        configurer_onglets(args.onglets_mensuels)
+        configurer_dedoublonnage(not args.garder_doublons)
+        configurer_parallele(args.processus)
+        configurer_consultation(args.consultation)
+        if args.offline:
+            run_pipeline(None, extract_sheet_id(args.source), None, offline=True, mode_systeme=args.systeme)
+            return
+
+        configurer(lire_quotas(args.quotas))
+
+        # Authentification et création des services
+        service = authenticate_google_sheets()
+        drive_service = authenticate_drive()
+
+        # Extraction des IDs des classeurs source et destination
+        spreadsheet_id_source = extract_sheet_id(args.source)
+        spreadsheet_id_destination = extract_sheet_id(args.destination)
+
+        fabrique = FabriqueClients(charger_credentials(), max_workers=args.concurrent) if args.concurrent else None
+
+        if args.streaming:
+            from JointureStreaming import run_streaming
+            run_streaming(service, spreadsheet_id_source, spreadsheet_id_destination, taille_page=args.taille_page,
+                          fabrique=fabrique, mode_systeme=args.systeme)
+        else:
+            run_incremental(service, spreadsheet_id_source, spreadsheet_id_destination,
+                            full_rebuild=args.full_rebuild, drive_service=drive_service, fabrique=fabrique,
+                            mode_systeme=args.systeme)
+        print("Toutes les tables ont été générées avec succès.")
+        succes = True
+
+    except HttpError as err:
+        print(f"Une erreur s'est produite : {err}")
+    except Exception as e:
+        print(f"Erreur inattendue : {e}")
+    finally:
+        # Réussite : l'exécution n'est marquée réussie que si aucune étape n'a échoué
+        terminer_execution(None if succes else False, metriques=args.metriques)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+import random
+import threading
+import time
+from concurrent.futures import Future
+from googleapiclient.errors import HttpError
+
+from JointureSchema import RENDU_VALEURS
+
+# Quotas par défaut de l'API Google Sheets (requêtes par minute).
+# Chaque requête consomme un jeton du seau « utilisateur » et un du seau « projet »
+# de sa classe (lecture ou écriture).
+QUOTAS = {
+    "lecture_utilisateur": 60,
+    "lecture_projet": 300,
+    "ecriture_utilisateur": 60,
+    "ecriture_projet": 300,
+}
+
+# Codes HTTP pour lesquels une requête est retentée
+CODES_A_RETENTER = {429, 500, 502, 503, 504}
+
+MAX_TENTATIVES = 6
+DELAI_BASE = 1.0      # secondes
+DELAI_MAX = 64.0      # secondes
+
+class SeauJetons:
+    """Seau à jetons : `capacite` jetons au plus, rechargé de `capacite` jetons par `periode` secondes."""
+
+    def __init__(self, capacite, periode=60.0):
+        self.capacite = float(capacite)
+        self.debit = capacite / periode
+        self.jetons = float(capacite)
+        self.dernier = time.monotonic()
+        self.verrou = threading.Lock()
+
+    def _recharger(self):
+        maintenant = time.monotonic()
+        self.jetons = min(self.capacite, self.jetons + (maintenant - self.dernier) * self.debit)
+        self.dernier = maintenant
+
+    def attente(self):
+        """Temps à attendre avant qu'un jeton soit disponible (0 si disponible)."""
+        with self.verrou:
+            self._recharger()
+            return 0.0 if self.jetons >= 1 else (1 - self.jetons) / self.debit
+
+    def prendre(self):
+        """Bloque jusqu'à ce qu'un jeton soit disponible, puis le consomme."""
+        while True:
+            with self.verrou:
+                self._recharger()
+                if self.jetons >= 1:
+                    self.jetons -= 1
+                    return
+                attente = (1 - self.jetons) / self.debit
+            time.sleep(attente)
+
+class Planificateur:
+    """Point de passage unique des requêtes Sheets.
+
+    - limite le débit par classe de quota (seaux à jetons) pour rester sous les
+      quotas par minute sans les dépasser ;
+    - retente les erreurs 429/5xx avec un délai exponentiel aléatoire (« full jitter »),
+      en respectant l'en-tête Retry-After s'il est fourni ;
+    - lorsque le quota est épuisé, regroupe les lectures qui arrivent pendant
+      l'attente d'un jeton sur un même classeur en un seul appel batchGet.
+    """
+
+    def __init__(self, quotas=None, max_tentatives=MAX_TENTATIVES):
+        self.seaux = {nom: SeauJetons(valeur) for nom, valeur in (quotas or QUOTAS).items()}
+        self.max_tentatives = max_tentatives
+        self.appels = 0
+        self.tentatives = 0
+        self.octets_envoyes = 0
+        self.octets_recus = 0
+        self._verrou = threading.Lock()
+        self._en_attente = {}
+
+    def _attente_jetons(self, classe):
+        """Temps à attendre avant que chaque seau de la classe ait un jeton (0 si tous en ont)."""
+        return max((seau.attente() for nom, seau in self.seaux.items() if nom.startswith(classe + "_")), default=0.0)
+
+    def _prendre_jetons(self, classe):
+        for nom, seau in self.seaux.items():
+            if nom.startswith(classe + "_"):
+                seau.prendre()
+
+    def compteurs(self):
+        """Totaux depuis la création du planificateur (appels, nouvelles tentatives, octets envoyés et reçus)."""
+        with self._verrou:
+            return {"appels": self.appels, "tentatives": self.tentatives,
+                    "octets_envoyes": self.octets_envoyes, "octets_recus": self.octets_recus}
+
+    def _compter_reponse(self, reponse):
+        with self._verrou:
+            self.octets_recus += int(reponse.get("content-length", 0) or 0)
+
+    def executer(self, requete, classe="lecture"):
+        """Exécute une requête googleapiclient en respectant les quotas et en retentant les erreurs transitoires."""
+        corps = getattr(requete, "body", None) or ""
+        if hasattr(requete, "add_response_callback"):
+            requete.add_response_callback(self._compter_reponse)
+        for tentative in range(self.max_tentatives):
+            self._prendre_jetons(classe)
+            with self._verrou:
+                self.appels += 1
+                self.octets_envoyes += len(corps)
+                if tentative:
+                    self.tentatives += 1
+            try:
+                return requete.execute()
+            except HttpError as err:
+                if err.resp.status not in CODES_A_RETENTER or tentative == self.max_tentatives - 1:
+                    raise
+                delai = self._delai(tentative, err.resp.get("retry-after"))
+                print(f"Erreur {err.resp.status} ({classe}), nouvelle tentative dans {delai:.1f} s.")
+            except (ConnectionError, TimeoutError) as err:
+                if tentative == self.max_tentatives - 1:
+                    raise
+                delai = self._delai(tentative)
+                print(f"Erreur réseau ({err}), nouvelle tentative dans {delai:.1f} s.")
+            time.sleep(delai)
+
+    def _delai(self, tentative, retry_after=None):
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return random.uniform(0, min(DELAI_MAX, DELAI_BASE * 2 ** tentative))
+
+    def _regrouper(self, cle, element, envoyer):
+        """Ajoute `element` au lot de `cle` = (classeur, classe de quota).
+
+        Le premier arrivé envoie le lot sans délai si un jeton est disponible ; sinon,
+        il attend le jeton et les éléments arrivés pendant cette attente partent
+        dans le même appel.
+        """
+        future = Future()
+        with self._verrou:
+            lot = self._en_attente.setdefault(cle, [])
+            lot.append((element, future))
+            meneur = len(lot) == 1
+        if meneur:
+            attente = self._attente_jetons(cle[1])
+            if attente:
+                time.sleep(attente)
+            with self._verrou:
+                lot = self._en_attente.pop(cle)
+            try:
+                resultats = envoyer([element for element, _ in lot])
+                for (_, f), resultat in zip(lot, resultats):
+                    f.set_result(resultat)
+            except Exception as err:
+                for _, f in lot:
+                    f.set_exception(err)
+        return future.result()
+
+    def lire(self, service, spreadsheet_id, range_name):
+        """Lit une plage ; quand le quota est épuisé, les lectures simultanées du même classeur partagent un batchGet."""
+        def envoyer(ranges):
+            if len(ranges) == 1:
+                result = self.executer(service.spreadsheets().values().get(spreadsheetId=spreadsheet_id, range=ranges[0],
+                                                                           **RENDU_VALEURS))
+                return [result.get("values", [])]
+            result = self.executer(service.spreadsheets().values().batchGet(spreadsheetId=spreadsheet_id, ranges=ranges,
+                                                                            **RENDU_VALEURS))
+            return [value_range.get("values", []) for value_range in result.get("valueRanges", [])]
+        return self._regrouper((spreadsheet_id, "lecture"), range_name, envoyer)
+
+# Planificateur partagé par tout le processus
+PLANIFICATEUR = Planificateur()
+
+def configurer(quotas=None, max_tentatives=MAX_TENTATIVES):
+    """Remplace le planificateur partagé (par exemple avec des quotas relevés dans la console Google Cloud)."""
+    global PLANIFICATEUR
+    PLANIFICATEUR = Planificateur(quotas, max_tentatives)
+    return PLANIFICATEUR
+
+def executer(requete, classe="lecture"):
+    return PLANIFICATEUR.executer(requete, classe)
+
+def compteurs():
+    return PLANIFICATEUR.compteurs()
+
+def lire_plage(service, spreadsheet_id, range_name):
+    return PLANIFICATEUR.lire(service, spreadsheet_id, range_name)
@@ -0,0 +1,149 @@
+import pandas as pd
+
+# Rendu demandé pour toutes les lectures de feuilles source : valeurs non formatées
+# (un nombre revient comme nombre, quels que soient le format d'affichage et la langue
+# du classeur) et dates en numéro de série, converties sans ambiguïté jour / mois.
+RENDU_VALEURS = {"valueRenderOption": "UNFORMATTED_VALUE", "dateTimeRenderOption": "SERIAL_NUMBER"}
+
+# Origine des numéros de série de dates de Google Sheets (jour 0)
+ORIGINE_SERIE = "1899-12-30"
+
+# Schéma déclaré de chaque feuille source.
+#  - categories : identifiants et libellés très répétés, stockés une seule fois par valeur
+#  - numeriques : montants et mesures, convertis en nombres (cellule vide -> NaN, invalide -> NaN signalé)
+#  - dates : converties une seule fois en datetime64 (cellule vide -> NaT, invalide -> NaT signalé)
+# Les colonnes absentes d'une plage sont simplement ignorées.
+SCHEMAS = {
+    "kdata": {
+        "categories": ["deviceID", "card_UID", "Localisation", "EtatSim800L", "EtatRFID", "EtatRTC",
+                       "EtatLCD", "EtatWire", "EtatDebimetre"],
+        "numeriques": ["Montant", "Volume", "dureeDis", "Batterie Voltage", "Duree de Fonctionnement"],
+        "dates": ["date", "Date"],
+    },
+    "liste kiosque": {
+        "categories": ["deviceID", "Numéro", "Localisation", "Fonctionnalité", "kiosque", "adresse"],
+        "numeriques": [],
+        "dates": [],
+    },
+    "liste_cartes": {
+        "categories": ["card_UID"],
+        "numeriques": [],
+        "dates": [],
+    },
+}
+
+def nom_feuille(range_name):
+    """Retourne le nom de la feuille d'une plage. Exemple : "liste kiosque!A:E" -> "liste kiosque"."""
+    return range_name.split('!')[0].strip("'")
+
+def _texte(valeur):
+    """Cellule lue non formatée, sous forme de texte : 12345 -> '12345', 1.5 -> '1.5', True -> 'TRUE'."""
+    if isinstance(valeur, str):
+        return valeur
+    if isinstance(valeur, bool):
+        return "TRUE" if valeur else "FALSE"
+    if isinstance(valeur, float) and valeur.is_integer():
+        return str(int(valeur))
+    return str(valeur)
+
+def en_textes(serie):
+    """Colonne de textes : les nombres et booléens renvoyés non formatés (ex. identifiants numériques) deviennent des textes."""
+    if isinstance(serie.dtype, pd.StringDtype):
+        return serie
+    return pd.Series([_texte(valeur) for valeur in serie], index=serie.index, dtype="str")
+
+def _non_vides(serie):
+    """Cellules non vides d'une colonne lue (texte non blanc, nombre ou booléen)."""
+    if isinstance(serie.dtype, pd.StringDtype):
+        return serie.str.strip().ne("").fillna(False)
+    return serie.map(lambda valeur: not isinstance(valeur, str) or valeur.strip() != "").astype(bool)
+
+def _signaler(serie, converties, col, feuille, type_cible):
+    """Affiche le nombre de cellules non vides qui n'ont pas pu être converties (laissées vides)."""
+    manquantes = converties.isna()
+    if not manquantes.any():
+        return
+    echecs = serie[manquantes][_non_vides(serie[manquantes])]
+    if len(echecs):
+        exemples = ", ".join(repr(valeur) for valeur in echecs.drop_duplicates().head(3))
+        print(f"{len(echecs)} cellule(s) de '{col}'{f' ({feuille})' if feuille else ''} non convertible(s) en {type_cible}, "
+              f"laissée(s) vide(s) : {exemples}")
+
+def en_nombres(serie, col="", feuille=""):
+    """Convertit une colonne en nombres.
+
+    Les nombres lus non formatés (RENDU_VALEURS) sont conservés tels quels. Les
+    textes sont convertis directement, puis, à défaut, au format français ('1 500',
+    '1,5' : espaces retirés, virgule décimale). Les cellules non vides restées non
+    convertibles deviennent NaN et sont signalées.
+    """
+    nombres = pd.to_numeric(serie, errors='coerce')
+    if not pd.api.types.is_numeric_dtype(serie.dtype):
+        restantes = nombres.isna()
+        restantes[restantes] = _non_vides(serie[restantes])
+        if restantes.any():
+            textes = en_textes(serie[restantes]).str.replace("[\\s\u00a0\u202f]", "", regex=True) \
+                .str.replace(",", ".", regex=False)
+            nombres = nombres.astype("float64")
+            nombres[restantes] = pd.to_numeric(textes, errors='coerce')
+        _signaler(serie, nombres, col, feuille, "nombre")
+    return nombres
+
+def en_dates(serie, col="", feuille=""):
+    """Convertit une colonne en dates.
+
+    Les dates lues non formatées arrivent en numéro de série (jours depuis
+    ORIGINE_SERIE, voir RENDU_VALEURS) et sont converties sans ambiguïté. Les
+    textes sont analysés directement, puis, à défaut, sous tous les formats usuels
+    en lisant le jour avant le mois ('18/10/2026 10:00'). Les cellules non vides
+    restées non convertibles deviennent NaT et sont signalées.
+    """
+    if pd.api.types.is_numeric_dtype(serie.dtype) and not pd.api.types.is_bool_dtype(serie.dtype):
+        return pd.to_datetime(serie, unit="D", origin=ORIGINE_SERIE).dt.round("s").astype("datetime64[us]")
+    series = serie.map(lambda valeur: isinstance(valeur, (int, float)) and not isinstance(valeur, bool)) \
+        if serie.dtype == object else pd.Series(False, index=serie.index)
+    textes = serie.where(~series, "") if series.any() else serie
+    dates = pd.to_datetime(textes, errors='coerce')
+    restantes = dates.isna()
+    restantes[restantes] = _non_vides(textes[restantes])
+    if restantes.any():
+        relues = pd.to_datetime(en_textes(textes[restantes]), errors='coerce', format="mixed", dayfirst=True)
+        dates = dates.astype("datetime64[us]")
+        dates[restantes] = relues.astype("datetime64[us]")
+    if series.any():
+        dates = dates.astype("datetime64[us]")
+        dates[series] = pd.to_datetime(pd.to_numeric(serie[series]), unit="D", origin=ORIGINE_SERIE).dt.round("s")
+    _signaler(serie, dates, col, feuille, "date")
+    return dates
+
+def typer_dataframe(data_frame, schema, feuille=""):
+    """Convertit les colonnes d'un DataFrame lu dans Google Sheets selon un schéma déclaré (voir typer_colonne)."""
+    if data_frame.empty:
+        return data_frame
+    data_frame = data_frame.copy()
+    for j, col in enumerate(data_frame.columns):
+        data_frame.isetitem(j, typer_colonne(data_frame.iloc[:, j], col, schema, feuille))
+    return data_frame
+
+def typer_colonne(serie, col, schema, feuille=""):
+    """Convertit une seule colonne selon le schéma.
+
+    Catégories et colonnes que le schéma ne cite pas restent des textes (voir
+    en_textes) ; nombres et dates passent par en_nombres et en_dates, qui
+    signalent les cellules non convertibles.
+    """
+    if col in schema["numeriques"]:
+        return en_nombres(serie, col, feuille)
+    if col in schema["dates"]:
+        return en_dates(serie, col, feuille)
+    serie = en_textes(serie)
+    if col in schema["categories"]:
+        serie = serie.astype("category")
+    return serie
+
+def typer_plage(data_frame, range_name):
+    """Applique le schéma de la feuille de `range_name`, s'il en existe un."""
+    schema = SCHEMAS.get(nom_feuille(range_name))
+    if schema is None:
+        return data_frame
+    return typer_dataframe(data_frame, schema, nom_feuille(range_name))
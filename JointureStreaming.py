@@ -0,0 +1,262 @@
+import itertools
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+
+from JointureColonnes import DIMENSION_COLONNES, colonnes_vers_dataframe, entetes_colonnes, nombre_lignes
+from JointureAgregats import mettre_a_jour_agregats
+from JointureFetch import get_pages_concurrent
+from JointureMetriques import etape, instrumenter
+from JointureScheduler import executer
+from JointureSchema import RENDU_VALEURS
+from JointureWatermark import sauver_watermark, date_max, plage_entetes
+from JointureWriter import dataframe_to_values, oublier_empreintes, _plage_lignes, CELLULES_MAX_PAR_REQUETE
+from JointureDoublons import dedoublonner
+from JointureConsultation import ajouter_consultation, commencer_consultation, terminer_consultation
+from JointureOnglets import creer_onglets, ecrire_sorties, enregistrer_mois, lots_par_mois, onglets_actifs, plage_mensuelle
+from JointureParquet import (commencer_reconstruction, ecrire_partitions, fenetre_active, lire_fenetre,
+                             publier_reconstruction, sortie_parquet, sortie_sheets)
+from JointurePipeline import (COLONNES_DATE, PLAGES_SOURCE, PLAGE_SYSTEME, PLAGE_CARTES, PLAGE_TRANSITIONS,
+                              PLAGE_UTILISATEUR, build_all_tables, empreintes_dimensions, read_sheets_batch,
+                              tables_partitionnees, tables_systeme_etat)
+
+# Nombre de lignes de kdata lues et traitées à la fois
+TAILLE_PAGE = 50_000
+
+# Nombre de lignes relues à la fois depuis chaque segment trié lors de la fusion
+TAILLE_LOT_FUSION = 10_000
+
+def plage_page(range_name, premiere, derniere):
+    """Plage d'une fenêtre de lignes. Exemple : plage_page("kdata!A:J", 2, 50001) -> "kdata!A2:J50001"."""
+    feuille, colonnes = range_name.split('!')
+    debut, fin = colonnes.split(':')
+    return f"{feuille}!{debut}{premiere}:{fin}{derniere}"
+
+def lire_kdata_par_pages(service, spreadsheet_id, range_name=PLAGES_SOURCE["kdata"], taille_page=TAILLE_PAGE,
+                         fabrique=None):
+    """Parcourt kdata par fenêtres de `taille_page` lignes et produit un DataFrame typé par fenêtre.
+
+    Seule une fenêtre est traitée à la fois. Avec une `fabrique` de clients, les
+    fenêtres suivantes (une par thread de la fabrique) sont téléchargées en
+    parallèle pendant le traitement de la fenêtre courante. Les fenêtres sont lues
+    par colonnes (voir colonnes_vers_dataframe). S'arrête à la première fenêtre incomplète.
+    """
+    resultat = executer(service.spreadsheets().values().get(spreadsheetId=spreadsheet_id, range=plage_entetes(range_name),
+                                                            majorDimension=DIMENSION_COLONNES, **RENDU_VALEURS))
+    entetes = entetes_colonnes(resultat.get("values", []))
+    if not entetes:
+        print(f"Aucune donnée trouvée dans la plage : {range_name}")
+        return
+
+    plages = (plage_page(range_name, premiere, premiere + taille_page - 1)
+              for premiere in itertools.count(2, taille_page))
+    if fabrique is not None:
+        pages = get_pages_concurrent(fabrique, spreadsheet_id, plages, fabrique.max_workers, DIMENSION_COLONNES)
+    else:
+        pages = (executer(service.spreadsheets().values().get(spreadsheetId=spreadsheet_id, range=plage,
+                                                              majorDimension=DIMENSION_COLONNES, **RENDU_VALEURS))
+                 .get("values", [])
+                 for plage in plages)
+
+    pages = iter(pages)
+    while True:
+        # Seuls l'attente et le typage de la fenêtre sont mesurés, pas son traitement par l'appelant
+        with etape("read_sheet") as mesure:
+            colonnes = next(pages, [])
+            lignes = nombre_lignes(colonnes)
+            page = colonnes_vers_dataframe(colonnes, range_name, entetes) if lignes else None
+            mesure["lignes_sortie"] = lignes
+        if page is not None:
+            yield page
+        if lignes < taille_page:
+            return
+
+def cle_tri(data_frame, colonne):
+    """Clé numérique de tri par date (NaT = plus petite valeur, donc en fin d'ordre décroissant)."""
+    dates = pd.to_datetime(data_frame[colonne], errors='coerce')
+    return dates.to_numpy(dtype="datetime64[ns]").view(np.int64)
+
+class SegmentTrie:
+    """Résultat trié d'une fenêtre, déversé sur disque par lots et relu lot par lot."""
+
+    def __init__(self, dossier, numero, data_frame, colonne, taille_lot=TAILLE_LOT_FUSION):
+        self.fichiers = []
+        self.colonne = colonne
+        for i, debut in enumerate(range(0, len(data_frame), taille_lot)):
+            chemin = os.path.join(dossier, f"segment_{numero}_{i}.pkl")
+            data_frame.iloc[debut:debut + taille_lot].to_pickle(chemin)
+            self.fichiers.append(chemin)
+
+    def lots(self):
+        for chemin in self.fichiers:
+            lot = pd.read_pickle(chemin)
+            os.remove(chemin)
+            yield lot
+
+def fusionner_par_date(segments, colonne):
+    """Fusion externe de segments triés par date décroissante (tri stable), dans l'ordre des fenêtres de kdata.
+
+    Produit des lots successifs dans l'ordre d'un tri stable de toute la table
+    (sort_values(ascending=False, kind="stable"), NaT en fin) : à date égale, les
+    lignes d'un segment précèdent celles des segments suivants. Soit `seuil` la
+    plus grande des dernières dates en mémoire des segments non épuisés, et
+    `premier` le premier de ces segments dont la dernière date vaut `seuil` : les
+    lignes non lues ne dépassent pas `seuil`, et seules celles des segments à
+    partir de `premier` peuvent l'égaler. Sont donc émises les lignes de date
+    supérieure à `seuil`, et celles de date égale des segments jusqu'à `premier`
+    inclus. La mémoire reste bornée à un lot par segment.
+    """
+    curseurs = [segment.lots() for segment in segments]
+    tampons = [None] * len(curseurs)
+    while True:
+        for i, curseur in enumerate(curseurs):
+            if curseur is not None and (tampons[i] is None or tampons[i].empty):
+                tampons[i] = next(curseur, None)
+                if tampons[i] is None:
+                    curseurs[i] = None
+        actifs = [i for i, tampon in enumerate(tampons) if tampon is not None and not tampon.empty]
+        if not actifs:
+            return
+        cles = {i: cle_tri(tampons[i], colonne) for i in actifs}
+        dernieres = {i: cles[i][-1] for i in actifs if curseurs[i] is not None}
+        parties = []
+        for i in actifs:
+            if dernieres:
+                seuil = max(dernieres.values())
+                premier = min(j for j, derniere in dernieres.items() if derniere == seuil)
+                masque = (cles[i] > seuil) | ((cles[i] == seuil) & (i <= premier))
+            else:
+                # Tous les segments sont lus : tout ce qui reste en mémoire est émis
+                masque = np.ones(len(cles[i]), dtype=bool)
+            parties.append(tampons[i][masque])
+            tampons[i] = tampons[i][~masque]
+        lot = pd.concat(parties)
+        # Clé inversée (~ : décroissante sans débordement, NaT en dernier) et tri stable :
+        # à date égale, l'ordre des segments puis celui de chaque segment est conservé
+        yield lot.iloc[np.argsort(~cle_tri(lot, colonne), kind="stable")]
+
+@instrumenter("write_sheet")
+def ecrire_en_flux(service, spreadsheet_id, range_name, lots, cellules_max=CELLULES_MAX_PAR_REQUETE):
+    """Écrit une table lot par lot (en-têtes puis lignes), puis efface les anciennes lignes en trop."""
+    # Empreintes oubliées avant le premier lot : une écriture interrompue laisse la plage à relire
+    oublier_empreintes(spreadsheet_id, range_name)
+    valeurs = service.spreadsheets().values()
+    ligne_courante = 1
+    largeur = 0
+    for numero, lot in enumerate(lots):
+        lignes = dataframe_to_values(lot)
+        if numero > 0:
+            lignes = lignes[1:]
+        largeur = len(lot.columns)
+        pas = max(cellules_max // max(largeur, 1), 1)
+        for debut in range(0, len(lignes), pas):
+            morceau = lignes[debut:debut + pas]
+            executer(valeurs.update(spreadsheetId=spreadsheet_id,
+                                    range=_plage_lignes(range_name, ligne_courante, ligne_courante + len(morceau) - 1, largeur),
+                                    valueInputOption="RAW", body={'values': morceau}), "ecriture")
+            ligne_courante += len(morceau)
+    if largeur:
+        feuille, colonnes = range_name.split('!')
+        debut, fin = colonnes.split(':')
+        executer(valeurs.clear(spreadsheetId=spreadsheet_id, range=f"{feuille}!{debut}{ligne_courante}:{fin}"), "ecriture")
+    print(f"{ligne_courante - 2} ligne(s) écrites en flux dans la plage : {range_name}")
+    return ligne_courante - 2
+
+def run_streaming(service, spreadsheet_id_source, spreadsheet_id_destination, taille_page=TAILLE_PAGE,
+                  fabrique=None, mode_systeme="complet"):
+    """Reconstruit les tables dérivées de kdata à mémoire bornée, quelle que soit la taille de l'historique.
+
+    Les petites feuilles de dimension sont lues une fois. kdata est parcourue par
+    fenêtres ; chaque fenêtre est enrichie et triée par les fonctions generate_*,
+    puis déversée sur disque. Les segments sont enfin fusionnés par date et
+    écrits lot par lot. En mode_systeme "etat", l'état des kiosques est suivi
+    fenêtre après fenêtre et seuls l'état final et les transitions sont écrits.
+    Avec une sortie Parquet, chaque fenêtre est aussi ajoutée à une reconstruction
+    de l'entrepôt, publiée à la fin ; une fenêtre Sheets est alors relue depuis l'entrepôt.
+    Si l'instantané de consultation est activé, la table 'Utilisateur' de chaque
+    fenêtre y est ajoutée en un segment sur disque et l'état des kiosques y est
+    réduit fenêtre après fenêtre ; l'instantané est publié à la fin (voir
+    commencer_consultation).
+    """
+    kiosque_df, cartes_df = read_sheets_batch(
+        service, spreadsheet_id_source, [PLAGES_SOURCE["liste kiosque"], PLAGES_SOURCE["liste_cartes"]])
+
+    partitionnees = tables_partitionnees(mode_systeme) if sortie_parquet() else {}
+    # Tables envoyées en entier à Sheets par fusion des segments triés
+    en_flux = COLONNES_DATE if sortie_sheets() and not fenetre_active() else {}
+    dossier = tempfile.mkdtemp(prefix="jointure_flux_")
+    try:
+        segments = {range_name: [] for range_name in en_flux}
+        reconstructions = {}
+        total, derniere_date, entetes = 0, None, []
+        etat_systeme, transitions = None, []
+        consultation = commencer_consultation()
+        compteur = 0
+        for numero, page in enumerate(lire_kdata_par_pages(service, spreadsheet_id_source, taille_page=taille_page,
+                                                                    fabrique=fabrique)):
+            premiere_ligne = total + 2
+            total += len(page)
+            # Chaque fenêtre est comparée aux précédentes par l'index des transactions déjà vues
+            page = dedoublonner(page, premiere_ligne, reinitialiser=numero == 0)
+            derniere_date = date_max(page, derniere_date)
+            entetes = page.columns
+            sorties = build_all_tables(page, kiosque_df, cartes_df, systeme_complet=mode_systeme == "complet")
+            agregats = mettre_a_jour_agregats(page, total + 1, reinitialiser=numero == 0)
+            if mode_systeme == "etat":
+                tables_systeme = tables_systeme_etat(page, total + 1, reinitialiser=numero == 0)
+                if tables_systeme:
+                    etat_systeme = tables_systeme[PLAGE_SYSTEME]
+                    transitions.append(tables_systeme[PLAGE_TRANSITIONS])
+                    sorties[PLAGE_TRANSITIONS] = tables_systeme[PLAGE_TRANSITIONS]
+            for range_name, colonne in partitionnees.items():
+                if range_name in sorties:
+                    if range_name not in reconstructions:
+                        reconstructions[range_name] = commencer_reconstruction(range_name)
+                    ecrire_partitions(reconstructions[range_name], sorties[range_name], colonne, total + 1,
+                                      premiere_ligne)
+            ajouter_consultation(consultation, sorties.get(PLAGE_UTILISATEUR),
+                                 sorties.get(PLAGE_SYSTEME) if mode_systeme == "complet" else None)
+            for range_name, colonne in en_flux.items():
+                if range_name in sorties:
+                    segments[range_name].append(SegmentTrie(dossier, compteur, sorties[range_name], colonne))
+                    compteur += 1
+            print(f"Fenêtre {numero + 1} traitée ({total} lignes de kdata au total).")
+
+        for range_name in reconstructions:
+            publier_reconstruction(range_name)
+        for range_name, colonne in en_flux.items():
+            if not segments[range_name]:
+                continue
+            lots = fusionner_par_date(segments[range_name], colonne)
+            if not onglets_actifs():
+                ecrire_en_flux(service, spreadsheet_id_destination, range_name, lots)
+                continue
+            # Flux fusionné par date décroissante : chaque mois est écrit d'un trait dans son onglet
+            lignes_par_mois = {}
+            for mois, lots_du_mois in lots_par_mois(lots, colonne):
+                plage = plage_mensuelle(range_name, mois)
+                creer_onglets(service, spreadsheet_id_destination, [plage])
+                lignes_par_mois[mois] = ecrire_en_flux(service, spreadsheet_id_destination, plage, lots_du_mois)
+            enregistrer_mois(service, spreadsheet_id_destination, range_name, lignes_par_mois)
+    finally:
+        shutil.rmtree(dossier, ignore_errors=True)
+
+    petites_tables = {PLAGE_CARTES: cartes_df} if not cartes_df.empty else {}
+    if total:
+        petites_tables.update(agregats)
+    if etat_systeme is not None:
+        petites_tables[PLAGE_SYSTEME] = etat_systeme
+        petites_tables[PLAGE_TRANSITIONS] = pd.concat(transitions, ignore_index=True).sort_values(by='Date', kind='stable')
+    for range_name in reconstructions:
+        # Tables partitionnées : rien dans Sheets en sortie "parquet", sinon la fenêtre récente
+        if not sortie_sheets():
+            petites_tables.pop(range_name, None)
+        elif fenetre_active():
+            petites_tables[range_name] = lire_fenetre(range_name)
+    if petites_tables:
+        ecrire_sorties(service, spreadsheet_id_destination, petites_tables, tables_partitionnees(mode_systeme))
+    if total:
+        terminer_consultation(consultation, total + 1, etat_systeme)
+        sauver_watermark(total + 1, derniere_date, entetes, empreintes_dimensions(kiosque_df, cartes_df))
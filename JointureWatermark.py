@@ -0,0 +1,86 @@
+import hashlib
+import json
+import os
+import pandas as pd
+
+# Dossier où sont conservés les états persistés entre deux exécutions
+ETAT_DIR = ".jointure_etat"
+WATERMARK_FILE = os.path.join(ETAT_DIR, "watermark.json")
+
+def charger_etat(chemin, defaut=None):
+    """Charge un état JSON persisté, ou retourne `defaut` s'il n'existe pas encore."""
+    if not os.path.exists(chemin):
+        return defaut
+    with open(chemin, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def sauver_etat(chemin, etat):
+    """Écrit un état JSON de façon atomique (fichier temporaire puis renommage)."""
+    os.makedirs(os.path.dirname(chemin) or ".", exist_ok=True)
+    temporaire = chemin + ".tmp"
+    with open(temporaire, "w", encoding="utf-8") as f:
+        json.dump(etat, f, ensure_ascii=False, indent=2)
+    os.replace(temporaire, chemin)
+
+def charger_watermark(chemin=WATERMARK_FILE):
+    """Retourne le dernier watermark de kdata, ou None si aucune exécution n'a été enregistrée.
+
+    Le watermark contient :
+      - 'derniere_ligne' : numéro (1-indexé, en-tête compris) de la dernière ligne traitée
+      - 'derniere_date' : date la plus récente rencontrée dans les lignes traitées
+      - 'entetes' : en-têtes de kdata au moment du traitement
+      - 'dimensions' : empreinte de chaque feuille de dimension lue (voir empreinte_feuille)
+    """
+    return charger_etat(chemin)
+
+def sauver_watermark(derniere_ligne, derniere_date, entetes, dimensions=None, chemin=WATERMARK_FILE):
+    """Enregistre le watermark de kdata après un traitement réussi."""
+    sauver_etat(chemin, {
+        "derniere_ligne": int(derniere_ligne),
+        "derniere_date": derniere_date,
+        "entetes": list(entetes),
+        "dimensions": dimensions,
+    })
+
+def empreinte_feuille(data_frame):
+    """Empreinte du contenu d'une feuille lue (en-têtes et valeurs), pour savoir si elle a changé."""
+    empreinte = hashlib.sha1("\x1f".join(map(str, data_frame.columns)).encode("utf-8"))
+    if not data_frame.empty:
+        empreinte.update(pd.util.hash_pandas_object(data_frame, index=False).to_numpy().tobytes())
+    return empreinte.hexdigest()
+
+def date_max(kdata_df, precedente=None):
+    """Retourne la date la plus récente de kdata (colonne 'date' ou 'Date') sous forme de texte."""
+    for col in ("date", "Date"):
+        if col in kdata_df.columns:
+            dates = pd.to_datetime(kdata_df[col], errors='coerce').dropna()
+            if not dates.empty:
+                courante = dates.max()
+                if precedente and pd.Timestamp(precedente) > courante:
+                    return precedente
+                return courante.strftime("%Y-%m-%d %H:%M:%S")
+    return precedente
+
+def plage_increment(range_name, derniere_ligne):
+    """Construit la plage des nouvelles lignes à partir d'une plage pleine colonne.
+
+    Exemple : plage_increment("kdata!A:J", 120) -> "kdata!A121:J"
+    """
+    feuille, colonnes = range_name.split('!')
+    debut, fin = colonnes.split(':')
+    return f"{feuille}!{debut}{derniere_ligne + 1}:{fin}"
+
+def plage_historique(range_name, derniere_ligne):
+    """Plage des lignes déjà traitées, sans les en-têtes.
+
+    Exemple : plage_historique("kdata!A:J", 120) -> "kdata!A2:J120"
+    """
+    feuille, colonnes = range_name.split('!')
+    debut, fin = colonnes.split(':')
+    return f"{feuille}!{debut}2:{fin}{derniere_ligne}"
+
+def plage_entetes(range_name):
+    """Retourne la plage de la ligne d'en-têtes. Exemple : "kdata!A:J" -> "kdata!A1:J1"."""
+    feuille, colonnes = range_name.split('!')
+    debut, fin = colonnes.split(':')
+    return f"{feuille}!{debut}1:{fin}1"
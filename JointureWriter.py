@@ -0,0 +1,441 @@
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+
+from JointureMetriques import instrumenter
+from JointureScheduler import executer
+from JointureWatermark import ETAT_DIR, charger_etat, sauver_etat
+
+# Empreintes des blocs de lignes déjà écrits, par classeur et par plage
+EMPREINTES_FILE = os.path.join(ETAT_DIR, "empreintes.json")
+
+# Format des empreintes mémorisées : celles d'un autre format sont relues depuis la feuille
+VERSION_EMPREINTES = 2
+
+# Nombre de lignes par bloc comparé
+TAILLE_BLOC = 500
+
+# Nombre maximal de cellules envoyées dans un même appel batchUpdate
+CELLULES_MAX_PAR_REQUETE = 100_000
+
+# Identifiants (sheetId) des onglets, par classeur, nécessaires aux insertions et suppressions de lignes
+_IDENTIFIANTS = {}
+
+def dataframe_to_values(data_frame):
+    """Convertit un DataFrame en lignes sérialisables pour l'API Google Sheets (en-têtes compris).
+
+    Les nombres décimaux entiers (4200.0) sont envoyés comme des entiers, tels que
+    la feuille les renvoie en UNFORMATTED_VALUE : les empreintes locales et
+    distantes d'un même contenu sont ainsi identiques.
+    """
+    data_frame = data_frame.copy()
+    for col in data_frame.select_dtypes(include=["datetime", "datetimetz"]).columns:
+        data_frame[col] = data_frame[col].dt.strftime("%Y-%m-%d %H:%M:%S")
+    for col in data_frame.select_dtypes(include="float").columns:
+        nombres = data_frame[col].to_numpy(dtype="float64", na_value=np.nan)
+        entiers = np.isfinite(nombres) & (np.trunc(nombres) == nombres) & (np.abs(nombres) < 2 ** 53)
+        if entiers.any():
+            valeurs = data_frame[col].to_numpy(dtype=object, copy=True)
+            valeurs[entiers] = nombres[entiers].astype("int64").tolist()
+            data_frame[col] = valeurs
+    data_frame = data_frame.astype(object).where(data_frame.notna(), "")
+    return [data_frame.columns.tolist()] + data_frame.values.tolist()
+
+def _lettre_colonne(indice):
+    """Convertit un indice de colonne (1, 10, 28) en lettres ('A', 'J', 'AB')."""
+    lettres = ""
+    while indice:
+        indice, reste = divmod(indice - 1, 26)
+        lettres = chr(ord('A') + reste) + lettres
+    return lettres
+
+def _indice_colonne(lettres):
+    indice = 0
+    for lettre in lettres.upper():
+        indice = indice * 26 + (ord(lettre) - ord('A') + 1)
+    return indice
+
+def _plage_lignes(range_name, premiere, derniere, largeur):
+    """Plage A1 couvrant les lignes [premiere, derniere] (1-indexées) sur `largeur` colonnes.
+
+    Exemple : _plage_lignes("Operations!A:I", 2, 501, 7) -> "Operations!A2:G501"
+    """
+    feuille, colonnes = range_name.split('!')
+    debut = ''.join(c for c in colonnes.split(':')[0] if c.isalpha())
+    fin = _lettre_colonne(_indice_colonne(debut) + max(largeur, 1) - 1)
+    return f"{feuille}!{debut}{premiere}:{fin}{derniere}"
+
+def _valeur_normalisee(valeur):
+    """Cellule lue dans la feuille, sous la forme produite par dataframe_to_values (4200.0 -> 4200)."""
+    if isinstance(valeur, float) and valeur.is_integer() and abs(valeur) < 2 ** 53:
+        return int(valeur)
+    return valeur
+
+def _empreinte(lignes):
+    contenu = json.dumps(lignes, ensure_ascii=False, default=str, separators=(',', ':'))
+    return hashlib.blake2b(contenu.encode("utf-8"), digest_size=16).hexdigest()
+
+def empreintes_debut(lignes, taille_bloc=TAILLE_BLOC):
+    """Empreintes des blocs de `taille_bloc` lignes comptés depuis la première ligne."""
+    return [_empreinte(lignes[i:i + taille_bloc]) for i in range(0, len(lignes), taille_bloc)]
+
+def empreintes_fin(lignes, taille_bloc=TAILLE_BLOC):
+    """Empreintes des blocs de `taille_bloc` lignes comptés depuis la dernière ligne (le premier bloc est le dernier de la table).
+
+    Des lignes insérées en tête d'une table triée par date décroissante ne
+    modifient que le bloc le plus haut : les autres gardent leur empreinte.
+    """
+    return [_empreinte(lignes[max(fin - taille_bloc, 0):fin]) for fin in range(len(lignes), 0, -taille_bloc)]
+
+def etat_empreintes(values, taille_bloc=TAILLE_BLOC):
+    """Empreintes d'une plage (en-têtes compris) : ligne d'en-têtes, puis lignes de données ancrées au début et à la fin."""
+    donnees = values[1:]
+    return {"version": VERSION_EMPREINTES, "lignes": len(values), "largeur": len(values[0]) if values else 0,
+            "taille_bloc": taille_bloc, "entetes": _empreinte(values[:1]),
+            "debut": empreintes_debut(donnees, taille_bloc), "fin": empreintes_fin(donnees, taille_bloc)}
+
+def _cle(spreadsheet_id, range_name):
+    return f"{spreadsheet_id}|{range_name}"
+
+def _feuille(range_name):
+    return range_name.split('!')[0].strip("'")
+
+def identifiant_onglet(service, spreadsheet_id, titre):
+    """sheetId d'un onglet (titres relus une fois par classeur, puis à nouveau si l'onglet est inconnu), ou None."""
+    identifiants = _IDENTIFIANTS.get(spreadsheet_id)
+    if identifiants is None or titre not in identifiants:
+        resultat = executer(service.spreadsheets().get(spreadsheetId=spreadsheet_id,
+                                                       fields="sheets.properties(sheetId,title)"))
+        identifiants = _IDENTIFIANTS[spreadsheet_id] = {
+            feuille["properties"]["title"]: feuille["properties"]["sheetId"] for feuille in resultat.get("sheets", [])}
+    return identifiants.get(titre)
+
+def _requete_lignes(action, sheet_id, debut, fin):
+    """Requête spreadsheets().batchUpdate insérant (insertDimension) ou supprimant (deleteDimension) les lignes [debut, fin[ (0-indexées)."""
+    plage = {"sheetId": sheet_id, "dimension": "ROWS", "startIndex": debut, "endIndex": fin}
+    if action == "insertDimension":
+        return {action: {"range": plage, "inheritFromBefore": False}}
+    return {action: {"range": plage}}
+
+def lire_empreintes_distantes(service, spreadsheet_id, range_name, taille_bloc=TAILLE_BLOC):
+    """Lit le contenu actuel d'une plage et en calcule les empreintes de blocs.
+
+    Utilisé lorsqu'aucune empreinte n'a encore été mémorisée pour cette plage. Les
+    valeurs sont lues non formatées (UNFORMATTED_VALUE) : un nombre revient tel
+    qu'il a été écrit, quel que soit le format d'affichage ou la langue du classeur.
+    """
+    result = executer(service.spreadsheets().values().get(spreadsheetId=spreadsheet_id, range=range_name,
+                                                          valueRenderOption="UNFORMATTED_VALUE"))
+    values = result.get("values", [])
+    largeur = len(values[0]) if values else 0
+    values = [[_valeur_normalisee(valeur) for valeur in ligne] + [""] * (largeur - len(ligne)) for ligne in values]
+    return etat_empreintes(values, taille_bloc)
+
+def _bornes(premiere, derniere, taille_bloc):
+    """Bornes [debut, fin[ des blocs de `taille_bloc` lignes entre `premiere` et `derniere`."""
+    return [(i, min(i + taille_bloc, derniere)) for i in range(premiere, derniere, taille_bloc)]
+
+def _blocs(range_name, donnees, bornes, largeur):
+    """Mises à jour {'range', 'values'} des lignes de données [debut, fin[ de chaque borne (la ligne 2 est la première)."""
+    return [{'range': _plage_lignes(range_name, debut + 2, fin + 1, largeur), 'values': donnees[debut:fin]}
+            for debut, fin in bornes]
+
+def planifier_ecriture(range_name, values, precedent, taille_bloc=TAILLE_BLOC, decalage_possible=True):
+    """Compare les lignes à écrire aux empreintes précédentes.
+
+    Deux alignements sont évalués et le moins coûteux en lignes écrites est retenu :
+      - blocs comptés depuis le début : ajout pur en fin de feuille ou réécriture des blocs modifiés ;
+      - blocs comptés depuis la fin (si `decalage_possible`) : des lignes sont insérées
+        ou supprimées en tête de table, puis seuls les blocs modifiés sont réécrits.
+        C'est le cas des tables triées par date décroissante, qui reçoivent leurs
+        nouvelles lignes en tête.
+
+    Retourne (mises_a_jour, ajout, plage_a_effacer, decalage, etat) où :
+      - mises_a_jour est une liste de {'range', 'values'} pour les blocs modifiés ;
+      - ajout est la liste des lignes à ajouter en fin de feuille (ajout pur), ou None ;
+      - plage_a_effacer est la plage des anciennes cellules à vider avant l'écriture, ou None ;
+      - decalage est le nombre de lignes à insérer (> 0) ou supprimer (< 0) sous les en-têtes avant l'écriture ;
+      - etat est le nouvel état d'empreintes à mémoriser.
+    """
+    etat = etat_empreintes(values, taille_bloc)
+    largeur = etat["largeur"]
+    donnees = values[1:]
+    nouvelles = len(donnees)
+
+    plage_a_effacer = None
+    if precedent is not None and (precedent["largeur"] != largeur or precedent["taille_bloc"] != taille_bloc):
+        # Structure différente : l'ancien contenu est effacé puis tous les blocs sont écrits
+        if precedent["lignes"]:
+            plage_a_effacer = _plage_lignes(range_name, 1, precedent["lignes"], precedent["largeur"])
+        precedent = None
+    if precedent is None or not precedent["lignes"]:
+        mises_a_jour = [{'range': _plage_lignes(range_name, 1, 1, largeur), 'values': values[:1]}] if values else []
+        mises_a_jour += _blocs(range_name, donnees, _bornes(0, nouvelles, taille_bloc), largeur)
+        return mises_a_jour, None, plage_a_effacer, 0, etat
+
+    anciennes = precedent["lignes"] - 1
+    entetes = [] if precedent["entetes"] == etat["entetes"] else \
+        [{'range': _plage_lignes(range_name, 1, 1, largeur), 'values': values[:1]}]
+
+    candidats = []
+    anciens_debut = precedent.get("debut")
+    if anciens_debut is not None:
+        dernier = len(anciens_debut) - 1
+        if 0 < anciennes < nouvelles and etat["debut"][:dernier] == anciens_debut[:dernier] \
+                and _empreinte(donnees[dernier * taille_bloc:anciennes]) == anciens_debut[dernier]:
+            # Ajout pur : les anciennes lignes sont inchangées et de nouvelles lignes suivent
+            candidats.append((nouvelles - anciennes, entetes, donnees[anciennes:], 0))
+        else:
+            bornes = [(numero * taille_bloc, min((numero + 1) * taille_bloc, nouvelles))
+                      for numero, empreinte in enumerate(etat["debut"])
+                      if numero >= len(anciens_debut) or anciens_debut[numero] != empreinte]
+            candidats.append((sum(fin - debut for debut, fin in bornes),
+                              entetes + _blocs(range_name, donnees, bornes, largeur), None, 0))
+
+    anciens_fin = precedent.get("fin")
+    if anciens_fin is not None and decalage_possible and anciennes > 0:
+        bornes = [(max(nouvelles - (numero + 1) * taille_bloc, 0), nouvelles - numero * taille_bloc)
+                  for numero, empreinte in enumerate(etat["fin"])
+                  if numero >= len(anciens_fin) or anciens_fin[numero] != empreinte]
+        bornes.reverse()
+        candidats.append((sum(fin - debut for debut, fin in bornes) + (1 if nouvelles != anciennes else 0),
+                          entetes + _blocs(range_name, donnees, bornes, largeur), None, nouvelles - anciennes))
+
+    if not candidats:
+        # Aucun alignement exploitable : toutes les lignes sont réécrites
+        candidats.append((nouvelles, entetes + _blocs(range_name, donnees, _bornes(0, nouvelles, taille_bloc), largeur),
+                          None, 0))
+
+    _, mises_a_jour, ajout, decalage = min(candidats, key=lambda candidat: candidat[0])
+    if anciennes + decalage > nouvelles:
+        plage_a_effacer = _plage_lignes(range_name, nouvelles + 2, anciennes + decalage + 1, precedent["largeur"])
+    return mises_a_jour, ajout, plage_a_effacer, decalage, etat
+
+def decouper_en_requetes(mises_a_jour, cellules_max=CELLULES_MAX_PAR_REQUETE):
+    """Regroupe les blocs modifiés en lots ne dépassant pas `cellules_max` cellules."""
+    lots, lot, cellules = [], [], 0
+    for mise_a_jour in mises_a_jour:
+        taille = sum(len(ligne) for ligne in mise_a_jour['values'])
+        if lot and cellules + taille > cellules_max:
+            lots.append(lot)
+            lot, cellules = [], 0
+        lot.append(mise_a_jour)
+        cellules += taille
+    if lot:
+        lots.append(lot)
+    return lots
+
+def _empreintes_connues(empreintes, cle):
+    """Empreintes mémorisées d'une plage, ou None si absentes ou d'un ancien format."""
+    precedent = empreintes.get(cle)
+    if precedent is None or precedent.get("version") != VERSION_EMPREINTES:
+        return None
+    return precedent
+
+@instrumenter("write_sheet")
+def write_sheets_diff(service, spreadsheet_id, sorties, taille_bloc=TAILLE_BLOC, lire_si_inconnu=True):
+    """Écrit plusieurs DataFrames en n'envoyant que les blocs de lignes modifiés.
+
+    `sorties` est un dictionnaire {plage: DataFrame}. Les lignes à insérer ou à
+    supprimer en tête de table (voir planifier_ecriture) le sont en un appel
+    spreadsheets().batchUpdate, les blocs modifiés de toutes les plages sont
+    regroupés dans des appels batchUpdate de taille bornée, les ajouts purs passent
+    par values().append et les lignes devenues superflues sont effacées. Une sortie
+    identique à la précédente ne génère aucun appel. Les empreintes de toutes
+    les plages sont oubliées avant le premier appel d'écriture et les nouvelles
+    enregistrées après le dernier (voir oublier_avant_ecriture).
+    Retourne le nombre d'appels à l'API effectués.
+    """
+    empreintes = charger_etat(EMPREINTES_FILE, defaut={})
+    valeurs = service.spreadsheets().values()
+    mises_a_jour, ajouts, effacements, decalages = [], [], [], []
+    nouvelles = {}
+
+    for range_name, data_frame in sorties.items():
+        cle = _cle(spreadsheet_id, range_name)
+        precedent = _empreintes_connues(empreintes, cle)
+        if precedent is None and lire_si_inconnu:
+            precedent = lire_empreintes_distantes(service, spreadsheet_id, range_name, taille_bloc)
+        values = dataframe_to_values(data_frame)
+        blocs, ajout, effacement, decalage, nouvelles[cle] = planifier_ecriture(range_name, values, precedent, taille_bloc)
+        sheet_id = identifiant_onglet(service, spreadsheet_id, _feuille(range_name)) if decalage else None
+        if decalage and sheet_id is None:
+            # Onglet introuvable : pas d'insertion possible, les blocs sont alignés sur le début
+            blocs, ajout, effacement, decalage, nouvelles[cle] = planifier_ecriture(
+                range_name, values, precedent, taille_bloc, decalage_possible=False)
+        mises_a_jour.extend(blocs)
+        if ajout:
+            ajouts.append((range_name, ajout))
+        if effacement:
+            effacements.append(effacement)
+        if decalage > 0:
+            decalages.append(_requete_lignes("insertDimension", sheet_id, 1, 1 + decalage))
+        elif decalage < 0:
+            decalages.append(_requete_lignes("deleteDimension", sheet_id, 1, 1 - decalage))
+
+    oublier_avant_ecriture(empreintes, spreadsheet_id, sorties)
+    appels = 0
+    if decalages:
+        executer(service.spreadsheets().batchUpdate(spreadsheetId=spreadsheet_id, body={'requests': decalages}),
+                 "ecriture")
+        appels += 1
+    if effacements:
+        executer(valeurs.batchClear(spreadsheetId=spreadsheet_id, body={'ranges': effacements}), "ecriture")
+        appels += 1
+    for lot in decouper_en_requetes(mises_a_jour):
+        executer(valeurs.batchUpdate(spreadsheetId=spreadsheet_id, body={'valueInputOption': "RAW", 'data': lot}), "ecriture")
+        appels += 1
+    for range_name, lignes in ajouts:
+        executer(valeurs.append(spreadsheetId=spreadsheet_id, range=range_name, valueInputOption="RAW",
+                                insertDataOption="INSERT_ROWS", body={'values': lignes}), "ecriture")
+        appels += 1
+
+    empreintes.update(nouvelles)
+    sauver_etat(EMPREINTES_FILE, empreintes)
+    if appels:
+        print(f"{len(mises_a_jour)} bloc(s) modifié(s), {len(decalages)} décalage(s), {len(ajouts)} ajout(s) : "
+              f"{appels} appel(s) à l'API")
+    else:
+        print("Aucune modification à écrire.")
+    return appels
+
+def write_sheet_diff(service, spreadsheet_id, range_name, data_frame, taille_bloc=TAILLE_BLOC):
+    """Équivalent différentiel de write_sheet pour une seule plage."""
+    return write_sheets_diff(service, spreadsheet_id, {range_name: data_frame}, taille_bloc)
+
+@instrumenter("append_sheet")
+def append_sheet_diff(service, spreadsheet_id, range_name, data_frame, taille_bloc=TAILLE_BLOC):
+    """Ajoute des lignes en fin de plage et met à jour les empreintes mémorisées."""
+    lignes = dataframe_to_values(data_frame)[1:]
+    if not lignes:
+        return 0
+    empreintes = charger_etat(EMPREINTES_FILE, defaut={})
+    cle = _cle(spreadsheet_id, range_name)
+    precedent = _empreintes_connues(empreintes, cle)
+    oublier_avant_ecriture(empreintes, spreadsheet_id, [range_name])
+    executer(service.spreadsheets().values().append(
+        spreadsheetId=spreadsheet_id, range=range_name, valueInputOption="RAW",
+        insertDataOption="INSERT_ROWS", body={'values': lignes}
+    ), "ecriture")
+
+    # Les lignes déjà écrites ne sont pas conservées localement : les blocs comptés
+    # depuis le début ne peuvent être prolongés que si le dernier était complet, et
+    # ceux comptés depuis la fin sont tous décalés. Sans blocs prolongeables, les
+    # empreintes sont oubliées et seront relues depuis la feuille à la prochaine écriture.
+    if precedent is not None and precedent["taille_bloc"] == taille_bloc and precedent.get("debut") is not None \
+            and precedent["lignes"] > 1 and (precedent["lignes"] - 1) % taille_bloc == 0:
+        empreintes[cle] = dict(precedent, lignes=precedent["lignes"] + len(lignes),
+                               debut=precedent["debut"] + empreintes_debut(lignes, taille_bloc), fin=None)
+    sauver_etat(EMPREINTES_FILE, empreintes)
+    print(f"{len(lignes)} ligne(s) ajoutée(s) dans la plage : {range_name}")
+    return 1
+
+# Valeur int64 d'une date manquante (NaT)
+_NAT = np.iinfo(np.int64).min
+
+def _dates(valeurs):
+    """Dates en nanosecondes (int64, NaT -> valeur minimale) de cellules lues dans la feuille ou de valeurs à écrire."""
+    dates = pd.to_datetime(pd.Series(valeurs, dtype=object), errors='coerce', format="mixed")
+    return dates.to_numpy(dtype="datetime64[ns]").view("int64")
+
+@instrumenter("insert_sheet")
+def insert_sheet_sorted(service, spreadsheet_id, range_name, data_frame, colonne_date, taille_bloc=TAILLE_BLOC):
+    """Insère des lignes à leur place dans une plage triée par date décroissante (lignes sans date en fin).
+
+    La table écrite reste identique à une reconstruction complète : à date égale,
+    les nouvelles lignes suivent les anciennes. Cas courant, toutes les nouvelles
+    lignes sont plus récentes que la première ligne de la feuille et sont insérées
+    en tête ; sinon (données tardives) la colonne de date est lue pour placer
+    chaque groupe de lignes. Les lignes sont insérées (insertDimension) en un appel
+    puis écrites en un appel ; les lignes sans date sont ajoutées en fin de plage.
+    Les empreintes comptées depuis la fin sont prolongées lorsque c'est possible.
+    """
+    lignes = dataframe_to_values(data_frame)[1:]
+    if not lignes:
+        return 0
+    feuille = _feuille(range_name)
+    debut_colonnes = ''.join(c for c in range_name.split('!')[1].split(':')[0] if c.isalpha())
+    lettre = _lettre_colonne(_indice_colonne(debut_colonnes) + data_frame.columns.get_loc(colonne_date))
+    valeurs = service.spreadsheets().values()
+
+    nouvelles = _dates(data_frame[colonne_date].tolist())
+    datees = nouvelles != _NAT
+    premiere = executer(valeurs.get(spreadsheetId=spreadsheet_id, range=f"{feuille}!{lettre}2:{lettre}2",
+                                    valueRenderOption="UNFORMATTED_VALUE")).get("values", [])
+    tete = _dates([premiere[0][0]])[0] if premiere and premiere[0] else _NAT
+    if datees.any() and tete != _NAT and nouvelles[datees].min() > tete:
+        positions = np.zeros(int(datees.sum()), dtype=np.int64)
+    elif datees.any():
+        colonne = executer(valeurs.get(spreadsheetId=spreadsheet_id, range=f"{feuille}!{lettre}2:{lettre}",
+                                       valueRenderOption="UNFORMATTED_VALUE")).get("values", [])
+        existantes = _dates([ligne[0] if ligne else "" for ligne in colonne])
+        # Les lignes sans date sont en fin de table : elles ne comptent pas parmi les positions
+        datees_existantes = existantes[existantes != _NAT]
+        # Position d'une nouvelle ligne = nombre de lignes existantes de date supérieure ou égale
+        positions = np.searchsorted(np.sort(-datees_existantes), -nouvelles[datees], side='right')
+    else:
+        positions = np.zeros(0, dtype=np.int64)
+
+    a_inserer = [ligne for ligne, datee in zip(lignes, datees) if datee]
+    sans_date = [ligne for ligne, datee in zip(lignes, datees) if not datee]
+    ordre = np.argsort(positions, kind="stable")
+    groupes, requetes, decalage = [], [], 0
+    valeurs_positions, debuts, tailles = np.unique(positions[ordre], return_index=True, return_counts=True)
+    for position, debut, taille in zip(valeurs_positions.tolist(), debuts.tolist(), tailles.tolist()):
+        # Ligne 1 = en-têtes : la position p correspond à l'indice de ligne 1 + p (0-indexé), avant insertion
+        premiere_ligne = 1 + position + decalage
+        groupes.append({'range': _plage_lignes(range_name, premiere_ligne + 1, premiere_ligne + taille, len(lignes[0])),
+                        'values': [a_inserer[i] for i in ordre[debut:debut + taille]]})
+        requetes.append(_requete_lignes("insertDimension", None, 1 + position, 1 + position + taille))
+        decalage += taille
+
+    empreintes = charger_etat(EMPREINTES_FILE, defaut={})
+    cle = _cle(spreadsheet_id, range_name)
+    precedent = _empreintes_connues(empreintes, cle)
+    oublier_avant_ecriture(empreintes, spreadsheet_id, [range_name])
+    appels = 0
+    if requetes:
+        sheet_id = identifiant_onglet(service, spreadsheet_id, feuille)
+        # Insertions de la plus basse à la plus haute : les positions des suivantes restent valables
+        for requete in requetes:
+            requete["insertDimension"]["range"]["sheetId"] = sheet_id
+        executer(service.spreadsheets().batchUpdate(spreadsheetId=spreadsheet_id,
+                                                    body={'requests': requetes[::-1]}), "ecriture")
+        for lot in decouper_en_requetes(groupes):
+            executer(valeurs.batchUpdate(spreadsheetId=spreadsheet_id, body={'valueInputOption': "RAW", 'data': lot}),
+                     "ecriture")
+            appels += 1
+        appels += 1
+    if sans_date:
+        executer(valeurs.append(spreadsheetId=spreadsheet_id, range=range_name, valueInputOption="RAW",
+                                insertDataOption="INSERT_ROWS", body={'values': sans_date}), "ecriture")
+        appels += 1
+
+    # Lignes toutes insérées en tête d'une table dont le bloc le plus haut était complet :
+    # les blocs comptés depuis la fin restent valables et sont prolongés. Sinon, oubliées.
+    if precedent is not None and precedent["taille_bloc"] == taille_bloc and precedent.get("fin") is not None \
+            and not sans_date and valeurs_positions.tolist() == [0] and (precedent["lignes"] - 1) % taille_bloc == 0:
+        empreintes[cle] = dict(precedent, lignes=precedent["lignes"] + len(lignes),
+                               fin=precedent["fin"] + empreintes_fin(a_inserer, taille_bloc), debut=None)
+    sauver_etat(EMPREINTES_FILE, empreintes)
+    print(f"{len(lignes)} ligne(s) insérée(s) dans la plage : {range_name} ({len(groupes)} position(s))")
+    return appels
+
+def oublier_avant_ecriture(empreintes, spreadsheet_id, plages):
+    """Retire des `empreintes` celles des `plages` du classeur et enregistre l'état, avant le premier appel d'écriture.
+
+    Une écriture interrompue (erreur d'un appel après un décalage ou un premier
+    lot) laisse la feuille dans un état inconnu : sans empreintes, elle sera
+    relue (voir lire_empreintes_distantes) au lieu d'être comparée à son ancien
+    contenu, et un même décalage ne sera pas appliqué deux fois.
+    """
+    if any([empreintes.pop(_cle(spreadsheet_id, plage), None) is not None for plage in plages]):
+        sauver_etat(EMPREINTES_FILE, empreintes)
+
+def oublier_empreintes(spreadsheet_id, range_name):
+    """Oublie les empreintes d'une plage écrite par un autre moyen (elles seront relues au besoin)."""
+    empreintes = charger_etat(EMPREINTES_FILE, defaut={})
+    if empreintes.pop(_cle(spreadsheet_id, range_name), None) is not None:
+        sauver_etat(EMPREINTES_FILE, empreintes)
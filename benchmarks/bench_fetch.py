@@ -0,0 +1,75 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+from google.auth.credentials import AnonymousCredentials
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from JointureFetch import FabriqueClients, get_values, get_values_concurrent
+
+class FauxSheets(BaseHTTPRequestHandler):
+    """Serveur local imitant GET /v4/spreadsheets/{id}/values/{plage} avec une latence fixe."""
+
+    protocol_version = "HTTP/1.1"  # connexions persistantes (keep-alive)
+    disable_nagle_algorithm = True
+    latence = 0.05
+    lignes = 200
+    connexions = set()
+    verrou = threading.Lock()
+
+    def do_GET(self):
+        with self.verrou:
+            self.connexions.add(self.client_address)
+        time.sleep(self.latence)
+        plage = unquote(urlparse(self.path).path.rsplit("/", 1)[-1])
+        values = [["deviceID", "date", "Montant"]] + [[f"K{i % 50}", "2026-10-01", str(i)] for i in range(self.lignes)]
+        corps = json.dumps({"range": plage, "values": values}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(corps)))
+        self.end_headers()
+        self.wfile.write(corps)
+
+    def log_message(self, *args):
+        pass
+
+def mesurer(nom, fonction):
+    FauxSheets.connexions.clear()
+    debut = time.perf_counter()
+    fonction()
+    duree = time.perf_counter() - debut
+    print(f"{nom:<32} {duree:6.2f} s  ({len(FauxSheets.connexions)} connexion(s) TCP)")
+    return duree
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare lectures séquentielles et concurrentes contre un faux serveur Sheets local.")
+    parser.add_argument("--plages", type=int, default=12, help="Nombre de plages lues")
+    parser.add_argument("--workers", type=int, default=4, help="Nombre de lectures simultanées")
+    parser.add_argument("--latence", type=float, default=0.05, help="Latence simulée par requête (secondes)")
+    args = parser.parse_args()
+
+    FauxSheets.latence = args.latence
+    serveur = ThreadingHTTPServer(("127.0.0.1", 0), FauxSheets)
+    threading.Thread(target=serveur.serve_forever, daemon=True).start()
+    fabrique = FabriqueClients(AnonymousCredentials(), api_endpoint=f"http://127.0.0.1:{serveur.server_port}/",
+                               max_workers=args.workers)
+    plages = [f"kdata!A{1 + i * 1000}:J{(i + 1) * 1000}" for i in range(args.plages)]
+
+    try:
+        # Premier passage : création des clients de chaque thread (document de découverte compris)
+        mesurer("Concurrent, premier appel", lambda: get_values_concurrent(fabrique, "faux", plages))
+        get_values(fabrique, "faux", plages[0])
+        sequentiel = mesurer("Séquentiel (un seul client)", lambda: [get_values(fabrique, "faux", p) for p in plages])
+        concurrent = mesurer(f"Concurrent ({args.workers} threads)", lambda: get_values_concurrent(fabrique, "faux", plages))
+        print(f"Accélération : x{sequentiel / concurrent:.1f}")
+    finally:
+        fabrique.fermer()
+        serveur.shutdown()
+
+if __name__ == "__main__":
+    main()
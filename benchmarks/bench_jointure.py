@@ -0,0 +1,470 @@
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+import JointurePipeline
+from JointureAssociationKiosque import generate_kiosque_table
+from JointureAssociationOperation import create_operations_table
+from JointureAssociationSysteme import generate_systeme_table_from_kdata
+from JointureAssociationUtilisateur import generate_utilisateur_table
+from JointureColonnes import colonnes_vers_dataframe
+from JointureConsultation import CONSULTATION_DIR, charger_instantane
+from JointureDoublons import dedoublonner
+from JointureMoteur import utiliser_moteur
+from JointureParquet import PARQUET_DISPONIBLE, configurer_puits, deposer, lire_table
+from JointureParallele import PARTITIONS_PAR_PROCESSUS, configurer_parallele, ordre_fusion, partitions_kdata
+from JointurePipeline import values_to_dataframe
+from JointureSchema import nom_feuille, typer_plage
+from JointureScheduler import configurer
+from JointureStreaming import run_streaming
+from JointureWriter import dataframe_to_values
+from donnees_synthetiques import generer_classeur
+from service_factice import ServiceFactice, transposer
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline_jointure.json")
+
+TAILLES = [10_000, 100_000, 1_000_000, 10_000_000]
+
+# Transformations disponibles sur les autres moteurs de calcul (voir JointureMoteur)
+ETAPES_MOTEUR = ["create_operations_table", "generate_utilisateur_table", "generate_kiosque_table"]
+
+SOURCE = "https://docs.google.com/spreadsheets/d/source-banc/edit"
+DESTINATION = "https://docs.google.com/spreadsheets/d/destination-banc/edit"
+
+# Quotas sans effet sur le service factice (le planificateur ne doit pas ralentir le banc)
+QUOTAS_ILLIMITES = "lecture_utilisateur=1000000000,lecture_projet=1000000000," \
+                   "ecriture_utilisateur=1000000000,ecriture_projet=1000000000"
+
+# Taille maximale de kdata pour la vérification de main() incrémental : deux classeurs
+# destination et deux exécutions complètes coexistent (plus de 6 Go à 1 000 000 lignes)
+INCREMENT_MAX = 100_000
+
+# Écarts absolus en dessous desquels une différence est considérée comme du bruit de mesure
+ECART_MIN_DUREE = 0.05              # secondes
+ECART_MIN_MEMOIRE = 16 * 1024 ** 2  # octets
+
+# Période d'échantillonnage de la mémoire résidente
+PERIODE_ECHANTILLON = 0.005  # secondes
+
+def memoire_residente():
+    """Mémoire résidente du processus en octets (Linux : /proc/self/statm)."""
+    with open("/proc/self/statm", "r") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+def mesurer(fonction):
+    """Exécute `fonction` et retourne (résultat, durée en s, pic de mémoire en octets).
+
+    Le pic est l'augmentation maximale de la mémoire résidente pendant l'appel,
+    relevée par un thread d'échantillonnage : contrairement à tracemalloc, la
+    mesure ne ralentit pas le code mesuré et compte aussi les tampons numpy/Arrow.
+    """
+    initiale = memoire_residente()
+    pic = [initiale]
+    fin = threading.Event()
+
+    def echantillonner():
+        while not fin.wait(PERIODE_ECHANTILLON):
+            pic[0] = max(pic[0], memoire_residente())
+
+    echantillonneur = threading.Thread(target=echantillonner, daemon=True)
+    echantillonneur.start()
+    debut = time.perf_counter()
+    try:
+        resultat = fonction()
+    finally:
+        duree = time.perf_counter() - debut
+        fin.set()
+        echantillonneur.join()
+    return resultat, duree, max(pic[0], memoire_residente()) - initiale
+
+def onglets_attendus():
+    """Onglets que main() doit écrire dans le classeur destination (mode « complet », sans onglets mensuels)."""
+    plages = [range_name for range_name in JointurePipeline.DEPENDANCES if range_name != JointurePipeline.PLAGE_TRANSITIONS]
+    return sorted(nom_feuille(range_name) for range_name in plages)
+
+def executer_main(service, *options):
+    """Lance JointurePipeline.main() contre le service factice, dans le dossier courant, avec ses `options` en plus."""
+    authentifier, drive = JointurePipeline.authenticate_google_sheets, JointurePipeline.authenticate_drive
+    argv = sys.argv
+    JointurePipeline.authenticate_google_sheets = lambda: service
+    JointurePipeline.authenticate_drive = lambda: None
+    sys.argv = ["JointurePipeline.py", "--source", SOURCE, "--destination", DESTINATION, "--quotas", QUOTAS_ILLIMITES,
+                *options]
+    try:
+        JointurePipeline.main()
+    finally:
+        JointurePipeline.authenticate_google_sheets, JointurePipeline.authenticate_drive = authentifier, drive
+        sys.argv = argv
+
+def dans_dossier(dossier, fonction):
+    """Exécute `fonction` dans le sous-dossier `dossier` du dossier courant (état .jointure_etat distinct)."""
+    repertoire = os.getcwd()
+    os.makedirs(dossier, exist_ok=True)
+    os.chdir(dossier)
+    try:
+        return fonction()
+    finally:
+        os.chdir(repertoire)
+
+def feuilles_ecrites(service, spreadsheet_id):
+    """Contenu des onglets d'un classeur du service factice, sans les lignes effacées."""
+    return {nom: [ligne for ligne in feuille if any(cellule != "" for cellule in ligne)]
+            for nom, feuille in service.classeurs.get(spreadsheet_id, {}).items()}
+
+def consultation_publiee(dossier):
+    """Instantané de consultation publié sous `dossier`, lignes triées (l'ordre des segments est indifférent)."""
+    instantane = charger_instantane(os.path.join(dossier, CONSULTATION_DIR)) or {}
+    return {table: sorted(map(repr, dataframe_to_values(instantane[table])[1:])) if table in instantane else None
+            for table in ("utilisateur", "kiosques")}
+
+def mesurer_increment(classeur):
+    """Mesure main() en incrémental (lignes ajoutées, puis dimension modifiée) et vérifie chaque résultat.
+
+    main() écrit d'abord les trois premiers quarts de kdata ; le dernier quart est
+    ajouté (lignes tardives et doublons compris : insertion triée, ajout en fin,
+    index des doublons), puis un nom de carte est modifié (reconstruction des seules
+    tables jointes). Après chaque étape, les onglets écrits et l'instantané de
+    consultation publié doivent être ceux d'un main() complet sur le même classeur,
+    lancé avec un état vide : un écart compte comme une régression.
+    """
+    entete, lignes = classeur["kdata"][0], classeur["kdata"][1:]
+    coupure = len(lignes) * 3 // 4
+    source = dict(classeur, kdata=[entete] + lignes[:coupure])
+    service = ServiceFactice({"source-banc": source})
+    dans_dossier("increment", lambda: executer_main(service, "--consultation"))
+    resultats = {}
+    for numero, nom in enumerate(("main (ajout de lignes)", "main (dimension modifiée)")):
+        if numero == 0:
+            source["kdata"] = source["kdata"] + lignes[coupure:]
+        else:
+            carte = list(source["liste_cartes"][1])
+            carte[source["liste_cartes"][0].index("noms")] += " (modifié)"
+            source["liste_cartes"] = [source["liste_cartes"][0], carte] + source["liste_cartes"][2:]
+        service.appels.clear()
+        _, duree, pic = mesurer(lambda: dans_dossier("increment", lambda: executer_main(service, "--consultation")))
+
+        complet = ServiceFactice({"source-banc": dict(source)})
+        dans_dossier(f"complet_{numero}", lambda: executer_main(complet, "--consultation"))
+        attendues, obtenues = feuilles_ecrites(complet, "destination-banc"), feuilles_ecrites(service, "destination-banc")
+        identique = True
+        for onglet in sorted(set(attendues) | set(obtenues)):
+            if attendues.get(onglet) != obtenues.get(onglet):
+                print(f"{onglet} [{nom}] diffère d'un main() complet "
+                      f"({len(obtenues.get(onglet, []))} ligne(s) au lieu de {len(attendues.get(onglet, []))}).")
+                identique = False
+        publiee = consultation_publiee("increment")
+        for table, attendu in consultation_publiee(f"complet_{numero}").items():
+            if publiee[table] != attendu:
+                print(f"Consultation '{table}' [{nom}] diffère d'un main() complet.")
+                identique = False
+        resultats[nom] = {"duree": round(duree, 4), "memoire_max": pic, "appels": service.total_appels(),
+                          "detail_appels": dict(service.appels), "identique": identique}
+    return resultats
+
+def mesurer_lecture(values, range_name):
+    """Mesure la conversion d'une réponse values().get en DataFrame typé, lue par lignes puis par colonnes.
+
+    Les deux réponses sont sérialisées en JSON au préalable : chaque mesure comprend
+    le décodage, comme à la réception de la réponse HTTP. Un écart entre les deux
+    DataFrames compte comme une régression.
+    """
+    par_lignes = json.dumps({"range": range_name, "majorDimension": "ROWS", "values": values})
+    par_colonnes = json.dumps({"range": range_name, "majorDimension": "COLUMNS", "values": transposer(values)})
+    reference, duree, pic = mesurer(lambda: typer_plage(values_to_dataframe(json.loads(par_lignes)["values"]), range_name))
+    resultats = {"lecture kdata (lignes)": {"duree": round(duree, 4), "memoire_max": pic, "appels": 0,
+                                             "lignes": len(reference)}}
+    del par_lignes
+    table, duree, pic = mesurer(lambda: colonnes_vers_dataframe(json.loads(par_colonnes)["values"], range_name))
+    try:
+        pd.testing.assert_frame_equal(table, reference)
+        identique = True
+    except AssertionError as e:
+        print(f"lecture kdata (colonnes) diffère de la lecture par lignes : {e}")
+        identique = False
+    resultats["lecture kdata (colonnes)"] = {"duree": round(duree, 4), "memoire_max": pic, "appels": 0,
+                                             "lignes": len(table), "identique": identique}
+    # Les millions d'objets du décodage ne doivent pas déclencher le ramasse-miettes pendant l'étape suivante
+    del par_colonnes, reference, table
+    gc.collect()
+    return resultats
+
+def mesurer_tri_final(tables, kdata, processus):
+    """Mesure le tri final des tables calculées partition par partition : tri de toute la table en série,
+    puis fusion des partitions déjà triées par les processus de calcul (voir JointureParallele.ordre_fusion).
+
+    Seules les tables qui conservent l'index de kdata sont mesurées : leur index
+    redonne l'ordre de kdata. Un écart entre les deux ordres compte comme une régression.
+    """
+    partitions = partitions_kdata(kdata, processus * PARTITIONS_PAR_PROCESSUS)
+    a_trier = {}
+    for range_name, (_, _, conserve_index) in JointurePipeline.TACHES_PARALLELES.items():
+        if conserve_index and range_name in tables:
+            dans_ordre = tables[range_name].sort_index()
+            colonne = JointurePipeline.COLONNES_DATE[range_name]
+            morceaux = pd.concat([dans_ordre.loc[positions].sort_values(by=colonne, ascending=False, kind="stable")
+                                  for positions in partitions])
+            a_trier[range_name] = (dans_ordre, morceaux, colonne)
+
+    series, duree_serie, pic_serie = mesurer(lambda: {
+        range_name: dans_ordre.sort_values(by=colonne, ascending=False, kind="stable")
+        for range_name, (dans_ordre, _, colonne) in a_trier.items()})
+    fusions, duree_fusion, pic_fusion = mesurer(lambda: {
+        range_name: morceaux.iloc[ordre_fusion(morceaux[colonne], morceaux.index.to_numpy())]
+        for range_name, (_, morceaux, colonne) in a_trier.items()})
+    identique = True
+    for range_name in a_trier:
+        try:
+            pd.testing.assert_frame_equal(fusions[range_name], series[range_name])
+        except AssertionError as e:
+            print(f"{range_name} : la fusion des partitions diffère du tri en série : {e}")
+            identique = False
+    lignes = sum(map(len, series.values()))
+    return {"tri final (série)": {"duree": round(duree_serie, 4), "memoire_max": pic_serie, "appels": 0,
+                                  "lignes": lignes},
+            f"tri final (fusion de {len(partitions)} partitions)": {
+                "duree": round(duree_fusion, 4), "memoire_max": pic_fusion, "appels": 0, "lignes": lignes,
+                "identique": identique}}
+
+def mesurer_streaming(classeur, kdata, kiosque, cartes, taille_page):
+    """Mesure run_streaming (kdata lue par fenêtres de `taille_page` lignes) contre le service factice.
+
+    Chaque table écrite en flux est comparée, telle que relue dans la feuille, à
+    celle de build_all_tables sur toute kdata sans ses doublons, écrite de la même
+    façon : ordre des lignes compris, un écart compte comme une régression.
+    """
+    configurer(JointurePipeline.lire_quotas(QUOTAS_ILLIMITES))
+    service = ServiceFactice({"source-banc": classeur})
+    # Watermark et index des doublons de run_streaming à part : main() repart ensuite d'un état vide
+    _, duree, pic = mesurer(lambda: dans_dossier("flux", lambda: run_streaming(
+        service, "source-banc", "destination-banc", taille_page=taille_page)))
+    references = JointurePipeline.build_all_tables(dedoublonner(kdata, persister=False), kiosque, cartes)
+    temoin = ServiceFactice({})
+    identique = True
+    for range_name in JointurePipeline.COLONNES_DATE:
+        temoin.ecrire("temoin", range_name, dataframe_to_values(references[range_name]))
+        if service.lire("destination-banc", range_name) != temoin.lire("temoin", range_name):
+            print(f"{range_name} [flux, fenêtres de {taille_page}] diffère de build_all_tables.")
+            identique = False
+    return {f"run_streaming [fenêtres de {taille_page}]": {
+        "duree": round(duree, 4), "memoire_max": pic, "appels": service.total_appels(),
+        "lignes": sum(map(len, references.values())), "identique": identique}}
+
+def mesurer_relance_parquet(kdata, kiosque, cartes):
+    """Mesure la reprise de l'entrepôt Parquet après un ajout interrompu, puis vérifie qu'aucune ligne n'est doublée.
+
+    La première moitié de kdata est déposée, puis un quart seulement du lot suivant
+    (exécution interrompue, watermark inchangé) ; le lot est relancé en entier alors
+    que de nouvelles lignes sont arrivées, puis une seconde fois à l'identique. Chaque
+    table relue doit être celle d'un dépôt unique de toute kdata.
+    """
+    moitie, quart = len(kdata) // 2, len(kdata) // 4
+    partitionnees = JointurePipeline.tables_partitionnees()
+    lot = lambda debut, fin: JointurePipeline.build_all_tables(kdata.iloc[debut:fin], kiosque, cartes)
+    try:
+        configurer_puits("parquet", "entrepot_reference")
+        deposer(lot(0, len(kdata)), partitionnees, len(kdata) + 1, reinitialiser=True)
+        configurer_puits("parquet", "entrepot_relance")
+        deposer(lot(0, moitie), partitionnees, moitie + 1, reinitialiser=True)
+        deposer(lot(moitie, moitie + quart), partitionnees, moitie + quart + 1, premiere_ligne=moitie + 2)
+        relance = lot(moitie, len(kdata))
+        _, duree, pic = mesurer(lambda: deposer(relance, partitionnees, len(kdata) + 1, premiere_ligne=moitie + 2))
+        deposer(relance, partitionnees, len(kdata) + 1, premiere_ligne=moitie + 2)
+        identique = True
+        for range_name in partitionnees:
+            try:
+                pd.testing.assert_frame_equal(lire_table(range_name, racine="entrepot_relance"),
+                                              lire_table(range_name, racine="entrepot_reference"), check_dtype=False)
+            except AssertionError as e:
+                print(f"{range_name} : l'entrepôt relancé diffère d'un dépôt unique : {e}")
+                identique = False
+    finally:
+        configurer_puits()
+    return {"deposer (relance après interruption)": {"duree": round(duree, 4), "memoire_max": pic, "appels": 0,
+                                                      "lignes": sum(map(len, relance.values())), "identique": identique}}
+
+def mesurer_taille(lignes, args):
+    """Mesure chaque transformation puis main() complet (premier passage et relance) pour `lignes` lignes de kdata.
+
+    Avec `args.moteurs`, les jointures sont aussi mesurées sur chaque autre moteur et
+    leur résultat comparé à celui de pandas : un écart compte comme une régression.
+    Avec `args.processus`, build_all_tables est mesurée en série puis en parallèle
+    et chaque table comparée de la même façon, ainsi que le tri final de ces tables
+    (tri complet en série, fusion des partitions triées en parallèle). Avec
+    `args.streaming`, run_streaming est mesurée et son résultat comparé à
+    build_all_tables. La reprise de l'entrepôt Parquet après une interruption
+    est vérifiée si pyarrow est installé. La lecture de kdata (décodage de la
+    réponse JSON puis DataFrame typé) est mesurée par lignes et par colonnes.
+    Jusqu'à `args.increment_max` lignes, main() incrémental est comparé à un
+    main() complet (voir mesurer_increment).
+    """
+    classeur = generer_classeur(lignes, args.appareils, args.cartes, args.taux_doublons, args.taux_defaut)
+    resultats = mesurer_lecture(classeur["kdata"], "kdata!A:P")
+    kdata = typer_plage(values_to_dataframe(classeur["kdata"]), "kdata!A:P")
+    kiosque = typer_plage(values_to_dataframe(classeur["liste kiosque"]), "liste kiosque!A:F")
+    cartes = typer_plage(values_to_dataframe(classeur["liste_cartes"]), "liste_cartes!A:D")
+
+    etapes = [
+        ("create_operations_table", lambda: create_operations_table(kdata, kiosque, cartes)),
+        ("generate_systeme_table_from_kdata", lambda: generate_systeme_table_from_kdata(kdata)),
+        ("generate_utilisateur_table", lambda: generate_utilisateur_table(kdata, cartes, kiosque)),
+        ("generate_kiosque_table", lambda: generate_kiosque_table(kdata, kiosque)),
+    ]
+    moteurs = [m for m in args.moteurs.split(',') if m] if args.moteurs else []
+    references = {}
+    repertoire_initial = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="banc_jointure_") as dossier:
+        # Index, watermark, empreintes et instantanés sont écrits dans un dossier jetable
+        os.chdir(dossier)
+        try:
+            for nom, fonction in etapes:
+                table, duree, pic = mesurer(fonction)
+                resultats[nom] = {"duree": round(duree, 4), "memoire_max": pic, "appels": 0, "lignes": len(table)}
+                if moteurs and nom in ETAPES_MOTEUR:
+                    references[nom] = table
+            for moteur in moteurs:
+                with utiliser_moteur(moteur):
+                    for nom, fonction in etapes:
+                        if nom not in ETAPES_MOTEUR:
+                            continue
+                        table, duree, pic = mesurer(fonction)
+                        try:
+                            pd.testing.assert_frame_equal(table, references[nom])
+                            identique = True
+                        except AssertionError as e:
+                            print(f"{nom} [{moteur}] diffère du résultat pandas : {e}")
+                            identique = False
+                        resultats[f"{nom} [{moteur}]"] = {"duree": round(duree, 4), "memoire_max": pic, "appels": 0,
+                                                          "lignes": len(table), "identique": identique}
+            if args.processus > 1:
+                tables_serie, duree, pic = mesurer(lambda: JointurePipeline.build_all_tables(kdata, kiosque, cartes))
+                resultats["build_all_tables"] = {"duree": round(duree, 4), "memoire_max": pic, "appels": 0,
+                                                 "lignes": sum(map(len, tables_serie.values()))}
+                configurer_parallele(args.processus)
+                try:
+                    tables, duree, pic = mesurer(lambda: JointurePipeline.build_all_tables(kdata, kiosque, cartes))
+                finally:
+                    configurer_parallele(1)
+                identique = sorted(tables) == sorted(tables_serie)
+                for range_name in tables_serie:
+                    try:
+                        pd.testing.assert_frame_equal(tables[range_name], tables_serie[range_name])
+                    except (AssertionError, KeyError) as e:
+                        print(f"{range_name} [{args.processus} processus] diffère du calcul en série : {e}")
+                        identique = False
+                resultats[f"build_all_tables [{args.processus} processus]"] = {
+                    "duree": round(duree, 4), "memoire_max": pic, "appels": 0,
+                    "lignes": sum(map(len, tables.values())), "identique": identique}
+                resultats.update(mesurer_tri_final(tables_serie, kdata, args.processus))
+                del tables_serie, tables
+            if args.streaming:
+                resultats.update(mesurer_streaming(classeur, kdata, kiosque, cartes, args.streaming))
+            if PARQUET_DISPONIBLE:
+                resultats.update(mesurer_relance_parquet(kdata, kiosque, cartes))
+            del kdata, kiosque, cartes, references
+
+            if not args.sans_main:
+                service = ServiceFactice({"source-banc": classeur})
+                for nom in ("main", "main (relance)"):
+                    service.appels.clear()
+                    _, duree, pic = mesurer(lambda: executer_main(service))
+                    # Une table non construite (colonne absente, feuille vide) ne fait qu'un message dans main() :
+                    # la mesure porterait sur un pipeline incomplet
+                    manquants = [onglet for onglet in onglets_attendus()
+                                 if onglet not in service.classeurs.get("destination-banc", {})]
+                    if manquants:
+                        raise RuntimeError(f"main() n'a pas écrit le(s) onglet(s) {', '.join(manquants)} : "
+                                           f"mesure interrompue.")
+                    resultats[nom] = {"duree": round(duree, 4), "memoire_max": pic, "appels": service.total_appels(),
+                                      "detail_appels": dict(service.appels)}
+                del service
+                if lignes <= args.increment_max:
+                    resultats.update(mesurer_increment(classeur))
+        finally:
+            os.chdir(repertoire_initial)
+    return resultats
+
+def comparer(resultats, baseline, tolerance):
+    """Affiche chaque mesure et son écart à la référence. Retourne le nombre de régressions."""
+    regressions = 0
+    print(f"\n{'lignes':>10} {'étape':<34} {'durée':>9} {'réf.':>9} {'mémoire':>10} {'réf.':>10} {'appels':>7} {'réf.':>5}")
+    for taille, etapes in resultats.items():
+        for nom, mesure in etapes.items():
+            reference = baseline.get(taille, {}).get(nom)
+            alertes = []
+            if reference is not None:
+                if mesure["duree"] - reference["duree"] > max(reference["duree"] * tolerance, ECART_MIN_DUREE):
+                    alertes.append("durée")
+                if mesure["memoire_max"] - reference["memoire_max"] > max(reference["memoire_max"] * tolerance,
+                                                                          ECART_MIN_MEMOIRE):
+                    alertes.append("mémoire")
+                if mesure["appels"] > reference["appels"]:
+                    alertes.append("appels")
+            if mesure.get("identique") is False:
+                alertes.append("résultat différent de la référence")
+            regressions += bool(alertes)
+            ref = reference or {}
+            print(f"{taille:>10} {nom:<34} {mesure['duree']:8.2f}s {_valeur(ref.get('duree'), '{:8.2f}s'):>9} "
+                  f"{mesure['memoire_max'] / 2**20:8.1f}Mo {_valeur(ref.get('memoire_max'), '{:8.1f}Mo', 2**20):>10} "
+                  f"{mesure['appels']:>7} {_valeur(ref.get('appels'), '{}'):>5}"
+                  + (f"  RÉGRESSION ({', '.join(alertes)})" if alertes else ""))
+    return regressions
+
+def _valeur(valeur, gabarit, diviseur=1):
+    return "-" if valeur is None else gabarit.format(valeur / diviseur if diviseur != 1 else valeur)
+
+def main():
+    parser = argparse.ArgumentParser(description="Mesure les transformations de jointure et main() sur des données synthétiques.")
+    parser.add_argument("--tailles", default="10000,100000",
+                        help=f"Nombres de lignes de kdata, séparés par des virgules (jeu complet : {','.join(map(str, TAILLES))})")
+    parser.add_argument("--appareils", type=int, default=200, help="Nombre de kiosques (deviceID)")
+    parser.add_argument("--cartes", type=int, default=5_000, help="Nombre de cartes (card_UID)")
+    parser.add_argument("--taux-doublons", type=float, default=0.01, help="Part de lignes de kdata dupliquées")
+    parser.add_argument("--taux-defaut", type=float, default=0.05, help="Part d'états de composants à 'NON'")
+    parser.add_argument("--sans-main", action="store_true", help="Ne mesure que les transformations")
+    parser.add_argument("--moteurs", default="", metavar="MOTEUR,...",
+                        help="Mesure aussi les jointures avec ces moteurs (polars, duckdb) et vérifie leur résultat")
+    parser.add_argument("--processus", type=int, default=1, metavar="N",
+                        help="Mesure aussi build_all_tables en N processus et vérifie que le résultat est identique")
+    parser.add_argument("--streaming", type=int, default=0, metavar="LIGNES",
+                        help="Mesure aussi run_streaming par fenêtres de LIGNES lignes et vérifie son résultat (0 : non)")
+    parser.add_argument("--increment-max", type=int, default=INCREMENT_MAX, metavar="LIGNES",
+                        help="Mesure et vérifie main() incrémental jusqu'à LIGNES lignes de kdata (0 : non)")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="Fichier de référence à comparer")
+    parser.add_argument("--enregistrer", action="store_true", help="Remplace la référence par les mesures de cette exécution")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Écart relatif de durée ou de mémoire toléré avant de signaler une régression")
+    args = parser.parse_args()
+
+    resultats = {}
+    for lignes in (int(t) for t in args.tailles.split(',')):
+        print(f"=== {lignes} lignes ===")
+        resultats[str(lignes)] = mesurer_taille(lignes, args)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    regressions = comparer(resultats, baseline.get("resultats", {}), args.tolerance)
+
+    if args.enregistrer:
+        baseline.setdefault("resultats", {}).update(resultats)
+        baseline["parametres"] = {"appareils": args.appareils, "cartes": args.cartes,
+                                  "taux_doublons": args.taux_doublons, "taux_defaut": args.taux_defaut}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, ensure_ascii=False)
+        print(f"\nRéférence enregistrée dans {args.baseline}")
+    elif regressions:
+        print(f"\n{regressions} régression(s) par rapport à la référence (tolérance {args.tolerance:.0%}).")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
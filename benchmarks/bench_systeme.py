@@ -0,0 +1,69 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from JointureAssociationSysteme import generate_systeme_table_from_kdata, COMPOSANTS
+
+def generate_systeme_reference(kdata_df):
+    """Ancienne implémentation ligne par ligne (DataFrame.apply), conservée comme référence."""
+    required_columns = ['deviceID', 'Date', 'Localisation'] + COMPOSANTS
+    systeme_data = kdata_df[required_columns].copy()
+    systeme_data['Date'] = pd.to_datetime(systeme_data['Date'], errors='coerce')
+
+    def evaluate_status(row):
+        if all(row[comp] == 'OK' for comp in COMPOSANTS):
+            return 'Fonctionnel'
+        return 'Défaut'
+
+    systeme_data['État Global'] = systeme_data.apply(evaluate_status, axis=1)
+
+    def generate_comment(row):
+        issues = [comp for comp in COMPOSANTS if row[comp] == 'NON']
+        return ", ".join(issues) if issues else "Aucun problème détecté"
+
+    systeme_data['Commentaires'] = systeme_data.apply(generate_comment, axis=1)
+    return systeme_data.sort_values(by='Date', ascending=False)
+
+def generer_telemetrie(lignes, taux_defaut=0.05, graine=0):
+    """Génère une télémétrie kdata synthétique (états 'OK', 'NON' et quelques cellules vides)."""
+    rng = np.random.default_rng(graine)
+    dates = pd.Timestamp("2025-01-01") + pd.to_timedelta(rng.integers(0, 365 * 24 * 3600, lignes), unit="s")
+    data = {
+        'deviceID': rng.integers(1, 200, lignes).astype(str),
+        'Date': dates.strftime("%Y-%m-%d %H:%M:%S"),
+        'Localisation': "Antananarivo",
+    }
+    etats = np.array(['OK', 'NON', ''], dtype=object)
+    for comp in COMPOSANTS:
+        tirage = rng.random(lignes)
+        data[comp] = etats[(tirage < taux_defaut).astype(int) + (tirage < taux_defaut / 10)]
+    return pd.DataFrame(data)
+
+def mesurer(fonction, kdata_df):
+    debut = time.perf_counter()
+    resultat = fonction(kdata_df)
+    return resultat, time.perf_counter() - debut
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare l'évaluation vectorisée de la table 'Système' à l'ancienne version ligne par ligne.")
+    parser.add_argument("--lignes", type=int, default=1_000_000, help="Nombre de lignes de télémétrie générées")
+    args = parser.parse_args()
+
+    kdata_df = generer_telemetrie(args.lignes)
+    print(f"Télémétrie synthétique : {len(kdata_df)} lignes")
+
+    reference, duree_reference = mesurer(generate_systeme_reference, kdata_df)
+    vectorise, duree_vectorise = mesurer(generate_systeme_table_from_kdata, kdata_df)
+
+    pd.testing.assert_frame_equal(reference, vectorise)
+    print(f"Ligne par ligne (apply) : {duree_reference:.2f} s")
+    print(f"Vectorisé              : {duree_vectorise:.2f} s")
+    print(f"Accélération           : x{duree_reference / duree_vectorise:.1f} (résultats identiques)")
+
+if __name__ == "__main__":
+    main()
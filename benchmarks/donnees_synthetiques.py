@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+
+# Ordre des colonnes des feuilles synthétiques, celui que lit le pipeline
+# (JointurePipeline.PLAGES_SOURCE : "kdata!A:P", "liste kiosque!A:F", "liste_cartes!A:G")
+COLONNES_KDATA = ['date', 'deviceID', 'card_UID', 'Montant', 'dureeDis', 'Volume', 'Date',
+                  'Duree de Fonctionnement', 'Batterie Voltage', 'Localisation',
+                  'EtatSim800L', 'EtatRFID', 'EtatRTC', 'EtatLCD', 'EtatWire', 'EtatDebimetre']
+COLONNES_KIOSQUE = ['deviceID', 'kiosque', 'adresse', 'Localisation', 'Numéro', 'Fonctionnalité']
+COLONNES_CARTES = ['card_UID', 'Noms', 'noms', 'Adresse']
+
+LOCALISATIONS = np.array(["Antananarivo", "Toamasina", "Antsirabe", "Fianarantsoa", "Mahajanga", "Toliara"],
+                         dtype=object)
+
+def _etiquettes(prefixe, nombre):
+    return np.array([f"{prefixe}{i:05d}" for i in range(nombre)], dtype=object)
+
+def _textes(valeurs):
+    """Convertit des entiers en textes, chaque valeur distincte n'étant créée qu'une fois (comme une cellule partagée)."""
+    uniques, codes = np.unique(valeurs, return_inverse=True)
+    return np.array([str(v) for v in uniques], dtype=object)[codes]
+
+def _lignes(colonnes):
+    return [list(ligne) for ligne in zip(*colonnes)]
+
+def generer_classeur(lignes, appareils=200, cartes=5_000, taux_doublons=0.01, taux_defaut=0.05, graine=0):
+    """Génère le contenu brut des feuilles 'kdata', 'liste kiosque' et 'liste_cartes'.
+
+    Retourne {nom de feuille: lignes} au format de l'API values (textes, en-têtes en première ligne).
+      - taux_doublons : part des lignes de kdata recopiées d'une autre ligne (transactions envoyées deux fois)
+      - taux_defaut : part des états de composants à 'NON' (un dixième de cette part donne une cellule vide)
+    Les textes identiques partagent le même objet Python, comme les cellules répétées d'une vraie réponse
+    sérialisée, afin que 10 millions de lignes restent générables.
+    """
+    rng = np.random.default_rng(graine)
+
+    kiosques = _etiquettes("K", appareils)
+    uids = _etiquettes("C", cartes)
+
+    # Transactions : horodatage sur un an, montants par pas de 100 Ar
+    secondes = np.sort(rng.integers(0, 365 * 24 * 3600, lignes))
+    jours, reste = np.divmod(secondes, 24 * 3600)
+    libelles_jours = pd.date_range("2025-01-01", periods=366, freq="D").strftime("%Y-%m-%d").to_numpy(dtype=object)
+    libelles_heures = np.array([f"{h:02d}:{m:02d}:{s:02d}" for h in range(24) for m in range(60) for s in range(60)],
+                               dtype=object)
+    dates = libelles_jours[jours] + " " + libelles_heures[reste]
+
+    appareil = rng.integers(0, appareils, lignes)
+    colonnes = {
+        'date': dates,
+        'deviceID': kiosques[appareil],
+        'card_UID': uids[rng.integers(0, cartes, lignes)],
+        'Montant': _textes(rng.integers(1, 50, lignes) * 100),
+        'dureeDis': _textes(rng.integers(5, 120, lignes)),
+        'Volume': _textes(rng.integers(1, 40, lignes)),
+        'Date': dates,
+        'Duree de Fonctionnement': _textes(rng.integers(0, 10_000, lignes)),
+        'Batterie Voltage': _textes(rng.integers(110, 130, lignes)),
+        'Localisation': LOCALISATIONS[appareil % len(LOCALISATIONS)],
+    }
+    etats = np.array(['OK', 'NON', ''], dtype=object)
+    for composant in COLONNES_KDATA[10:]:
+        tirage = rng.random(lignes)
+        colonnes[composant] = etats[(tirage < taux_defaut).astype(int) + (tirage < taux_defaut / 10)]
+
+    # Doublons : certaines lignes sont la copie exacte d'une ligne déjà présente
+    source = np.arange(lignes)
+    doublons = rng.random(lignes) < taux_doublons
+    source[doublons] = rng.integers(0, lignes, int(doublons.sum()))
+    kdata = _lignes([colonnes[col][source] for col in COLONNES_KDATA])
+
+    kiosque = _lignes([
+        kiosques,
+        np.array([f"Kiosque {i}" for i in range(appareils)], dtype=object),
+        np.array([f"Lot {i % 97}, Quartier {i % 13}" for i in range(appareils)], dtype=object),
+        LOCALISATIONS[np.arange(appareils) % len(LOCALISATIONS)],
+        kiosques,
+        np.array(["Vente", "Recharge"], dtype=object)[np.arange(appareils) % 2],
+    ])
+    noms = np.array([f"Client {i}" for i in range(cartes)], dtype=object)
+    cartes_lignes = _lignes([
+        uids,
+        noms,
+        noms,
+        np.array([f"Rue {i % 500}" for i in range(cartes)], dtype=object),
+    ])
+
+    return {
+        "kdata": [list(COLONNES_KDATA)] + kdata,
+        "liste kiosque": [list(COLONNES_KIOSQUE)] + kiosque,
+        "liste_cartes": [list(COLONNES_CARTES)] + cartes_lignes,
+    }
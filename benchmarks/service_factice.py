@@ -0,0 +1,213 @@
+import re
+import threading
+import time
+from collections import Counter
+
+_PLAGE = re.compile(r"^([A-Z]*)(\d*)(?::([A-Z]*)(\d*))?$")
+
+def _indice_colonne(lettres):
+    indice = 0
+    for lettre in lettres:
+        indice = indice * 26 + (ord(lettre) - ord('A') + 1)
+    return indice
+
+def analyser_plage(range_name):
+    """Décompose une plage A1 en (feuille, première ligne, dernière ligne, première colonne, dernière colonne).
+
+    Indices 0-indexés, bornes de fin exclusives, None pour une borne ouverte.
+    Exemple : "kdata!A121:J" -> ("kdata", 120, None, 0, 10)
+    """
+    feuille, _, cellules = range_name.partition('!')
+    feuille = feuille.strip("'")
+    if not cellules:
+        return feuille, 0, None, 0, None
+    col_debut, ligne_debut, col_fin, ligne_fin = _PLAGE.match(cellules.upper()).groups()
+    if col_fin is None:
+        col_fin, ligne_fin = col_debut, ligne_debut
+    return (feuille,
+            int(ligne_debut) - 1 if ligne_debut else 0,
+            int(ligne_fin) if ligne_fin else None,
+            _indice_colonne(col_debut) - 1 if col_debut else 0,
+            _indice_colonne(col_fin) if col_fin else None)
+
+def _rogner(ligne):
+    fin = len(ligne)
+    while fin and ligne[fin - 1] == "":
+        fin -= 1
+    return ligne[:fin]
+
+def transposer(lignes):
+    """Valeurs d'une plage lues par colonnes (majorDimension="COLUMNS"), à partir de ses lignes.
+
+    Comme l'API : cellules vides de fin de colonne et colonnes vides de fin de plage omises.
+    """
+    largeur = max(map(len, lignes), default=0)
+    colonnes = [_rogner([ligne[j] if j < len(ligne) else "" for ligne in lignes]) for j in range(largeur)]
+    while colonnes and not colonnes[-1]:
+        colonnes.pop()
+    return colonnes
+
+class _Requete:
+    def __init__(self, service, methode, action):
+        self.service = service
+        self.methode = methode
+        self.action = action
+
+    def execute(self):
+        return self.service._executer(self.methode, self.action)
+
+class _Valeurs:
+    """Équivalent en mémoire de service.spreadsheets().values()."""
+
+    def __init__(self, service):
+        self.s = service
+
+    def get(self, spreadsheetId, range, majorDimension="ROWS", **kwargs):
+        return _Requete(self.s, "get", lambda: {"range": range, "majorDimension": majorDimension,
+                                                "values": self.s.lire(spreadsheetId, range, majorDimension)})
+
+    def batchGet(self, spreadsheetId, ranges, majorDimension="ROWS", **kwargs):
+        return _Requete(self.s, "batchGet", lambda: {"valueRanges": [
+            {"range": r, "majorDimension": majorDimension, "values": self.s.lire(spreadsheetId, r, majorDimension)}
+            for r in ranges]})
+
+    def update(self, spreadsheetId, range, body, valueInputOption="RAW", **kwargs):
+        return _Requete(self.s, "update", lambda: self.s.ecrire(spreadsheetId, range, body["values"]))
+
+    def batchUpdate(self, spreadsheetId, body):
+        def action():
+            for element in body["data"]:
+                self.s.ecrire(spreadsheetId, element["range"], element["values"])
+            return {}
+        return _Requete(self.s, "batchUpdate", action)
+
+    def append(self, spreadsheetId, range, body, valueInputOption="RAW", insertDataOption=None, **kwargs):
+        return _Requete(self.s, "append", lambda: self.s.ajouter(spreadsheetId, range, body["values"]))
+
+    def clear(self, spreadsheetId, range, body=None):
+        return _Requete(self.s, "clear", lambda: self.s.effacer(spreadsheetId, range))
+
+    def batchClear(self, spreadsheetId, body):
+        def action():
+            for range_name in body["ranges"]:
+                self.s.effacer(spreadsheetId, range_name)
+            return {}
+        return _Requete(self.s, "batchClear", action)
+
+class _Classeurs:
+    def __init__(self, service):
+        self.s = service
+
+    def values(self):
+        return _Valeurs(self.s)
+
+    def get(self, spreadsheetId, fields=None, **kwargs):
+        return _Requete(self.s, "spreadsheets.get", lambda: {"sheets": [
+            {"properties": {"sheetId": numero, "title": nom}}
+            for numero, nom in enumerate(self.s.classeurs.get(spreadsheetId, {}))]})
+
+    def batchUpdate(self, spreadsheetId, body):
+        def action():
+            reponses = []
+            feuilles = self.s.classeurs.setdefault(spreadsheetId, {})
+            for requete in body["requests"]:
+                if "addSheet" in requete:
+                    titre = requete["addSheet"]["properties"]["title"]
+                    if titre in feuilles:
+                        raise ValueError(f"Invalid requests[0].addSheet: A sheet with the name \"{titre}\" already exists.")
+                    feuilles[titre] = []
+                    reponses.append({"addSheet": {"properties": {"sheetId": len(feuilles) - 1, "title": titre}}})
+                    continue
+                # insertDimension / deleteDimension sur des lignes (sheetId = rang de l'onglet)
+                (action, details), = requete.items()
+                plage = details["range"]
+                lignes = feuilles[list(feuilles)[plage["sheetId"]]]
+                debut, fin = plage["startIndex"], plage["endIndex"]
+                if action == "insertDimension":
+                    if debut < len(lignes):
+                        lignes[debut:debut] = [[] for _ in range(fin - debut)]
+                else:
+                    del lignes[debut:fin]
+                reponses.append({})
+            return {"replies": reponses}
+        return _Requete(self.s, "spreadsheets.batchUpdate", action)
+
+class ServiceFactice:
+    """Service Google Sheets en mémoire pour les bancs d'essai.
+
+    Imite service.spreadsheets().values() (get, batchGet, update, batchUpdate,
+    append, clear, batchClear ; lecture par lignes ou par colonnes), ainsi que
+    spreadsheets().get (titres des onglets) et spreadsheets().batchUpdate (addSheet,
+    insertDimension et deleteDimension sur des lignes),
+    sur des classeurs {id: {feuille: lignes}} et compte les appels effectués par méthode. `latence` ajoute un délai fixe à
+    chaque appel pour simuler le réseau.
+    """
+
+    def __init__(self, classeurs=None, latence=0.0):
+        self.classeurs = classeurs if classeurs is not None else {}
+        self.latence = latence
+        self.appels = Counter()
+        self._verrou = threading.Lock()
+
+    def spreadsheets(self):
+        return _Classeurs(self)
+
+    def _executer(self, methode, action):
+        with self._verrou:
+            self.appels[methode] += 1
+        if self.latence:
+            time.sleep(self.latence)
+        with self._verrou:
+            return action()
+
+    def total_appels(self):
+        return sum(self.appels.values())
+
+    def feuille(self, spreadsheet_id, nom):
+        return self.classeurs.setdefault(spreadsheet_id, {}).setdefault(nom, [])
+
+    def lire(self, spreadsheet_id, range_name, major_dimension="ROWS"):
+        nom, ligne_debut, ligne_fin, col_debut, col_fin = analyser_plage(range_name)
+        lignes = self.feuille(spreadsheet_id, nom)[ligne_debut:ligne_fin]
+        if col_debut or col_fin is not None:
+            lignes = [ligne[col_debut:col_fin] for ligne in lignes]
+        # Comme l'API : cellules vides de fin de ligne et lignes vides de fin de plage omises
+        lignes = [ligne if ligne and ligne[-1] != "" else _rogner(ligne) for ligne in lignes]
+        while lignes and not lignes[-1]:
+            lignes.pop()
+        return transposer(lignes) if major_dimension == "COLUMNS" else lignes
+
+    def ecrire(self, spreadsheet_id, range_name, values):
+        nom, ligne_debut, _, col_debut, _ = analyser_plage(range_name)
+        lignes = self.feuille(spreadsheet_id, nom)
+        for decalage, valeurs in enumerate(values):
+            numero = ligne_debut + decalage
+            if numero >= len(lignes) and col_debut == 0:
+                # Nouvelle ligne en fin de feuille : copiée telle quelle
+                lignes.extend([] for _ in range(numero - len(lignes)))
+                lignes.append(list(valeurs))
+                continue
+            while len(lignes) <= numero:
+                lignes.append([])
+            ligne = lignes[numero]
+            if len(ligne) < col_debut + len(valeurs):
+                ligne.extend([""] * (col_debut + len(valeurs) - len(ligne)))
+            ligne[col_debut:col_debut + len(valeurs)] = valeurs
+        return {"updatedRows": len(values)}
+
+    def ajouter(self, spreadsheet_id, range_name, values):
+        nom, _, _, col_debut, _ = analyser_plage(range_name)
+        lignes = self.feuille(spreadsheet_id, nom)
+        fin = len(lignes)
+        while fin and not any(lignes[fin - 1]):
+            fin -= 1
+        del lignes[fin:]
+        lignes.extend([""] * col_debut + list(valeurs) for valeurs in values)
+        return {"updates": {"updatedRows": len(values)}}
+
+    def effacer(self, spreadsheet_id, range_name):
+        nom, ligne_debut, ligne_fin, col_debut, col_fin = analyser_plage(range_name)
+        for ligne in self.feuille(spreadsheet_id, nom)[ligne_debut:ligne_fin]:
+            fin = len(ligne) if col_fin is None else min(col_fin, len(ligne))
+            ligne[col_debut:fin] = [""] * max(fin - col_debut, 0)
+        return {}